@@ -0,0 +1,120 @@
+#!/usr/bin/python3
+"""
+Benchmark AnomalyHandler on the bundled test log:
+- lead time: how long before each 'lost PLL lock' / 'FIFO overflow' (log time) a warning was raised for the input
+- delay: wall time from a telemetry event entering the dispatcher to its warning reaching a handler
+- throughput: telemetry events/sec through the detector for a fleet replaying the log, and how many devices
+  (2 inputs at 1 sample/sec each) one core keeps up with
+"""
+import argparse
+import sys
+import time
+
+from common import TEST_LOG
+from hdmi2usbmon.anomaly import ANOMALY_EVENT, AnomalyHandler
+from hdmi2usbmon.events import EventDispatcher, EventTypeHandler
+from hdmi2usbmon.parser import DVISAMPLER_EVENT, FIFO_OVERFLOW, PLL_LOCK_LOST, parse_line, parse_log_line
+
+INCIDENTS = (PLL_LOCK_LOST, FIFO_OVERFLOW)
+LOG_YEAR = 2017
+
+
+def load_events(device, path=TEST_LOG):
+    """ :return: events parsed from the log, with the log timestamps """
+    events = list()
+    with open(path, 'rb') as logfile:
+        for line in logfile:
+            parsed = parse_log_line(line, LOG_YEAR)
+            if parsed is not None and parsed[1]:
+                events.append(parse_line(parsed[1], device, parsed[0]))
+    return events
+
+
+def lead_times(events, window):
+    """
+    Replay the log one event at a time
+    :return: (list of (incident time, incident type, input, seconds since the first warning or None),
+              list of warning delays in seconds, number of warnings)
+    """
+    dispatcher = EventDispatcher(indexed=True)
+    detector = AnomalyHandler(dispatcher)
+    dispatcher.add_handler(detector)
+    warnings = list()
+    delays = list()
+    sent = [0.0]
+
+    def warned(event):
+        if event.data['active']:
+            warnings.append(event)
+            delays.append(time.perf_counter() - sent[0])
+    dispatcher.add_handler(EventTypeHandler(warned, ANOMALY_EVENT))
+
+    incidents = list()
+    for event in events:
+        kind = event.event_type[0]
+        if kind in INCIDENTS:
+            data = event.data
+            # a burst of the same message counts once
+            if not incidents or incidents[-1][1:3] != (kind, data['input']) or \
+                    event.timestamp - incidents[-1][0] > window:
+                first = [warning.timestamp for warning in warnings if warning.data['input'] == data['input']
+                         and event.timestamp - window <= warning.timestamp <= event.timestamp]
+                incidents.append((event.timestamp, kind, data['input'],
+                                  event.timestamp - first[0] if first else None))
+        sent[0] = time.perf_counter()
+        dispatcher.send_event(event)
+        while dispatcher.dispatch_batch().events:
+            pass
+    return incidents, delays, detector.warnings
+
+
+def throughput(events, devices, batch_size):
+    """ :return: (telemetry events, seconds) for devices replaying the log interleaved """
+    fleet = [load_events('bench%d' % index) for index in range(devices)] if devices > 1 else [events]
+    stream = [event for group in zip(*fleet) for event in group if event.event_type[0] == DVISAMPLER_EVENT]
+    dispatcher = EventDispatcher(indexed=True)
+    dispatcher.add_handler(AnomalyHandler(dispatcher))
+    dispatcher.add_handler(EventTypeHandler(lambda event: None, ANOMALY_EVENT))
+    send_event = dispatcher.send_event
+    start = time.perf_counter()
+    for offset in range(0, len(stream), batch_size):
+        for event in stream[offset:offset + batch_size]:
+            send_event(event)
+        while dispatcher.dispatch_batch(batch_size * 2).events:
+            pass
+    return len(stream), time.perf_counter() - start
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def main(*argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-d', '--devices', type=int, default=30, help='devices replaying the log for throughput')
+    parser.add_argument('-w', '--window', type=float, default=60.0,
+                        help='seconds before an incident a warning counts as an early warning')
+    parser.add_argument('-b', '--batch-size', type=int, default=4096)
+    args = parser.parse_args(argv)
+
+    events = load_events('bench')
+    incidents, delays, warnings = lead_times(events, args.window)
+    print('{:>10} {:>15} {:>6} {:>10}'.format('time', 'incident', 'input', 'lead (s)'))
+    for timestamp, kind, input, lead in incidents:
+        print('{:>10} {:>15} {:>6} {:>10}'.format(time.strftime('%H:%M:%S', time.localtime(timestamp)), kind, input,
+                                                  '-' if lead is None else '{:.0f}'.format(lead)))
+    warned = [lead for _, _, _, lead in incidents if lead is not None]
+    print('incidents warned: {}/{}, warnings raised: {}'.format(len(warned), len(incidents), warnings))
+    print('warning delay: p50 {:.1f} us, p99 {:.1f} us'.format(percentile(delays, 0.5) * 1e6,
+                                                            percentile(delays, 0.99) * 1e6))
+
+    count, elapsed = throughput(events, args.devices, args.batch_size)
+    print('throughput: {} devices, {} samples in {:.3f} s, {:.0f} samples/sec, {:.0f} devices per core'.format(
+        args.devices, count, elapsed, count / elapsed, count / elapsed / 2))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
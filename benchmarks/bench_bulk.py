@@ -0,0 +1,68 @@
+#!/usr/bin/python3
+"""
+Benchmark bulk log loading: hdmi2usbmon.bulk (NumPy) against line-by-line parsing of the test log,
+and load_logs scaling across a process pool on copies of the test log.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from common import TEST_LOG
+from hdmi2usbmon import bulk
+from hdmi2usbmon.parser import parse_dvisampler, parse_log_line
+
+
+def scalar_load(path, year):
+    telemetry, others = list(), list()
+    with open(path, 'rb') as logfile:
+        for line in logfile:
+            parsed = parse_log_line(line, year)
+            if parsed is not None:
+                record = parse_dvisampler(parsed[1])
+                if record is None:
+                    others.append(parsed)
+                else:
+                    telemetry.append((parsed[0], record))
+    return telemetry, others
+
+
+def best_of(rounds, func, *args):
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(*argv):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-r', '--rounds', type=int, default=5)
+    parser.add_argument('-f', '--files', type=int, default=32, help="copies of the test log for the pool benchmark")
+    parser.add_argument('-w', '--workers', type=int, nargs='+', default=None)
+    args = parser.parse_args(argv)
+    lines = sum(1 for _ in open(TEST_LOG, 'rb'))
+    for name, func in (('line by line', scalar_load), ('bulk.load_log', bulk.load_log)):
+        elapsed = best_of(args.rounds, func, TEST_LOG, 2017)
+        print('{:<16} {:>8.2f} ms {:>12.0f} lines/sec'.format(name, elapsed * 1000, lines / elapsed))
+    tmpdir = tempfile.mkdtemp()
+    try:
+        paths = list()
+        for index in range(args.files):
+            paths.append(os.path.join(tmpdir, 'hdmi2usb.{:04d}'.format(index)))
+            shutil.copyfile(TEST_LOG, paths[-1])
+        workers = args.workers or sorted(set([1, 2, 4, os.cpu_count() or 1]))
+        for count in workers:
+            elapsed = best_of(1, bulk.load_logs, paths, 2017, count)
+            print('load_logs {:>3} workers {:>8.2f} ms {:>12.0f} lines/sec'.format(
+                count, elapsed * 1000, lines * len(paths) / elapsed))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
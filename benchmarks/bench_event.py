@@ -0,0 +1,81 @@
+#!/usr/bin/python3
+"""
+Microbenchmark of event construction: time and memory per event for the telemetry of the bundled test log.
+'legacy' is the previous Event constructor (isinstance checks, str.split and time.time() for every event),
+for comparison.
+"""
+import argparse
+import sys
+import time
+import tracemalloc
+
+import six
+
+from common import load_messages
+from hdmi2usbmon.events import Event
+from hdmi2usbmon.parser import DVISAMPLER_EVENT, DviSamplerEvent, classify_line
+
+
+class LegacyEvent(object):
+    __slots__ = ('timestamp', 'event_type', 'data')
+
+    def __init__(self, event_type=None, data=None, timestamp=None):
+        if isinstance(event_type, Event):
+            self.timestamp = event_type.timestamp
+            self.event_type = event_type.event_type
+            self.data = event_type.data
+        else:
+            event_type = Event.DEFAULT_EVENT_TYPE if event_type is None else event_type
+            if isinstance(event_type, six.string_types):
+                event_type = event_type.split(',')
+            self.event_type = event_type
+            self.timestamp = time.time() if timestamp is None else timestamp
+            self.data = data
+
+
+def constructors(timestamp):
+    return (
+        ('legacy', lambda record: LegacyEvent(DVISAMPLER_EVENT, record)),
+        ('event', lambda record: Event(DVISAMPLER_EVENT, record)),
+        ('event+timestamp', lambda record: Event(DVISAMPLER_EVENT, record, timestamp)),
+        ('dvisampler', lambda record: DviSamplerEvent(record)),
+        ('dvisampler+timestamp', lambda record: DviSamplerEvent(record, timestamp)),
+    )
+
+
+def measure(create, records, repeat):
+    """ :return: (ns per event, bytes allocated per event) """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for record in records:
+            create(record)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    events = [create(record) for record in records]
+    allocated = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    # the list holding the events isn't part of their cost
+    allocated -= sys.getsizeof(events)
+    return best * 1e9 / len(records), allocated / float(len(events))
+
+
+def main(*argv):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--events', type=int, default=1000000)
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='timing runs, the best is reported')
+    args = parser.parse_args(argv)
+
+    records = [fields for kind, fields in (classify_line(line, 'bench') for line in load_messages())
+               if kind == DVISAMPLER_EVENT]
+    records = (records * (args.events // len(records) + 1))[:args.events]
+    print('{:>22} {:>10} {:>12}'.format('constructor', 'ns/event', 'bytes/event'))
+    for name, create in constructors(time.time()):
+        nanoseconds, allocated = measure(create, records, args.repeat)
+        print('{:>22} {:>10.1f} {:>12.1f}'.format(name, nanoseconds, allocated))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,72 @@
+#!/usr/bin/python3
+"""
+Benchmark FleetMonitor throughput (lines/sec) against the number of devices.
+Each device is a socketpair fed by a thread replaying the bundled test log.
+"""
+import argparse
+import socket
+import sys
+import threading
+import time
+
+from common import load_messages
+from hdmi2usbmon.device import Hdmi2UsbDevice
+from hdmi2usbmon.events import EventDispatcher, EventTypeHandler
+from hdmi2usbmon.monitor import FleetMonitor
+
+
+def load_payload(repeat):
+    """ device output as sent by hdmi2usbd: the test log messages, \\r\\n terminated """
+    lines = load_messages()
+    return b''.join(line + b'\r\n' for line in lines) * repeat, len(lines) * repeat
+
+
+def feed(sock, payload):
+    sock.setblocking(True)
+    sock.sendall(payload)
+    sock.close()
+
+
+def run(devices, payload):
+    counter = [0]
+
+    def count(event):
+        counter[0] += 1
+
+    dispatcher = EventDispatcher(indexed=True)
+    dispatcher.add_handler(EventTypeHandler(count, Hdmi2UsbDevice.LINE_EVENT))
+    monitor = FleetMonitor(dispatcher, commands=None)
+    threads = list()
+    for index in range(devices):
+        local, remote = socket.socketpair()
+        device = Hdmi2UsbDevice('bench', index)
+        device.sock = local
+        monitor.add_device(device)
+        threads.append(threading.Thread(target=feed, args=(remote, payload)))
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    lines = monitor.run()
+    elapsed = time.perf_counter() - start
+    for thread in threads:
+        thread.join()
+    monitor.close()
+    assert lines == counter[0]
+    return lines, elapsed
+
+
+def main(*argv):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-d', '--devices', type=int, nargs='+', default=[1, 2, 5, 10, 20, 30])
+    parser.add_argument('-r', '--repeat', type=int, default=5, help="times the test log is replayed per device")
+    args = parser.parse_args(argv)
+    payload, expected = load_payload(args.repeat)
+    print('{:>8} {:>10} {:>10} {:>12}'.format('devices', 'lines', 'seconds', 'lines/sec'))
+    for devices in args.devices:
+        lines, elapsed = run(devices, payload)
+        assert lines == expected * devices
+        print('{:>8} {:>10} {:>10.3f} {:>12.0f}'.format(devices, lines, elapsed, lines / elapsed))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,49 @@
+#!/usr/bin/python3
+"""
+Microbenchmark: dvisampler line parsing over the bundled test log (lines/sec).
+Compares hdmi2usbmon.parser against the per-line re.finditer approach used by simple_switch_ui.
+"""
+import argparse
+import re
+import sys
+import time
+
+from common import load_messages
+from hdmi2usbmon.parser import classify_line, parse_dvisampler, parse_line
+
+DVISAMPLER_REGEX = (rb'dvisampler(?P<input>\d+):\s+ph:\s*(?P<ph0>\d+)\s+(?P<ph1>\d+)\s+(?P<ph2>\d+)\s+//\s+'
+                    rb'charsync:(?P<charsync>\d+)\s+\[(?P<pos0>\d+)\s+(?P<pos1>\d+)\s+(?P<pos2>\d+)\]\s+//\s+'
+                    rb'WER:\s*(?P<wer0>\d+)\s+(?P<wer1>\d+)\s+(?P<wer2>\d+)\s+//\s+chansync:(?P<chansync>\d+)\s+//\s+'
+                    rb'res:(?P<width>\d+)x(?P<height>\d+)\s+//\s+pixclk:(?P<pixclk>\d+) Hz')
+
+
+def regex_parse(line):
+    result = [item.groupdict() for item in re.finditer(DVISAMPLER_REGEX, line)]
+    return result[0] if result else None
+
+
+def measure(func, lines, rounds):
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for line in lines:
+            func(line)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(lines) / best
+
+
+def main(*argv):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-r', '--rounds', type=int, default=5)
+    args = parser.parse_args(argv)
+    lines = load_messages()
+    for name, func in (('re.finditer', regex_parse),
+                       ('parse_dvisampler', parse_dvisampler),
+                       ('classify_line', classify_line),
+                       ('parse_line (Event)', parse_line)):
+        print('{:<20} {:>12.0f} lines/sec'.format(name, measure(func, lines, args.rounds)))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,250 @@
+#!/usr/bin/python3
+"""
+End to end benchmark of the monitoring pipeline, stage by stage and as a whole.
+
+The bundled test log is amplified to --lines lines and fed in recv()-sized chunks through:
+  split     DeviceBuffer line splitting
+  parse     classify_line
+  event     Event construction from parsed lines
+  dispatch  EventDispatcher.dispatch_batch with --handlers handlers
+  write     LogWriter (until everything is on disk)
+  pipeline  all of the above: split, write raw data, parse_line, dispatch
+
+Each stage runs in its own process and prints one JSON object per line:
+lines/sec, p50/p99 latency per chunk (the time the last line of a received chunk waits until it is
+processed) and peak RSS. Compare two runs with --baseline to spot regressions.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import load_messages
+from hdmi2usbmon.events import Event, EventDispatcher, EventTypeHandler
+from hdmi2usbmon.logwriter import LogWriter
+from hdmi2usbmon.monitor import DeviceBuffer
+from hdmi2usbmon.parser import (DVISAMPLER_EVENT, DVISAMPLER_MESSAGE, INPUT_STATUS, OUTPUT_STATUS, UNKNOWN_LINE,
+                                classify_line, parse_line)
+
+STAGES = ('split', 'parse', 'event', 'dispatch', 'write', 'pipeline')
+DEVICE = 'bench:8501'
+HANDLER_TYPES = (DVISAMPLER_EVENT, UNKNOWN_LINE, INPUT_STATUS, DVISAMPLER_MESSAGE, OUTPUT_STATUS)
+
+
+class Workload(object):
+    """
+    One copy of the test log cut in chunks as received from the socket, replayed until enough lines were fed
+    """
+
+    def __init__(self, lines, chunk_size):
+        payload = b''.join(line + b'\r\n' for line in load_messages())
+        self.chunks = [payload[pos:pos + chunk_size] for pos in range(0, len(payload), chunk_size)]
+        buffer = DeviceBuffer(None)
+        self.lines = [buffer.feed(chunk) for chunk in self.chunks]
+        self.copy_lines = buffer.lines
+        self.repeat = max(1, -(-lines // self.copy_lines))
+        self.total = self.copy_lines * self.repeat
+
+    def replay(self, items):
+        for _ in range(self.repeat):
+            for item in items:
+                yield item
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def timed(items, process):
+    """
+    Call process for each item
+    :return: total seconds, list of seconds per item
+    """
+    clock = time.perf_counter
+    latencies = list()
+    start = clock()
+    for item in items:
+        begin = clock()
+        process(item)
+        latencies.append(clock() - begin)
+    return clock() - start, latencies
+
+
+def counting_dispatcher(handlers):
+    counts = [0]
+
+    def count(event):
+        counts[0] += 1
+
+    dispatcher = EventDispatcher(indexed=True)
+    for index in range(handlers):
+        dispatcher.add_handler(EventTypeHandler(count, HANDLER_TYPES[index % len(HANDLER_TYPES)]))
+    return dispatcher, counts
+
+
+def stage_split(workload, args):
+    buffer = DeviceBuffer(None)
+    elapsed, latencies = timed(workload.replay(workload.chunks), buffer.feed)
+    assert buffer.lines == workload.total
+    return elapsed, latencies
+
+
+def stage_parse(workload, args):
+    def process(lines):
+        for line in lines:
+            classify_line(line, DEVICE)
+    return timed(workload.replay(workload.lines), process)
+
+
+def stage_event(workload, args):
+    parsed = [[classify_line(line, DEVICE) for line in lines] for lines in workload.lines]
+
+    def process(chunk):
+        for kind, fields in chunk:
+            Event(kind, fields)
+    return timed(workload.replay(parsed), process)
+
+
+def stage_dispatch(workload, args):
+    events = [[parse_line(line, DEVICE) for line in lines] for lines in workload.lines]
+    dispatcher, counts = counting_dispatcher(args.handlers)
+    send_event = dispatcher.send_event
+
+    def process(chunk):
+        for event in chunk:
+            send_event(event)
+        dispatcher.dispatch_batch(len(chunk))
+    return timed(workload.replay(events), process)
+
+
+def stage_write(workload, args):
+    directory = tempfile.mkdtemp(prefix='bench_pipeline')
+    try:
+        writer = LogWriter(os.path.join(directory, 'hdmi2usb'), max_queue=args.max_queue)
+        writer.start()
+        start = time.perf_counter()
+        elapsed, latencies = timed(workload.replay(workload.chunks), writer.put)
+        writer.close()
+        elapsed = time.perf_counter() - start
+        assert writer.dropped or writer.lines == workload.total
+        return elapsed, latencies
+    finally:
+        shutil.rmtree(directory)
+
+
+def stage_pipeline(workload, args):
+    directory = tempfile.mkdtemp(prefix='bench_pipeline')
+    try:
+        writer = LogWriter(os.path.join(directory, 'hdmi2usb'), max_queue=args.max_queue)
+        writer.start()
+        dispatcher, counts = counting_dispatcher(args.handlers)
+        buffer = DeviceBuffer(None)
+        send_event = dispatcher.send_event
+
+        def process(chunk):
+            writer.put(chunk)
+            lines = buffer.feed(chunk)
+            for line in lines:
+                send_event(parse_line(line, DEVICE))
+            dispatcher.dispatch_batch(len(lines))
+
+        start = time.perf_counter()
+        elapsed, latencies = timed(workload.replay(workload.chunks), process)
+        writer.close()
+        elapsed = time.perf_counter() - start
+        assert buffer.lines == workload.total
+        return elapsed, latencies
+    finally:
+        shutil.rmtree(directory)
+
+
+def run_stage(stage, args):
+    workload = Workload(args.lines, args.chunk_size)
+    elapsed, latencies = globals()['stage_' + stage](workload, args)
+    return {
+        'stage': stage,
+        'lines': workload.total,
+        'seconds': round(elapsed, 6),
+        'lines_per_sec': round(workload.total / elapsed, 1),
+        'p50_us': round(percentile(latencies, 0.50) * 1e6, 2),
+        'p99_us': round(percentile(latencies, 0.99) * 1e6, 2),
+        'chunk_size': args.chunk_size,
+        'handlers': args.handlers,
+        'peak_rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'python': platform.python_version(),
+    }
+
+
+def compare(results, baseline_path, threshold):
+    """
+    Print throughput relative to a previous run
+    :return: number of stages slower than the baseline by more than threshold
+    """
+    baseline = dict()
+    with open(baseline_path) as infile:
+        for line in infile:
+            if line.strip():
+                result = json.loads(line)
+                baseline[result['stage']] = result
+    regressions = 0
+    for result in results:
+        previous = baseline.get(result['stage'])
+        if previous is None:
+            continue
+        ratio = result['lines_per_sec'] / previous['lines_per_sec']
+        regressed = ratio < 1.0 - threshold
+        regressions += regressed
+        sys.stderr.write('{:<10} {:>7.2f}x{}\n'.format(result['stage'], ratio, '  REGRESSION' if regressed else ''))
+    return regressions
+
+
+def main(*argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('stages', nargs='*', default=STAGES, metavar='stage',
+                        help='stages to run: {} (default: all)'.format(', '.join(STAGES)))
+    parser.add_argument('-n', '--lines', type=int, default=2000000, help='lines fed per stage')
+    parser.add_argument('-c', '--chunk-size', type=int, default=4096, help='bytes per simulated recv()')
+    parser.add_argument('-H', '--handlers', type=int, default=8, help='handlers registered on the dispatcher')
+    parser.add_argument('-q', '--max-queue', type=int, default=None, help='LogWriter queue size')
+    parser.add_argument('-o', '--output', help='also append the results to this file')
+    parser.add_argument('-b', '--baseline', help='results of a previous run to compare against')
+    parser.add_argument('-t', '--threshold', type=float, default=0.1, help='throughput loss reported as regression')
+    parser.add_argument('--in-process', action='store_true', help="don't start a process per stage")
+    args = parser.parse_args(argv)
+    for stage in args.stages:
+        if stage not in STAGES:
+            parser.error('unknown stage: {}'.format(stage))
+
+    results = list()
+    for stage in args.stages:
+        if args.in_process:
+            result = run_stage(stage, args)
+        else:
+            command = [sys.executable, os.path.abspath(__file__), stage, '--in-process',
+                       '-n', str(args.lines), '-c', str(args.chunk_size), '-H', str(args.handlers)]
+            if args.max_queue:
+                command += ['-q', str(args.max_queue)]
+            result = json.loads(subprocess.check_output(command).decode('ascii').splitlines()[-1])
+        results.append(result)
+        print(json.dumps(result, sort_keys=True))
+        sys.stdout.flush()
+    if args.output:
+        with open(args.output, 'a') as outfile:
+            for result in results:
+                outfile.write(json.dumps(result, sort_keys=True) + '\n')
+    if args.baseline:
+        return 1 if compare(results, args.baseline, args.threshold) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*sys.argv[1:]))
@@ -0,0 +1,89 @@
+#!/usr/bin/python3
+"""
+Benchmark of handler execution with mixed fast and slow handlers: the bundled test log is dispatched in batches
+to counting handlers and to handlers sleeping per batch (standing in for disk or network writers), inline
+(EventDispatcher) and on a thread pool (PooledEventDispatcher).
+Reports the total time, the time the dispatching thread spends per batch and the latency of the fast handlers
+(from the event timestamp to the handler call).
+"""
+import argparse
+import sys
+import time
+
+from common import load_messages
+from hdmi2usbmon.events import EventDispatcher, EventHandler, PooledEventDispatcher
+from hdmi2usbmon.parser import parse_line
+
+
+class CountingHandler(EventHandler):
+
+    def __init__(self):
+        self.latencies = list()
+
+    def accept_event(self, event):
+        return True
+
+    def handle_event(self, event):
+        self.latencies.append(time.time() - event.timestamp)
+
+
+class SlowHandler(EventHandler):
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.count = 0
+
+    def accept_event(self, event):
+        return True
+
+    def handle_events(self, events):
+        time.sleep(self.delay)
+        self.count += len(events)
+
+
+def run(dispatcher, messages, fast, slow, delay, batch):
+    fast_handlers = [CountingHandler() for _ in range(fast)]
+    for handler in fast_handlers + [SlowHandler(delay) for _ in range(slow)]:
+        dispatcher.add_handler(handler)
+    dispatch_time = 0.0
+    start = time.perf_counter()
+    for offset in range(0, len(messages), batch):
+        for line in messages[offset:offset + batch]:
+            dispatcher.send_event(parse_line(line, 'bench'))
+        dispatch_time += dispatcher.dispatch_batch(batch).dispatch_time
+    if isinstance(dispatcher, PooledEventDispatcher):
+        dispatcher.shutdown()
+    elapsed = time.perf_counter() - start
+    latencies = sorted(latency for handler in fast_handlers for latency in handler.latencies)
+    return elapsed, dispatch_time, latencies
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(fraction * len(values)))] if values else 0.0
+
+
+def main(*argv):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--events', type=int, default=20000)
+    parser.add_argument('-b', '--batch', type=int, default=256, help='events per dispatch_batch')
+    parser.add_argument('--fast', type=int, default=4, help='counting handlers')
+    parser.add_argument('--slow', type=int, default=2, help='sleeping handlers')
+    parser.add_argument('--delay', type=float, default=0.005, help='seconds slow handlers sleep per batch')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='pool threads')
+    args = parser.parse_args(argv)
+
+    messages = load_messages()
+    messages = (messages * (args.events // len(messages) + 1))[:args.events]
+    batches = (len(messages) + args.batch - 1) // args.batch
+    print('{:>8} {:>10} {:>14} {:>12} {:>12}'.format('mode', 'total s', 'dispatch ms/b', 'fast p50 ms',
+                                                      'fast p99 ms'))
+    for name, dispatcher in (('inline', EventDispatcher()),
+                             ('pooled', PooledEventDispatcher(max_workers=args.workers))):
+        elapsed, dispatch_time, latencies = run(dispatcher, messages, args.fast, args.slow, args.delay, args.batch)
+        print('{:>8} {:>10.3f} {:>14.3f} {:>12.3f} {:>12.3f}'.format(
+            name, elapsed, dispatch_time * 1e3 / batches, percentile(latencies, 0.5) * 1e3,
+            percentile(latencies, 0.99) * 1e3))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,21 @@
+"""
+Shared helpers for the benchmarks
+"""
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+TEST_LOG = os.path.join(ROOT, 'test-data', 'hdmi2usb.2017-01-15_17')
+
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def load_messages(path=TEST_LOG):
+    """
+    Load the messages of a logger_basic log file as sent by hdmi2usbd (without the syslog prefix)
+    :return: list of non-empty lines (bytes, no line ending)
+    """
+    with open(path, 'rb') as logfile:
+        lines = [line.split(b']: ', 1)[-1].rstrip(b'\r\n') for line in logfile]
+    return [line for line in lines if line]
@@ -0,0 +1,124 @@
+"""
+asyncio device reader: monitor many hdmi2usbd sockets from one event loop
+"""
+import asyncio
+import time
+
+from .device import Hdmi2UsbDevice
+from .monitor import DeviceBuffer
+
+
+class AsyncDeviceReader(object):
+    """
+    Read lines from a Hdmi2UsbDevice with asyncio streams and send them to an AsyncEventDispatcher
+    as Hdmi2UsbDevice.line_event events (or parsed events, see FleetMonitor)
+    """
+    READ_SIZE = 65536
+
+    def __init__(self, device, dispatcher, commands=Hdmi2UsbDevice.SUBSCRIBE_COMMANDS, parser=None):
+        """
+        :param parser: object with a parse_line(line, device, timestamp) method, as for FleetMonitor
+        """
+        self.device = device
+        self.dispatcher = dispatcher
+        self.commands = commands
+        self.parser = parser
+        self.reader = None  # type: asyncio.StreamReader
+        self.writer = None  # type: asyncio.StreamWriter
+        self.lines = 0
+        self.bytes = 0
+
+    def device_stats(self):
+        """ :return: dict of device name -> dict(bytes=, lines=) read so far """
+        return {self.device.name: dict(bytes=self.bytes, lines=self.lines)}
+
+    @property
+    def connected(self):
+        return self.writer is not None
+
+    async def connect(self):
+        self.reader, self.writer = await self.device.open_stream()
+        if self.commands:
+            await self.writeline(*self.commands)
+        return self.connected
+
+    async def writeline(self, *commands):
+        """ send one or more commands, each terminated with \\r\\n """
+        self.writer.write(b''.join(command.encode() + b'\r\n' for command in commands))
+        await self.writer.drain()
+
+    async def send_commands(self, *commands):
+        """
+        Send commands in one write, their replies are matched by run()
+        :return: list of awaitables resolving to a CommandReply per command
+        """
+        futures = self.device.commands.add(commands)
+        await self.writeline(*commands)
+        return [asyncio.wrap_future(future) for future in futures]
+
+    async def close(self):
+        if self.writer is not None:
+            writer, self.reader, self.writer = self.writer, None, None
+            writer.close()
+            await writer.wait_closed()
+        if self.device.commands:
+            self.device.commands.fail(ConnectionError('connection to {} closed'.format(self.device.name)))
+
+    async def run(self):
+        """
+        Read lines until the connection closes
+        :return: number of lines read
+        """
+        if not self.connected:
+            await self.connect()
+        buffer = DeviceBuffer(self.device)
+        device = self.device
+        if self.parser is None:
+            make_event = device.line_event
+        else:
+            parse_line = self.parser.parse_line
+
+            def make_event(line, timestamp):
+                return parse_line(line, device.name, timestamp)
+        try:
+            while True:
+                data = await self.reader.read(self.READ_SIZE)
+                if not data:
+                    break
+                self.bytes += len(data)
+                timestamp = time.time()
+                for line in buffer.feed(data):
+                    self.lines += 1
+                    await self.dispatcher.send_event(make_event(line, timestamp))
+        finally:
+            await self.close()
+        return self.lines
+
+
+async def monitor_devices(dispatcher, *devices, **kwargs):
+    """
+    Read from all devices and dispatch their events until every connection closes
+    :param dispatcher: AsyncEventDispatcher
+    :param devices: Hdmi2UsbDevice instances
+    :param commands: subscription commands sent to each device
+    :param parser: parser of the lines, see AsyncDeviceReader
+    :return: list of line counts (or exceptions) per device
+    """
+    commands = kwargs.get('commands', Hdmi2UsbDevice.SUBSCRIBE_COMMANDS)
+    parser = kwargs.get('parser', None)
+    readers = [AsyncDeviceReader(device, dispatcher, commands, parser) for device in devices]
+    dispatch = asyncio.ensure_future(dispatcher.run())
+    try:
+        results = await asyncio.gather(*(reader.run() for reader in readers), return_exceptions=True)
+        # let the dispatch task finish the queued events (unless it failed) before cancelling it,
+        # so it is cancelled waiting for the next event rather than in the middle of a handler
+        drained = asyncio.ensure_future(dispatcher.eventq.join())
+        await asyncio.wait((drained, dispatch), return_when=asyncio.FIRST_COMPLETED)
+        drained.cancel()
+    finally:
+        dispatch.cancel()
+        try:
+            await dispatch
+        except asyncio.CancelledError:
+            pass
+    return results
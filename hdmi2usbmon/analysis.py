@@ -0,0 +1,232 @@
+"""
+Parallel analysis of logger_basic.py log files
+
+Each file is summarised by a worker process into compact per-input aggregates (LogSummary);
+the summaries are merged in time order by the parent, so no lines cross process boundaries.
+"""
+import argparse
+import glob
+import math
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from . import parser
+
+DVISAMPLER_MESSAGE_TYPES = frozenset(parser.DVISAMPLER_MESSAGES.values()) | {parser.DVISAMPLER_MESSAGE}
+
+
+class RunningStats(object):
+    """
+    Count, mean, variance, min and max of a series, mergeable across partitions
+    """
+    __slots__ = ('count', 'mean', 'm2', 'minimum', 'maximum')
+
+    def __init__(self):
+        self.count = 0
+        self.mean = self.m2 = 0.0
+        self.minimum = self.maximum = None
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.minimum = value if self.minimum is None else min(self.minimum, value)
+        self.maximum = value if self.maximum is None else max(self.maximum, value)
+
+    def merge(self, other):
+        if not other.count:
+            return self
+        if not self.count:
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+            self.minimum, self.maximum = other.minimum, other.maximum
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.mean += delta * other.count / count
+        self.count = count
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        return self
+
+    @property
+    def stddev(self):
+        return math.sqrt(self.m2 / self.count) if self.count else 0.0
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+
+class InputSummary(object):
+    """
+    Aggregates for one input
+    """
+
+    def __init__(self, input):
+        self.input = input
+        self.samples = 0
+        self.wer = [0, 0, 0]          # summed word errors per channel
+        self.wer_samples = 0          # samples with any word errors
+        self.messages = dict()        # dvisampler message type -> count
+        self.pll_lost = list()        # timestamps of 'lost PLL lock'
+        self.resolutions = list()     # (timestamp, (width, height)) at each change
+        self.pixclk = RunningStats()
+        self.pixclk_first = None      # (timestamp, pixclk)
+        self.pixclk_last = None
+
+    def add_sample(self, timestamp, record):
+        self.samples += 1
+        wer = record.wer
+        if any(wer):
+            self.wer_samples += 1
+            self.wer = [total + count for total, count in zip(self.wer, wer)]
+        resolution = (record.width, record.height)
+        if not self.resolutions or self.resolutions[-1][1] != resolution:
+            self.resolutions.append((timestamp, resolution))
+        if record.pixclk:
+            self.pixclk.add(record.pixclk)
+            if self.pixclk_first is None:
+                self.pixclk_first = (timestamp, record.pixclk)
+            self.pixclk_last = (timestamp, record.pixclk)
+
+    def add_message(self, timestamp, kind):
+        self.messages[kind] = self.messages.get(kind, 0) + 1
+        if kind == parser.PLL_LOCK_LOST:
+            self.pll_lost.append(timestamp)
+
+    @property
+    def pixclk_drift(self):
+        """ pixel clock drift in Hz per hour between the first and last sample """
+        if self.pixclk_first is None or self.pixclk_last[0] <= self.pixclk_first[0]:
+            return 0.0
+        return (self.pixclk_last[1] - self.pixclk_first[1]) * 3600.0 / (self.pixclk_last[0] - self.pixclk_first[0])
+
+    def merge(self, other):
+        """ merge the summary of a later period """
+        self.samples += other.samples
+        self.wer = [total + count for total, count in zip(self.wer, other.wer)]
+        self.wer_samples += other.wer_samples
+        for kind, count in other.messages.items():
+            self.messages[kind] = self.messages.get(kind, 0) + count
+        self.pll_lost.extend(other.pll_lost)
+        resolutions = other.resolutions
+        if self.resolutions and resolutions and self.resolutions[-1][1] == resolutions[0][1]:
+            resolutions = resolutions[1:]
+        self.resolutions.extend(resolutions)
+        self.pixclk.merge(other.pixclk)
+        self.pixclk_first = self.pixclk_first or other.pixclk_first
+        self.pixclk_last = other.pixclk_last or self.pixclk_last
+        return self
+
+
+class LogSummary(object):
+    """
+    Aggregates for one or more log files
+    """
+
+    def __init__(self):
+        self.files = 0
+        self.lines = 0
+        self.first = self.last = None
+        self.inputs = dict()
+
+    def input(self, number):
+        summary = self.inputs.get(number)
+        if summary is None:
+            summary = self.inputs[number] = InputSummary(number)
+        return summary
+
+    def add_line(self, timestamp, message):
+        self.lines += 1
+        if self.first is None:
+            self.first = timestamp
+        self.last = timestamp
+        kind, fields = parser.classify_line(message)
+        if kind == parser.DVISAMPLER_EVENT:
+            self.input(fields.input).add_sample(timestamp, fields)
+        elif kind in DVISAMPLER_MESSAGE_TYPES and fields['input'] is not None:
+            # an unnumbered 'dvisampler: ...' message can't be attributed to an input
+            self.input(fields['input']).add_message(timestamp, kind)
+
+    def merge(self, other):
+        """ merge the summary of a later period """
+        self.files += other.files
+        self.lines += other.lines
+        self.first = self.first if self.first is not None else other.first
+        self.last = other.last if other.last is not None else self.last
+        for number, summary in sorted(other.inputs.items()):
+            self.input(number).merge(summary)
+        return self
+
+
+def analyze_file(path, year=None):
+    """
+    Summarise one log file
+    :return: LogSummary
+    """
+    summary = LogSummary()
+    summary.files = 1
+    with open(path, 'rb') as logfile:
+        for line in logfile:
+            parsed = parser.parse_log_line(line, year)
+            if parsed is not None:
+                summary.add_line(*parsed)
+    return summary
+
+
+def analyze_logs(paths, year=None, max_workers=None):
+    """
+    Summarise many log files across a process pool, one file per task
+    :param paths: glob pattern or list of log files; their summaries are merged in the order of their first
+                  log timestamp, not of their names (the live file of a TimedRotatingFileHandler, 'hdmi2usb',
+                  sorts before its rotated 'hdmi2usb.YYYY-MM-DD_HH' files although it is the newest)
+    :param year: year of the logs (default: current year)
+    :param max_workers: number of processes (default: number of CPUs)
+    :return: LogSummary
+    """
+    if isinstance(paths, str):
+        paths = glob.glob(paths)
+    paths = sorted(paths)
+    if max_workers == 1:
+        results = [analyze_file(path, year) for path in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(analyze_file, paths, [year] * len(paths)))
+    summary = LogSummary()
+    # files without log lines only add to the file count
+    for result in sorted(results, key=lambda result: (result.first is None, result.first or 0.0)):
+        summary.merge(result)
+    return summary
+
+
+def format_summary(summary):
+    lines = ['{} files, {} lines'.format(summary.files, summary.lines)]
+    for number, data in sorted(summary.inputs.items()):
+        lines.append('input{}: {} samples, WER {} in {} samples, PLL lock lost {} times, {} resolution changes'.format(
+            number, data.samples, data.wer, data.wer_samples, len(data.pll_lost), max(0, len(data.resolutions) - 1)))
+        lines.append('  pixclk mean {:.0f} Hz, stddev {:.1f} Hz, range {}..{} Hz, drift {:.1f} Hz/h'.format(
+            data.pixclk.mean, data.pixclk.stddev, data.pixclk.minimum, data.pixclk.maximum, data.pixclk_drift))
+        for kind, count in sorted(data.messages.items()):
+            lines.append('  {}: {}'.format(kind, count))
+    return '\n'.join(lines)
+
+
+def main(*argv):
+    argparser = argparse.ArgumentParser(description='Summarise hdmi2usbd log files')
+    argparser.add_argument('pattern', nargs='+', help="log files or glob patterns")
+    argparser.add_argument('-y', '--year', type=int, default=None, help="year of the logs")
+    argparser.add_argument('-j', '--jobs', type=int, default=None, help="number of worker processes")
+    args = argparser.parse_args(argv)
+    paths = set()
+    for pattern in args.pattern:
+        paths.update(glob.glob(pattern))
+    print(format_summary(analyze_logs(sorted(paths), args.year, args.jobs)))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
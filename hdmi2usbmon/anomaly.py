@@ -0,0 +1,234 @@
+"""
+Streaming detection of signal integrity degradation
+
+Phases drifting and word errors climbing precede 'lost PLL lock' and 'FIFO overflow' in the dvisampler telemetry.
+AnomalyHandler keeps constant size exponentially weighted statistics per device and input and sends an
+ANOMALY_EVENT when a metric crosses its limit, and another one when it is back to normal.
+"""
+import math
+
+from .device import Hdmi2UsbDevice
+from .events import Event, EventHandler
+from .parser import DVISAMPLER_EVENT, DVISAMPLER_MESSAGES, PLL_LOCK_LOST, PLL_LOCKED
+from .status import parsed_line
+
+ANOMALY_EVENT = 'anomaly'
+
+# metrics
+PHASE = 'phase'                # phase of a channel moved away from its average, in standard deviations
+PHASE_JITTER = 'phase_jitter'  # standard deviation of the phase of a channel
+WER_RATE = 'wer_rate'          # average word errors per sample, all channels
+PIXCLK_PPM = 'pixclk_ppm'      # deviation of the pixel clock from the nominal clock of the resolution, in ppm
+
+# alpha: weight of a new sample in the averages (0.05: about the last 20 samples, i.e. seconds)
+# warmup: samples before z-scores are trusted; ph_min_stddev: floor of the phase deviation, phases are integers
+# a metric is back to normal once below clear_ratio * its limit
+LIMITS = {
+    'alpha': 0.05,
+    'warmup': 20,
+    'clear_ratio': 0.75,
+    PHASE: 3.0,
+    'ph_min_stddev': 0.75,
+    PHASE_JITTER: 1.5,
+    WER_RATE: 1.0,
+    PIXCLK_PPM: 1000,
+}
+
+# (width, height) -> pixel clock in Hz of the modes hdmi2usbd inputs usually see, each also comes in a 1000/1001
+# variant (e.g. 59.94 vs 60 Hz, see nominal_pixclk); other resolutions are compared with the average pixel clock
+NOMINAL_PIXCLK = {
+    (640, 480): 25175000,
+    (720, 480): 27000000,
+    (720, 576): 27000000,
+    (800, 600): 40000000,
+    (1024, 768): 65000000,
+    (1280, 720): 74250000,
+}
+
+
+def nominal_pixclk(resolution, pixclk):
+    """
+    :param resolution: (width, height)
+    :param pixclk: measured pixel clock in Hz
+    :return: the clock of NOMINAL_PIXCLK or one of its 1000/1001 variants nearest to pixclk,
+             None for other resolutions
+    """
+    nominal = NOMINAL_PIXCLK.get(resolution)
+    if nominal is None:
+        return None
+    # the table lists 640x480 and 720x480 at 59.94 Hz, the other modes at 60 Hz
+    return min((nominal, nominal * 1000.0 / 1001, nominal * 1001.0 / 1000), key=lambda clock: abs(clock - pixclk))
+
+
+class Ewma(object):
+    """
+    Exponentially weighted moving average and variance of a series, in constant memory
+    """
+    __slots__ = ('alpha', 'count', 'mean', 'variance')
+
+    def __init__(self, alpha):
+        self.alpha = alpha
+        self.count = 0
+        self.mean = 0.0
+        self.variance = 0.0
+
+    def add(self, value):
+        if not self.count:
+            self.mean = float(value)
+        else:
+            delta = value - self.mean
+            increment = self.alpha * delta
+            self.mean += increment
+            self.variance = (1.0 - self.alpha) * (self.variance + delta * increment)
+        self.count += 1
+
+    @property
+    def stddev(self):
+        return math.sqrt(self.variance)
+
+    def zscore(self, value, min_stddev=0.0):
+        """ :return: distance of value from the mean in standard deviations (at least min_stddev) """
+        stddev = max(math.sqrt(self.variance), min_stddev)
+        return (value - self.mean) / stddev if stddev else 0.0
+
+
+class InputStats(object):
+    """
+    Statistics of one input of a device
+    """
+    __slots__ = ('device', 'input', 'phases', 'wer', 'pixclk', 'nominal', 'resolution', 'active', 'samples')
+
+    def __init__(self, device, input, alpha):
+        self.device = device
+        self.input = input
+        self.phases = (Ewma(alpha), Ewma(alpha), Ewma(alpha))
+        self.wer = Ewma(alpha)
+        self.pixclk = Ewma(alpha)
+        self.nominal = None  # nominal pixel clock, chosen with the first sample
+        self.resolution = None
+        self.active = dict()  # metric or (metric, channel) -> value that made it active
+        self.samples = 0
+
+    def reset(self):
+        """
+        Restart from scratch, e.g. after the input lost its lock
+        Active metrics are forgotten: AnomalyHandler.reset_input reports them as cleared first.
+        """
+        alpha = self.wer.alpha
+        self.phases = (Ewma(alpha), Ewma(alpha), Ewma(alpha))
+        self.wer = Ewma(alpha)
+        self.pixclk = Ewma(alpha)
+        self.nominal = None
+        self.active = dict()
+        self.samples = 0
+
+
+class AnomalyHandler(EventHandler):
+    """
+    Watch dvisampler telemetry (raw line events or events from parser.parse_line) and send an ANOMALY_EVENT
+    through the dispatcher when a metric of an input crosses its limit, and when it is back to normal:
+    data = {'device': name, 'input': n, 'metric': PHASE, 'channel': 0 or None, 'value': 4.2, 'limit': 3.0,
+            'active': True}
+    Warnings are only sent when a metric becomes anomalous, not for every anomalous sample. When the statistics
+    of an input restart (lock lost or regained, new resolution), its active metrics are cleared with value None.
+    """
+
+    def __init__(self, dispatcher, limits=None):
+        """
+        :param dispatcher: dispatcher the anomaly events are sent to (they are dispatched with its next batch)
+        :param limits: dict overriding entries of LIMITS
+        """
+        self.dispatcher = dispatcher
+        self.limits = dict(LIMITS)
+        if limits:
+            self.limits.update(limits)
+        self.inputs = dict()  # (device, input) -> InputStats
+        self.warnings = 0
+
+    def input_stats(self, device, input):
+        stats = self.inputs.get((device, input))
+        if stats is None:
+            stats = self.inputs[(device, input)] = InputStats(device, input, self.limits['alpha'])
+        return stats
+
+    def accept_event(self, event):
+        return event.event_type[0] != ANOMALY_EVENT
+
+    def event_types(self):
+        return (Hdmi2UsbDevice.LINE_EVENT, DVISAMPLER_EVENT) + tuple(DVISAMPLER_MESSAGES.values())
+
+    def handle_event(self, event):
+        parsed = parsed_line(event)
+        if parsed is None:
+            return
+        device, kind, fields = parsed
+        if kind == DVISAMPLER_EVENT:
+            self.add_sample(fields, event.timestamp)
+        elif kind in (PLL_LOCK_LOST, PLL_LOCKED) and fields['input'] is not None:
+            stats = self.inputs.get((device, fields['input']))
+            if stats is not None:
+                self.reset_input(stats, event.timestamp)
+
+    def reset_input(self, stats, timestamp=None):
+        """ restart the statistics of an input, sending a clear event for each of its active metrics """
+        for key in list(stats.active):
+            metric, channel = key if isinstance(key, tuple) else (key, None)
+            self._send(stats, metric, channel, None, False, timestamp)
+        stats.reset()
+
+    def add_sample(self, record, timestamp=None):
+        """
+        Update the statistics of an input with a telemetry sample and report metrics crossing their limits
+        :param record: parser.DviSamplerRecord
+        :param timestamp: timestamp of the sample (default: now)
+        """
+        limits = self.limits
+        stats = self.input_stats(record.device, record.input)
+        resolution = (record.width, record.height)
+        if resolution != stats.resolution:
+            stats.resolution = resolution
+            self.reset_input(stats, timestamp)
+        stats.samples += 1
+        if stats.samples == 1:
+            stats.nominal = nominal_pixclk(resolution, record.pixclk)
+        warm = stats.samples > limits['warmup']
+
+        min_stddev = limits['ph_min_stddev']
+        for channel, (phase, average) in enumerate(zip(record.ph, stats.phases)):
+            if warm:
+                self._check(stats, PHASE, channel, abs(average.zscore(phase, min_stddev)), timestamp)
+            average.add(phase)
+            if warm:
+                self._check(stats, PHASE_JITTER, channel, average.stddev, timestamp)
+
+        stats.wer.add(sum(record.wer))
+        if warm:
+            self._check(stats, WER_RATE, None, stats.wer.mean, timestamp)
+
+        nominal = stats.nominal
+        if nominal is None:
+            nominal = stats.pixclk.mean if warm else None
+        stats.pixclk.add(record.pixclk)
+        if nominal:
+            self._check(stats, PIXCLK_PPM, None, abs(record.pixclk - nominal) * 1e6 / nominal, timestamp)
+
+    def _check(self, stats, metric, channel, value, timestamp):
+        limit = self.limits[metric]
+        key = metric if channel is None else (metric, channel)
+        if key in stats.active:
+            if value > limit * self.limits['clear_ratio']:
+                return
+            del stats.active[key]
+            active = False
+        elif value > limit:
+            stats.active[key] = value
+            active = True
+            self.warnings += 1
+        else:
+            return
+        self._send(stats, metric, channel, value, active, timestamp)
+
+    def _send(self, stats, metric, channel, value, active, timestamp):
+        self.dispatcher.send_event(Event(ANOMALY_EVENT, {
+            'device': stats.device, 'input': stats.input, 'metric': metric, 'channel': channel,
+            'value': value, 'limit': self.limits[metric], 'active': active}, timestamp=timestamp), block=False)
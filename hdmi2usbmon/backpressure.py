@@ -0,0 +1,80 @@
+"""
+Backpressure defaults for hdmi2usbd event streams: priority lanes and coalescing keys for BoundedEventQueue
+
+    dispatcher = EventDispatcher(qclass=bounded_queue(10000, COALESCE))
+
+PLL lock losses, FIFO overflows, connection changes and anomaly warnings overtake routine dvisampler telemetry,
+which is the first to be dropped when a stalled handler lets the queue fill up. All dvisampler messages share the
+urgent lane, so the lock state changes of an input ('lost PLL lock', 'PLL locked') keep their order.
+"""
+import functools
+
+from .anomaly import ANOMALY_EVENT
+from .connection import CONNECTION_EVENT
+from .device import Hdmi2UsbDevice
+from .events.queues import BoundedEventQueue, BLOCK, DROP_OLDEST, DROP_NEWEST, COALESCE
+from .parser import DVISAMPLER_EVENT, DVISAMPLER_MESSAGES, PROMPT, StatusEvent
+from .status import STATE_EVENT
+
+# priority lanes
+URGENT = 0
+NORMAL = 1
+ROUTINE = 2
+LANES = 3
+
+# events in one lane keep their order: the messages of an input go together, whether they report a failure or a
+# recovery, or a recovery could be dispatched before the failure queued ahead of it
+URGENT_TYPES = frozenset(DVISAMPLER_MESSAGES.values()) | frozenset((CONNECTION_EVENT, ANOMALY_EVENT))
+# raw lines (Hdmi2UsbDevice.LINE_EVENT) are classified by their text, without parsing them
+URGENT_MESSAGES = tuple(DVISAMPLER_MESSAGES)
+TELEMETRY_MARKER = b' // pixclk:'
+
+
+def event_priority(event):
+    """ :return: lane of an event: URGENT, NORMAL or ROUTINE (dvisampler telemetry) """
+    kind = event.event_type[0]
+    if kind == DVISAMPLER_EVENT:
+        return ROUTINE
+    if kind in URGENT_TYPES:
+        return URGENT
+    if kind == Hdmi2UsbDevice.LINE_EVENT and isinstance(event.data, dict):
+        line = event.data.get('line', b'')
+        if TELEMETRY_MARKER in line:
+            return ROUTINE
+        for message in URGENT_MESSAGES:
+            if message in line:
+                return URGENT
+    return NORMAL
+
+
+def status_key(event):
+    """
+    :return: key of the status an event reports, for which only the latest value matters, or None:
+             dvisampler telemetry per device and input, status lines per device and line name,
+             state changes per device, item and changed fields
+    """
+    kind = event.event_type[0]
+    data = event.data
+    if kind == DVISAMPLER_EVENT:
+        return kind, data.device, data.input
+    if isinstance(event, StatusEvent):
+        return kind, data.get('device'), data.get('name')
+    if kind == STATE_EVENT:
+        return kind, data['device'], data['item'], tuple(sorted(data['changes']))
+    if kind == Hdmi2UsbDevice.LINE_EVENT and isinstance(data, dict):
+        line = data.get('line', b'')
+        if TELEMETRY_MARKER in line:
+            while line.startswith(PROMPT):
+                line = line[len(PROMPT):]
+            return kind, data.get('device'), line.partition(b':')[0]
+    return None
+
+
+def bounded_queue(maxsize=10000, policy=DROP_OLDEST):
+    """
+    :param maxsize: maximum number of queued events
+    :param policy: BLOCK, DROP_OLDEST, DROP_NEWEST or COALESCE
+    :return: qclass for EventDispatcher: BoundedEventQueue with the event_priority lanes (and status_key)
+    """
+    return functools.partial(BoundedEventQueue, maxsize, policy, event_priority, LANES,
+                             status_key if policy == COALESCE else None)
@@ -0,0 +1,324 @@
+"""
+Append-only binary log segments with a sparse timestamp index
+
+A log is a set of segment files <prefix>-NNNNNN.seg, each with an index file <prefix>-NNNNNN.idx.
+Segment: SEGMENT_MAGIC followed by records of RECORD_HEADER (timestamp, line type code, device code,
+payload length) and a payload:
+ - DEVICE records define a device code for the rest of the segment, payload is the device name;
+   all device codes are defined again after every indexed offset so reads can start there
+ - dvisampler telemetry is packed with DVISAMPLER_PAYLOAD
+ - any other line type stores the raw line, parsed again by classify_line when read
+Index: INDEX_MAGIC followed by an INDEX_ENTRY (lowest timestamp, highest timestamp, start offset, end offset) per
+interval of INDEX_INTERVAL records, written when the interval is complete.
+Timestamps are mostly increasing (the writer is fed in arrival order), but the wall clock can be set back: the
+timestamp range of each interval lets a query skip the intervals and segments outside its time range without
+relying on the order of the timestamps.
+"""
+import glob
+import mmap
+import os
+import struct
+from array import array
+from bisect import bisect_left
+
+from .events import Event, EventHandler
+from .device import Hdmi2UsbDevice
+from . import parser
+
+SEGMENT_MAGIC = b'H2USEG01'
+INDEX_MAGIC = b'H2UIDX02'
+RECORD_HEADER = struct.Struct('<dBHH')
+DVISAMPLER_PAYLOAD = struct.Struct('<B3h3B3B3IBHHI')
+INDEX_ENTRY = struct.Struct('<ddQQ')
+
+DEVICE = 0
+LINE_TYPES = (None, parser.DVISAMPLER_EVENT, parser.DVISAMPLER_MESSAGE, parser.FIFO_OVERFLOW,
+              parser.PLL_LOCK_LOST, parser.PLL_LOCKED, parser.PHASE_INIT_OK, parser.PHASE_INIT_FAILED,
+              parser.IDELAY_BUSY_TIMEOUT, parser.DELAYS_CALIBRATED, parser.GIVING_UP, parser.INPUT_STATUS,
+              parser.OUTPUT_STATUS, parser.ENCODER_STATUS, parser.DDR_STATUS, parser.STATUS1, parser.STATUS2,
+              parser.UNKNOWN_LINE)
+LINE_TYPE_CODES = dict((kind, code) for code, kind in enumerate(LINE_TYPES) if kind is not None)
+
+
+def segment_paths(prefix):
+    """ :return: sorted list of the segment files of a log """
+    return sorted(glob.glob(glob.escape(prefix) + '-[0-9][0-9][0-9][0-9][0-9][0-9].seg'))
+
+
+def index_path(segment):
+    return segment[:-4] + '.idx'
+
+
+class BinaryLogWriter(EventHandler):
+    """
+    Write lines to binary log segments
+    As an EventHandler it writes raw line events (Hdmi2UsbDevice.LINE_EVENT)
+    """
+    SEGMENT_SIZE = 64 * 1024 * 1024
+    INDEX_INTERVAL = 256
+
+    def __init__(self, prefix, segment_size=None, index_interval=None):
+        """
+        :param prefix: path prefix of the segment files, new segments are numbered after existing ones
+        :param segment_size: start a new segment when a segment exceeds this size in bytes
+        :param index_interval: records between index entries
+        """
+        self.prefix = prefix
+        self.segment_size = segment_size or self.SEGMENT_SIZE
+        self.index_interval = index_interval or self.INDEX_INTERVAL
+        existing = segment_paths(prefix)
+        self.sequence = int(existing[-1][-10:-4]) + 1 if existing else 0
+        self.segment = self.index = None
+        self.devices = dict()
+        self.offset = 0
+        self.records = 0
+        self.interval = None  # [lowest timestamp, highest timestamp, start offset] of the interval being written
+
+    def open_segment(self):
+        self.close()
+        path = '{}-{:06d}.seg'.format(self.prefix, self.sequence)
+        self.sequence += 1
+        self.segment = open(path, 'wb')
+        self.index = open(index_path(path), 'wb')
+        self.segment.write(SEGMENT_MAGIC)
+        self.index.write(INDEX_MAGIC)
+        self.offset = len(SEGMENT_MAGIC)
+        self.devices = dict()
+        self.records = 0
+
+    def close(self):
+        if self.segment is not None:
+            self._end_interval()
+            self.segment.close()
+            self.index.close()
+            self.segment = self.index = None
+
+    def flush(self):
+        if self.segment is not None:
+            self.segment.flush()
+            self.index.flush()
+
+    def _end_interval(self):
+        if self.interval is not None:
+            self.index.write(INDEX_ENTRY.pack(self.interval[0], self.interval[1], self.interval[2], self.offset))
+            self.interval = None
+
+    def _record(self, timestamp, code, device, payload):
+        self.segment.write(RECORD_HEADER.pack(timestamp, code, device, len(payload)))
+        self.segment.write(payload)
+        self.offset += RECORD_HEADER.size + len(payload)
+
+    def write(self, timestamp, device, line):
+        """
+        Write a line
+        :param timestamp: time the line was read
+        :param device: device name
+        :param line: line (bytes, without line ending)
+        """
+        if self.segment is None or self.offset >= self.segment_size:
+            self.open_segment()
+        if self.records % self.index_interval == 0:
+            self._end_interval()
+            self.interval = [timestamp, timestamp, self.offset]
+            for name, code in self.devices.items():
+                self._record(timestamp, DEVICE, code, (name or '').encode('utf-8'))
+        code = self.devices.get(device)
+        if code is None:
+            code = self.devices[device] = len(self.devices)
+            self._record(timestamp, DEVICE, code, (device or '').encode('utf-8'))
+        kind, fields = parser.classify_line(line)
+        if kind == parser.DVISAMPLER_EVENT:
+            payload = DVISAMPLER_PAYLOAD.pack(fields.input, *(fields.ph + fields.charsync + fields.ctl_pos + fields.wer +
+                                                             (fields.chansync, fields.width, fields.height,
+                                                              fields.pixclk)))
+        else:
+            payload = line
+        self._record(timestamp, LINE_TYPE_CODES[kind], code, payload)
+        self.records += 1
+        interval = self.interval
+        if timestamp < interval[0]:
+            interval[0] = timestamp
+        elif timestamp > interval[1]:
+            interval[1] = timestamp
+
+    # EventHandler interface
+
+    def accept_event(self, event):
+        return Hdmi2UsbDevice.LINE_EVENT in event.event_type
+
+    def handle_event(self, event):
+        self.write(event.timestamp, event.data['device'], event.data['line'])
+
+    def event_types(self):
+        return Hdmi2UsbDevice.LINE_EVENT,
+
+
+class BinarySegment(object):
+    """
+    Read-only memory-mapped segment and its index
+    A segment left behind by a crash is read up to its last complete record: a segment shorter than its magic
+    reads as empty, the records after the last index entry (all of them without an index) are always scanned.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lows = array('d')
+        self.highs = array('d')
+        self.starts = array('Q')
+        self.ends = array('Q')
+        try:
+            with open(index_path(path), 'rb') as index:
+                data = index.read()
+        except FileNotFoundError:
+            data = INDEX_MAGIC
+        if not INDEX_MAGIC.startswith(data[:len(INDEX_MAGIC)]):
+            raise ValueError('{}: not a segment index'.format(index_path(path)))
+        entries = data[len(INDEX_MAGIC):]
+        entries = entries[:len(entries) - len(entries) % INDEX_ENTRY.size]
+        for low, high, start, end in INDEX_ENTRY.iter_unpack(entries):
+            self.lows.append(low)
+            self.highs.append(high)
+            self.starts.append(start)
+            self.ends.append(end)
+        self.file = open(path, 'rb')
+        size = os.path.getsize(path)
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        if size < len(SEGMENT_MAGIC):
+            # created but never (completely) written
+            if not SEGMENT_MAGIC.startswith(self.map[:size]):
+                self.close()
+                raise ValueError('{}: not a log segment'.format(path))
+            self.map = b''
+            del self.lows[:], self.highs[:], self.starts[:], self.ends[:]
+        elif self.map[:len(SEGMENT_MAGIC)] != SEGMENT_MAGIC:
+            self.close()
+            raise ValueError('{}: not a log segment'.format(path))
+        # records after the last complete interval (not indexed yet, or the index wasn't flushed)
+        self.tail = self.ends[-1] if self.ends else min(len(SEGMENT_MAGIC), len(self.map))
+        # highest timestamp up to each interval and lowest from each interval on: both are sorted,
+        # so the intervals a time range can overlap are found by bisection, whatever the order of the timestamps
+        self.reach = array('d', self.highs)
+        for number in range(1, len(self.reach)):
+            self.reach[number] = max(self.reach[number], self.reach[number - 1])
+        self.floor = array('d', self.lows)
+        for number in range(len(self.floor) - 2, -1, -1):
+            self.floor[number] = min(self.floor[number], self.floor[number + 1])
+
+    def overlaps(self, start, end):
+        """ :return: False if the segment holds no record with start <= timestamp < end """
+        if self.tail + RECORD_HEADER.size <= len(self.map):
+            return True
+        return bool(self.ends) and self.reach[-1] >= start and self.floor[0] < end
+
+    def close(self):
+        if isinstance(self.map, mmap.mmap):
+            self.map.close()
+        self.file.close()
+
+    def _spans(self, start, end):
+        """
+        :return: list of (start offset, end offset) of the index intervals that can hold records with
+                 start <= timestamp < end, and of the records after the last interval
+        """
+        spans = list()
+        first = bisect_left(self.reach, start)
+        last = bisect_left(self.floor, end)
+        for number in range(first, last):
+            if self.highs[number] >= start and self.lows[number] < end:
+                if spans and spans[-1][1] == self.starts[number]:
+                    spans[-1] = (spans[-1][0], self.ends[number])
+                else:
+                    spans.append((self.starts[number], self.ends[number]))
+        if self.tail < len(self.map):
+            spans.append((self.tail, len(self.map)))
+        return spans
+
+    def read(self, start=None, end=None):
+        """
+        Read the records with start <= timestamp < end, up to the last complete record
+        :return: generator of Events as created by parser.parse_line
+        """
+        start = float('-inf') if start is None else start
+        end = float('inf') if end is None else end
+        devices = dict()
+        data = self.map
+        unpack_header = RECORD_HEADER.unpack_from
+        for offset, stop in self._spans(start, end):
+            # every interval starts with the device records, and device codes don't change within a segment
+            stop = min(stop, len(data))
+            while offset + RECORD_HEADER.size <= stop:
+                timestamp, code, device, length = unpack_header(data, offset)
+                offset += RECORD_HEADER.size
+                if offset + length > stop:
+                    # partial record at the end of a segment, the normal state after a crash
+                    break
+                payload = data[offset:offset + length]
+                offset += length
+                if code == DEVICE:
+                    devices[device] = payload.decode('utf-8')
+                    continue
+                if timestamp < start or timestamp >= end:
+                    continue
+                name = devices.get(device)
+                if LINE_TYPES[code] == parser.DVISAMPLER_EVENT:
+                    values = DVISAMPLER_PAYLOAD.unpack(payload)
+                    fields = parser.DviSamplerRecord(name, values[0], values[1:4], values[4:7], values[7:10],
+                                                     values[10:13], values[13], values[14], values[15], values[16])
+                    yield Event(parser.DVISAMPLER_EVENT, data=fields, timestamp=timestamp)
+                else:
+                    yield parser.parse_line(payload, name, timestamp)
+
+
+def _event_device(event):
+    data = event.data
+    return data['device'] if isinstance(data, dict) else data.device
+
+
+class BinaryLogReader(object):
+    """
+    Query a binary log by time range
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.segments = [BinarySegment(path) for path in segment_paths(prefix)]
+
+    def close(self):
+        for segment in self.segments:
+            segment.close()
+        self.segments = list()
+
+    def query(self, start=None, end=None, device=None):
+        """
+        Read the records with start <= timestamp < end
+        :param device: device name, None for all devices
+        :return: generator of Events as created by parser.parse_line
+        """
+        start = float('-inf') if start is None else start
+        end = float('inf') if end is None else end
+        for segment in self.segments:
+            if not segment.overlaps(start, end):
+                continue
+            for event in segment.read(start, end):
+                if device is None or _event_device(event) == device:
+                    yield event
+
+
+def import_text_log(path, writer, device=None, year=None):
+    """
+    Convert a text log written by logger_basic.py into binary log records
+    :param path: text log file
+    :param writer: BinaryLogWriter
+    :param device: device name for the records (default: the log file name)
+    :param year: year of the log, which the text format doesn't record (default: current year)
+    :return: number of lines imported
+    """
+    device = os.path.basename(path) if device is None else device
+    count = 0
+    with open(path, 'rb') as logfile:
+        for line in logfile:
+            parsed = parser.parse_log_line(line, year)
+            if parsed is not None and parsed[1]:
+                writer.write(parsed[0], device, parsed[1])
+                count += 1
+    return count
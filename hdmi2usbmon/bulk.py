@@ -0,0 +1,205 @@
+"""
+Vectorized bulk loading of logger_basic.py log files with NumPy
+"""
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+MONTHS = (b'Jan', b'Feb', b'Mar', b'Apr', b'May', b'Jun', b'Jul', b'Aug', b'Sep', b'Oct', b'Nov', b'Dec')
+
+# structured array dtype of dvisampler telemetry
+TELEMETRY_FIELDS = (
+    ('timestamp', 'f8'),
+    ('input', 'u1'),
+    ('ph', 'i2', (3,)),
+    ('charsync', 'u1', (3,)),
+    ('ctl_pos', 'u1', (3,)),
+    ('wer', 'u4', (3,)),
+    ('chansync', 'u1'),
+    ('width', 'u2'),
+    ('height', 'u2'),
+    ('pixclk', 'u4'),
+)
+# numbers in a dvisampler telemetry message:
+# dvisamplerN: ph: a b c // charsync:abc [a b c] // WER: a b c // chansync:a // res:WxH // pixclk:N Hz
+TELEMETRY_NUMBERS = 15
+PH_SEPARATOR = b': ph:'
+MAX_INPUT_DIGITS = 3
+
+
+def _require_numpy():
+    if np is None:
+        raise EnvironmentError("bulk loading requires numpy (`pip install numpy`)")
+
+
+def _match(data, positions, pattern):
+    """ True for each position where data contains pattern """
+    matched = np.ones(len(positions), dtype=bool)
+    limit = len(data) - 1
+    for offset, byte in enumerate(bytearray(pattern)):
+        matched &= data[np.minimum(positions + offset, limit)] == byte
+    return matched
+
+
+def _input_number(data, positions, ends):
+    """
+    True for each 'dvisampler' position followed by an input number (up to MAX_INPUT_DIGITS digits)
+    and ': ph:' in the same line
+    """
+    colons = np.flatnonzero(data == 58)
+    separators = colons[_match(data, colons, PH_SEPARATOR)]
+    if not len(separators):
+        return np.zeros(len(positions), dtype=bool)
+    # the first ': ph:' after 'dvisampler' and at least one digit
+    following = separators[np.minimum(np.searchsorted(separators, positions + 11), len(separators) - 1)]
+    digits = following - positions - 10
+    matched = (following + len(PH_SEPARATOR) <= ends) & (digits > 0) & (digits <= MAX_INPUT_DIGITS)
+    for offset in range(MAX_INPUT_DIGITS):
+        byte = data[np.minimum(positions + 10 + offset, len(data) - 1)]
+        matched &= (offset >= digits) | ((byte >= 48) & (byte <= 57))
+    return matched
+
+
+def _timestamps(data, starts, year):
+    """ timestamps of lines starting with 'Mmm dd HH:MM:SS' (nan for other lines) """
+    columns = data[np.minimum(starts[:, None] + np.arange(15), len(data) - 1)].astype(np.int64)
+    digits = columns - 48
+    codes = (columns[:, 0] << 16) | (columns[:, 1] << 8) | columns[:, 2]
+    month = np.zeros(len(starts), dtype=np.int64)
+    for number, name in enumerate(MONTHS, 1):
+        month[codes == ((name[0] << 16) | (name[1] << 8) | name[2])] = number
+    day = np.where(columns[:, 4] == 32, 0, digits[:, 4]) * 10 + digits[:, 5]
+    hour = digits[:, 7] * 10 + digits[:, 8]
+    seconds = (digits[:, 10] * 10 + digits[:, 11]) * 60 + digits[:, 13] * 10 + digits[:, 14]
+    valid = (month > 0) & (columns[:, 3] == 32) & (columns[:, 9] == 58) & (columns[:, 12] == 58)
+    # local time conversion once per distinct hour (handles DST changes between hours)
+    keys = np.where(valid, (month * 100 + day) * 100 + hour, -1)
+    hours, inverse = np.unique(keys, return_inverse=True)
+    epochs = np.array([time.mktime((year, key // 10000, key // 100 % 100, key % 100, 0, 0, 0, 0, -1))
+                       if key >= 0 else np.nan for key in hours.tolist()], dtype=np.float64)
+    return np.where(valid, epochs[inverse.reshape(-1)] + seconds, np.nan)
+
+
+def _numbers(buffer, ranges_start, ranges_end):
+    """
+    Values of the digit runs inside the given byte ranges
+    :param buffer: log contents (supports slicing)
+    :return: (values, range index of each value)
+    """
+    # copy the ranges into one newline separated buffer, so digit runs can't cross ranges
+    text = np.frombuffer(b'\n'.join([buffer[start:end] for start, end in zip(ranges_start.tolist(),
+                                                                              ranges_end.tolist())]), dtype=np.uint8)
+    digit = np.zeros(len(text) + 2, dtype=np.int8)
+    digit[1:-1] = (text - np.uint8(48)) < 10
+    # runs start and end alternately, where the digit mask changes
+    edges = np.flatnonzero(np.diff(digit))
+    starts, ends = edges[0::2], edges[1::2]
+    owner = np.searchsorted(np.flatnonzero(text == 10), starts)
+    lengths = ends - starts
+    values = text[starts].astype(np.int64) - 48
+    # most numbers are short: each further digit only touches the runs that are long enough
+    longer = np.arange(len(starts))
+    for offset in range(1, int(lengths.max()) if len(lengths) else 0):
+        longer = longer[lengths[longer] > offset]
+        values[longer] = values[longer] * 10 + text[starts[longer] + offset] - 48
+    return values, owner
+
+
+def load_buffer(data, year=None):
+    """
+    Parse a logger_basic.py log held in memory
+    :param data: log contents (bytes, bytearray, mmap or other buffer)
+    :param year: year of the log (default: current year)
+    :return: (telemetry, others): numpy structured array (TELEMETRY_FIELDS) of the dvisampler telemetry lines,
+             list of (timestamp, message) for every other line
+    """
+    _require_numpy()
+    year = time.localtime().tm_year if year is None else year
+    buffer, data = data, np.frombuffer(data, dtype=np.uint8)
+    if not len(data):
+        return np.zeros(0, dtype=list(TELEMETRY_FIELDS)), list()
+    newlines = np.flatnonzero(data == 10)
+    ends = newlines if len(newlines) and newlines[-1] == len(data) - 1 else np.append(newlines, len(data))
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    keep = ends - starts >= 15
+    starts, ends = starts[keep], ends[keep]
+    timestamps = _timestamps(data, starts, year)
+    # message: after the first ']: ' of the line
+    separators = np.flatnonzero((data[:-2] == 93) & (data[1:-1] == 58) & (data[2:] == 32))
+    line = np.searchsorted(starts, separators, side='right') - 1
+    valid = (line >= 0) & (separators < ends[np.maximum(line, 0)])
+    separators, line = separators[valid], line[valid]
+    line, first = np.unique(line, return_index=True)
+    message = np.full(len(starts), -1, dtype=np.int64)
+    message[line] = separators[first] + 3
+    valid = (message >= 0) & ~np.isnan(timestamps)
+    # 'dvisampler': its first occurrence in the message, after any prompts or command echo (see strip_prefix)
+    occurrences = np.flatnonzero(data == 100)
+    occurrences = occurrences[_match(data, occurrences, b'dvisampler')]
+    if len(occurrences):
+        dvisampler = occurrences[np.minimum(np.searchsorted(occurrences, message), len(occurrences) - 1)]
+        found = (dvisampler >= message) & (dvisampler < ends)
+    else:
+        dvisampler = message
+        found = np.zeros(len(starts), dtype=bool)
+    telemetry = valid & found & _input_number(data, dvisampler, ends)
+    rows = np.flatnonzero(telemetry)
+    values, owner = _numbers(buffer, dvisampler[rows], ends[rows])
+    counts = np.bincount(owner, minlength=len(rows))
+    complete = counts == TELEMETRY_NUMBERS
+    values = values[complete[owner]].reshape(-1, TELEMETRY_NUMBERS)
+    telemetry[rows[~complete]] = False
+    rows = rows[complete]
+    result = np.zeros(len(rows), dtype=list(TELEMETRY_FIELDS))
+    result['timestamp'] = timestamps[rows]
+    result['input'] = values[:, 0]
+    result['ph'] = values[:, 1:4]
+    result['charsync'] = np.stack((values[:, 4] // 100, values[:, 4] // 10 % 10, values[:, 4] % 10), axis=1)
+    result['ctl_pos'] = values[:, 5:8]
+    result['wer'] = values[:, 8:11]
+    result['chansync'] = values[:, 11]
+    result['width'] = values[:, 12]
+    result['height'] = values[:, 13]
+    result['pixclk'] = values[:, 14]
+    others = [(timestamp, bytes(buffer[start:end]).rstrip(b'\r'))
+              for timestamp, start, end in zip(timestamps[valid & ~telemetry].tolist(),
+                                               message[valid & ~telemetry].tolist(),
+                                               ends[valid & ~telemetry].tolist())]
+    return result, others
+
+
+def load_log(path, year=None):
+    """
+    Parse a logger_basic.py log file, read in one call
+    :return: as load_buffer
+    """
+    _require_numpy()
+    with open(path, 'rb') as logfile:
+        return load_buffer(logfile.read(), year)
+
+
+def load_logs(paths, year=None, max_workers=None):
+    """
+    Parse many log files across a process pool, one file per task
+    :param paths: log files, results are concatenated in this order
+    :param max_workers: number of processes (default: number of CPUs)
+    :return: as load_buffer
+    """
+    _require_numpy()
+    paths = list(paths)
+    if len(paths) <= 1 or max_workers == 1:
+        results = [load_log(path, year) for path in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(load_log, paths, [year] * len(paths)))
+    if not results:
+        return load_buffer(b'', year)
+    others = list()
+    for _, lines in results:
+        others.extend(lines)
+    return np.concatenate([telemetry for telemetry, _ in results]), others
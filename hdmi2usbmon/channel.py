@@ -0,0 +1,60 @@
+"""
+Thread-safe channel from a reader thread to a UI that only keeps what the UI can still show:
+the latest value per key and a bounded backlog of text lines
+"""
+from collections import OrderedDict, deque
+import threading
+
+
+class LatestValueChannel(object):
+    """
+    The reader puts values and lines as they come, the UI drains everything once per frame.
+    A key updated several times between two frames is only delivered once, with its latest value;
+    lines beyond max_lines are dropped oldest first.
+    """
+
+    def __init__(self, max_keys=1024, max_lines=1000):
+        """
+        :param max_keys: maximum number of pending keys, the least recently updated key is dropped beyond that
+        :param max_lines: maximum number of pending lines
+        """
+        self.max_keys = max_keys
+        self.max_lines = max_lines
+        self.lock = threading.Lock()
+        self.values = OrderedDict()
+        self.lines = deque(maxlen=max_lines)
+        self.coalesced = 0
+        self.dropped = 0
+
+    def put(self, key, value):
+        with self.lock:
+            values = self.values
+            if key in values:
+                self.coalesced += 1
+                del values[key]
+            elif len(values) >= self.max_keys:
+                values.popitem(last=False)
+                self.dropped += 1
+            values[key] = value
+
+    def append_line(self, line):
+        with self.lock:
+            if len(self.lines) == self.max_lines:
+                self.dropped += 1
+            self.lines.append(line)
+
+    def drain(self):
+        """
+        Take everything pending
+        :return: (OrderedDict of key -> latest value, list of lines)
+        """
+        with self.lock:
+            values, self.values = self.values, OrderedDict()
+            lines = list(self.lines)
+            self.lines.clear()
+        return values, lines
+
+    def stats(self):
+        with self.lock:
+            return dict(pending_keys=len(self.values), pending_lines=len(self.lines),
+                        coalesced=self.coalesced, dropped=self.dropped)
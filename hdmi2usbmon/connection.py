@@ -0,0 +1,327 @@
+"""
+Connection manager: keep a fleet of hdmi2usbd connections up, reconnecting with jittered exponential backoff
+"""
+from collections import deque
+from concurrent.futures import Future
+import errno
+import random
+import selectors
+import socket
+import time
+
+from .device import Hdmi2UsbDevice
+from .events import Event
+from .monitor import FleetMonitor
+
+CONNECTION_EVENT = 'connection'
+
+# connection states
+DISCONNECTED = 'disconnected'
+CONNECTING = 'connecting'
+CONNECTED = 'connected'
+
+
+class Backoff(object):
+    """
+    Exponential backoff with full jitter: the delay before attempt n is uniform in [0, min(maximum, initial * 2**n)],
+    so devices that dropped at the same time don't all reconnect at the same time
+    """
+
+    def __init__(self, initial=0.5, maximum=60.0, multiplier=2.0, random=random.random):
+        self.initial = initial
+        self.maximum = maximum
+        self.multiplier = multiplier
+        self.random = random
+
+    def delay(self, attempt):
+        """
+        :param attempt: number of failed attempts so far (0 for the first reconnect)
+        :return: seconds to wait
+        """
+        return self.random() * min(self.maximum, self.initial * self.multiplier ** min(attempt, 64))
+
+
+def enable_keepalive(sock, idle=10, interval=5, count=3):
+    """ turn on TCP keepalive, with the given timings where the platform supports them """
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    for option, value in (('TCP_KEEPIDLE', idle), ('TCP_KEEPINTVL', interval), ('TCP_KEEPCNT', count)):
+        if hasattr(socket, option):
+            try:
+                sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
+            except OSError:
+                pass
+
+
+class _Link(object):
+    """ connection state of a managed device """
+    __slots__ = ('device', 'state', 'attempt', 'retry_at', 'deadline', 'connected_at', 'last_data', 'last_bytes',
+                 'buffered', 'error')
+
+    def __init__(self, device, max_buffered):
+        self.device = device
+        self.state = DISCONNECTED
+        self.attempt = 0
+        self.retry_at = 0.0
+        self.deadline = None
+        self.connected_at = None
+        self.last_data = None
+        self.last_bytes = 0
+        self.buffered = deque(maxlen=max_buffered)  # (command, Future)
+        self.error = None
+
+
+class ConnectionManager(FleetMonitor):
+    """
+    FleetMonitor that owns the connections of its devices:
+    - connects without blocking, and treats connect timeouts, EOF, socket errors and devices that stay silent for
+      idle_timeout seconds as a lost connection (TCP keepalive covers dead peers)
+    - reconnects with Backoff delays and sends the subscription commands again on each connection; the backoff
+      starts from the first attempt again only once a connection stayed up for stable_after seconds, so a device
+      that accepts connections and drops them right away isn't redialled in a tight loop
+    - sends a CONNECTION_EVENT through the dispatcher on each state change:
+      data = {'device': name, 'state': state, 'previous': state, 'attempt': n, 'error': str or None}
+    - buffers commands sent while a device is disconnected and sends them once it is back
+    """
+
+    def __init__(self, dispatcher, commands=Hdmi2UsbDevice.SUBSCRIBE_COMMANDS, selector=None, backoff=None,
+                 connect_timeout=5.0, idle_timeout=10.0, max_buffered=100, keepalive=True, stable_after=60.0):
+        """
+        :param backoff: Backoff (default: Backoff())
+        :param connect_timeout: seconds a connection attempt may take
+        :param idle_timeout: seconds without data after which a connection is considered dead (None: never);
+                             hdmi2usbd sends status lines every second once subscribed
+        :param max_buffered: maximum number of commands kept per disconnected device, the oldest fail beyond that
+        :param keepalive: enable TCP keepalive on the connections
+        :param stable_after: seconds a connection must stay up before the backoff is reset
+        """
+        super(ConnectionManager, self).__init__(dispatcher, commands, selector)
+        self.backoff = backoff or Backoff()
+        self.connect_timeout = connect_timeout
+        self.idle_timeout = idle_timeout
+        self.max_buffered = max_buffered
+        self.keepalive = keepalive
+        self.stable_after = stable_after
+        self.links = dict()  # device -> _Link
+        self.closing = False
+
+    def state(self, device):
+        return self.links[device].state
+
+    def _set_state(self, link, state, error=None):
+        previous, link.state = link.state, state
+        link.error = error
+        self.dispatcher.send_event(Event(CONNECTION_EVENT, {
+            'device': link.device.name, 'state': state, 'previous': previous, 'attempt': link.attempt,
+            'error': None if error is None else str(error)}), block=False)
+
+    # Devices
+
+    def add_device(self, device):
+        """
+        Manage a device: it is connected (in the background) and kept connected until it is removed with forget()
+        :return: True if the device was added
+        """
+        if device in self.links:
+            return False
+        link = self.links[device] = _Link(device, self.max_buffered)
+        if device.connected:
+            self._connected(link)
+        else:
+            self._connect(link)
+        return True
+
+    def forget(self, device):
+        """
+        Stop managing a device and close its connection, commands still buffered for it fail
+        :return: True if the device was managed
+        """
+        link = self.links.pop(device, None)
+        if link is None:
+            return False
+        self._disconnect(link)
+        self._fail_buffered(link, ConnectionError('{} removed'.format(device.name)))
+        return True
+
+    def remove_device(self, device, close=True):
+        """ FleetMonitor removes devices whose connection failed: schedule a reconnect for managed ones """
+        removed = super(ConnectionManager, self).remove_device(device, close)
+        link = self.links.get(device)
+        if link is not None and link.state == CONNECTED and not self.closing:
+            device.close()
+            self._lost(link, ConnectionError('connection closed'))
+        return removed
+
+    def close(self):
+        self.closing = True
+        for device in list(self.links):
+            self.forget(device)
+        super(ConnectionManager, self).close()
+
+    # Commands
+
+    def send_commands(self, device, *commands):
+        """
+        Send commands to a device, or buffer them until it is connected
+        :return: list of concurrent.futures.Future resolving to a CommandReply per command
+        """
+        link = self.links[device]
+        if link.state == CONNECTED:
+            return device.send_commands(*commands)
+        futures = list()
+        for command in commands:
+            future = Future()
+            future.set_running_or_notify_cancel()
+            if len(link.buffered) == link.buffered.maxlen:
+                link.buffered[0][1].set_exception(BufferError('command buffer of {} full'.format(device.name)))
+            link.buffered.append((command, future))
+            futures.append(future)
+        return futures
+
+    def _flush(self, link):
+        if not link.buffered:
+            return
+        buffered = list(link.buffered)
+        link.buffered.clear()
+        replies = link.device.send_commands(*[command for command, _ in buffered])
+        for reply, (_, future) in zip(replies, buffered):
+            reply.add_done_callback(lambda reply, future=future: _chain(reply, future))
+
+    def _fail_buffered(self, link, exc):
+        while link.buffered:
+            link.buffered.popleft()[1].set_exception(exc)
+
+    # Connection handling
+
+    def _connect(self, link):
+        device = link.device
+        try:
+            address = socket.getaddrinfo(device.host, device.port, 0, socket.SOCK_STREAM)[0]
+            sock = socket.socket(address[0], address[1], address[2])
+            sock.setblocking(False)
+            result = sock.connect_ex(address[4])
+        except OSError as exc:
+            self._lost(link, exc)
+            return
+        if result not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EAGAIN):
+            sock.close()
+            self._lost(link, OSError(result, 'connect: {}'.format(errno.errorcode.get(result, result))))
+            return
+        device.sock = sock
+        link.deadline = time.time() + self.connect_timeout
+        self._set_state(link, CONNECTING)
+        self.selector.register(sock, selectors.EVENT_WRITE, link)
+
+    def _ready(self, key, mask):
+        link = key.data
+        sock = key.fileobj
+        self.selector.unregister(sock)
+        error = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if error:
+            link.device.sock = None
+            sock.close()
+            self._lost(link, OSError(error, 'connect: {}'.format(errno.errorcode.get(error, error))))
+        else:
+            self._connected(link)
+
+    def _connected(self, link):
+        device = link.device
+        if self.keepalive:
+            enable_keepalive(device.sock)
+        try:
+            self._register(device)
+        except OSError as exc:
+            device.close()
+            self._lost(link, exc)
+            return
+        link.deadline = None
+        link.connected_at = link.last_data = time.time()
+        link.last_bytes = 0
+        self._set_state(link, CONNECTED)
+        self._flush(link)
+
+    def _disconnect(self, link):
+        device = link.device
+        if device.sock is None:
+            return
+        if device.sock in self.buffers:
+            super(ConnectionManager, self).remove_device(device)
+        else:
+            if link.state == CONNECTING:
+                self.selector.unregister(device.sock)
+            device.close()
+
+    def _lost(self, link, error):
+        """ a connection (attempt) failed: wait before the next attempt """
+        link.retry_at = time.time() + self.backoff.delay(link.attempt)
+        link.attempt += 1
+        link.deadline = None
+        self._set_state(link, DISCONNECTED, error)
+
+    def check(self, now=None):
+        """
+        Handle timeouts, due reconnects and backoff resets of stable connections
+        :return: seconds until the next timer is due (None if there is none)
+        """
+        now = time.time() if now is None else now
+        buffers = dict((buffer.device, buffer) for buffer in self.buffers.values())
+        next_due = None
+        for link in list(self.links.values()):
+            if link.state == CONNECTED and link.attempt and now - link.connected_at >= self.stable_after:
+                # the connection is stable: the next reconnect starts from the first backoff attempt
+                link.attempt = 0
+            due = None
+            if link.state == CONNECTING:
+                if now >= link.deadline:
+                    self._disconnect(link)
+                    self._lost(link, TimeoutError('connect timed out'))
+                    due = link.retry_at
+                else:
+                    due = link.deadline
+            elif link.state == CONNECTED and self.idle_timeout:
+                buffer = buffers.get(link.device)
+                if buffer is not None and buffer.bytes != link.last_bytes:
+                    link.last_bytes = buffer.bytes
+                    link.last_data = now
+                if now - link.last_data >= self.idle_timeout:
+                    self._disconnect(link)
+                    self._lost(link, TimeoutError('no data for {} seconds'.format(self.idle_timeout)))
+                    due = link.retry_at
+                else:
+                    due = link.last_data + self.idle_timeout
+            elif link.state == DISCONNECTED:
+                if now >= link.retry_at:
+                    self._connect(link)
+                    if link.state == CONNECTING:
+                        due = link.deadline
+                    elif link.state == DISCONNECTED:
+                        due = link.retry_at
+                else:
+                    due = link.retry_at
+            if due is not None and (next_due is None or due < next_due):
+                next_due = due
+        return None if next_due is None else max(0.0, next_due - now)
+
+    def poll(self, timeout=None):
+        due = self.check()
+        if due is not None and (timeout is None or due < timeout):
+            timeout = due
+        return super(ConnectionManager, self).poll(timeout)
+
+    def run(self, timeout=1.0, max_events=4096, until=None):
+        """
+        Poll devices and dispatch their events until no devices are managed anymore or until() returns True
+        :return: number of lines read
+        """
+        count = 0
+        while self.links and not (until is not None and until()):
+            count += self.poll(timeout)
+            while self.dispatcher.dispatch_batch(max_events).events:
+                pass
+        return count
+
+
+def _chain(source, target):
+    if source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
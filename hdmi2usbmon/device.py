@@ -1,8 +1,16 @@
 """
 
 """
+import asyncio
+from collections import deque, namedtuple
+from concurrent.futures import Future
 import os
+import select
 import socket
+import threading
+import time
+
+from .events import Event
 
 
 def which(program):
@@ -22,23 +30,202 @@ def which(program):
     return None
 
 
+CommandReply = namedtuple('CommandReply', ('command', 'lines', 'latency'))
+CommandReply.__doc__ = """
+Reply to a command sent with Hdmi2UsbDevice.send_commands
+command: command (str)
+lines: lines printed by the firmware between the echo of the command and the next prompt (bytes),
+       without dvisampler telemetry
+latency: seconds from sending the command to the prompt ending its reply
+"""
+
+
+class _PendingCommand(object):
+    """ a command waiting for its reply in a CommandQueue """
+    __slots__ = ('command', 'echo', 'future', 'sent', 'deadline', 'lines', 'echoed')
+
+    def __init__(self, command, future, sent, deadline):
+        self.command = command
+        self.echo = command.strip().encode()
+        self.future = future
+        self.sent = sent
+        self.deadline = deadline
+        self.lines = []
+        self.echoed = False
+
+
+class CommandQueue(object):
+    """
+    Commands sent to a device, waiting for their replies
+
+    hdmi2usbd echoes each command, prints its reply and then the HDMI2USB> prompt without a line ending,
+    so replies are delimited by the echo of the command and the next prompt (which usually prefixes the
+    following line). Telemetry lines may come in between, and a prompt before the echo of the command
+    at the head of the queue belongs to something else.
+
+    A command without a complete reply by its deadline fails with TimeoutError when the next line or prompt
+    is read (or expire() is called) and is removed, so matching resyncs on the echo of the next command.
+    """
+    # lines printed asynchronously, not part of command replies
+    ASYNC_PREFIXES = (b'dvisampler',)
+    # seconds a command may wait for its reply
+    TIMEOUT = 30.0
+
+    def __init__(self, prompt, timeout=None):
+        """
+        :param prompt: prompt (bytes)
+        :param timeout: default seconds a command may wait for its reply (default: TIMEOUT)
+        """
+        self.prompt = prompt
+        self.timeout = self.TIMEOUT if timeout is None else timeout
+        self.pending = deque()  # _PendingCommand
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.pending)
+
+    def add(self, commands, timeout=None):
+        """
+        :param commands: commands (str) about to be sent
+        :param timeout: seconds each command may wait for its reply (default: self.timeout)
+        :return: list of concurrent.futures.Future, each resolving to a CommandReply
+        """
+        futures = list()
+        sent = time.perf_counter()
+        deadline = sent + (self.timeout if timeout is None else timeout)
+        with self.lock:
+            for command in commands:
+                future = Future()
+                future.set_running_or_notify_cancel()
+                self.pending.append(_PendingCommand(command, future, sent, deadline))
+                futures.append(future)
+        return futures
+
+    def _prompt(self, now):
+        head = self.pending[0] if self.pending else None
+        if head is not None and head.echoed:
+            self.pending.popleft()
+            head.future.set_result(CommandReply(head.command, head.lines, now - head.sent))
+
+    def _expired(self, now):
+        """ remove the commands past their deadline, :return: list of them """
+        if not self.pending or min(command.deadline for command in self.pending) > now:
+            return []
+        expired = [command for command in self.pending if command.deadline <= now]
+        self.pending = deque(command for command in self.pending if command.deadline > now)
+        return expired
+
+    def _fail(self, commands, exc):
+        for command in commands:
+            if not command.future.done():
+                command.future.set_exception(exc)
+
+    def _timeout(self, expired):
+        for command in expired:
+            self._fail((command,), TimeoutError('no reply to {!r}'.format(command.command)))
+
+    def feed_line(self, line):
+        """
+        Match a line read from the device against the pending commands
+        :param line: line (bytes, without line ending), possibly prefixed with prompts
+        """
+        now = time.perf_counter()
+        prompt = self.prompt
+        with self.lock:
+            expired = self._expired(now)
+            while line.startswith(prompt):
+                self._prompt(now)
+                line = line[len(prompt):]
+            if line and self.pending:
+                head = self.pending[0]
+                if not head.echoed:
+                    if line.strip() == head.echo:
+                        head.echoed = True
+                elif not line.startswith(self.ASYNC_PREFIXES):
+                    head.lines.append(line)
+        self._timeout(expired)
+
+    def feed_prompts(self, count):
+        """
+        Complete replies with prompts ending the data read so far, which would only be seen with the next line
+        otherwise (see LineFramer.take_prompts)
+        :param count: number of prompts
+        """
+        if count:
+            now = time.perf_counter()
+            with self.lock:
+                expired = self._expired(now)
+                for _ in range(count):
+                    self._prompt(now)
+            self._timeout(expired)
+
+    def expire(self):
+        """
+        Fail the commands past their deadline, for readers that wait for replies while no data comes in
+        :return: number of commands failed
+        """
+        with self.lock:
+            expired = self._expired(time.perf_counter())
+        self._timeout(expired)
+        return len(expired)
+
+    def remove(self, futures, exc):
+        """
+        Fail and remove the commands of futures that are still pending, e.g. when their caller gave up
+        :param futures: futures returned by add()
+        :param exc: exception set on them
+        """
+        futures = set(futures)
+        with self.lock:
+            removed = [command for command in self.pending if command.future in futures]
+            if removed:
+                self.pending = deque(command for command in self.pending if command.future not in futures)
+        self._fail(removed, exc)
+
+    def fail(self, exc):
+        """ fail all pending commands, e.g. when the connection is lost """
+        with self.lock:
+            pending, self.pending = self.pending, deque()
+        self._fail(pending, exc)
+
+
 class Hdmi2UsbDevice(object):
     """
     Representation of a HDMI2USB Device
 
     """
     LOCALHOST = ['localhost', '127.0.0.1', '::1']
+    # commands that turn on the streaming debug/status messages
+    SUBSCRIBE_COMMANDS = ('debug input0 on', 'debug input1 on', 'status short on')
+    # event type of raw lines read from the device
+    LINE_EVENT = 'line'
+    # command prompt, printed without line ending after the reply to each command
+    PROMPT = b'HDMI2USB>'
 
     def __init__(self, host, port, hdmi2usbd=None):
         self.host = host
         self.port = port
         self.prog = hdmi2usbd or 'hdmi2usbd'
         self.sock = None  # type: socket.socket
+        self.commands = CommandQueue(self.PROMPT)
 
     @property
     def connected(self):
         return self.sock is not None
 
+    @property
+    def name(self):
+        """ name used to tag lines/events from this device """
+        return '{}:{}'.format(self.host, self.port)
+
+    def line_event(self, line, timestamp=None):
+        """
+        Create an event for a line read from this device
+        :param line: line (bytes, without line ending)
+        :return: Event with data {'device': name, 'line': line}
+        """
+        return Event(self.LINE_EVENT, data={'device': self.name, 'line': line}, timestamp=timestamp)
+
     def remoteaddr(self, host=None, port=None):
         if host is not None:
             self.host = host
@@ -50,6 +237,53 @@ class Hdmi2UsbDevice(object):
         if self.sock is not None:
             self.sock.close()
             self.sock = None
+        if self.commands:
+            self.commands.fail(ConnectionError('connection to {} closed'.format(self.name)))
+
+    def send_commands(self, *commands, **kwargs):
+        """
+        Send commands in a single write without waiting for their replies
+        Replies are matched as lines are read from the device: by the reader owning the socket
+        (FleetMonitor, AsyncDeviceReader or one that calls self.commands.feed_line), or by execute()
+        :param commands: commands (str, without line ending)
+        :param timeout: seconds to wait for the replies (default: self.commands.timeout)
+        :return: list of concurrent.futures.Future resolving to a CommandReply per command
+        """
+        data = b''.join(command.encode() + b'\r\n' for command in commands)
+        futures = self.commands.add(commands, kwargs.get('timeout'))
+        try:
+            self.sock.sendall(data)
+        except (OSError, AttributeError) as exc:
+            self.commands.fail(ConnectionError('sending to {} failed: {}'.format(self.name, exc)))
+        return futures
+
+    def execute(self, *commands, **kwargs):
+        """
+        Send commands and read from the device until all of them are answered (for clients that don't
+        otherwise read from the device: other lines read meanwhile are discarded)
+        :param timeout: seconds to wait for the replies (default: 10)
+        :return: list of CommandReply
+        :raise: TimeoutError (the commands are removed from the queue), ConnectionError
+        """
+        from .monitor import DeviceBuffer
+        timeout = kwargs.get('timeout', 10.0)
+        deadline = time.time() + timeout
+        futures = self.send_commands(*commands, timeout=timeout)
+        buffer = DeviceBuffer(self)
+        while not all(future.done() for future in futures):
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                exc = TimeoutError('no reply from {} to {}'.format(self.name, list(commands)))
+                self.commands.remove(futures, exc)
+                raise exc
+            if not select.select([self.sock], [], [], remaining)[0]:
+                continue
+            try:
+                if buffer.recv(self.sock) is None:
+                    self.close()
+            except (BlockingIOError, InterruptedError):
+                continue
+        return [future.result() for future in futures]
 
     def connect(self, host=None, port=None):
         address = self.remoteaddr(host, port)
@@ -58,6 +292,14 @@ class Hdmi2UsbDevice(object):
             self.sock.setblocking(0)
         return self.connected
 
+    async def open_stream(self, host=None, port=None):
+        """
+        Open an asyncio stream connection to hdmi2usbd
+        :return: (asyncio.StreamReader, asyncio.StreamWriter)
+        """
+        address = self.remoteaddr(host, port)
+        return await asyncio.open_connection(*address)
+
     def start_daemon(self, program=None):
         if program is not None:
             self.prog = program
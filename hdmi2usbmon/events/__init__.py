@@ -1,3 +1,12 @@
 from .events import *
+from .aio import SyncHandlerAdapter, AsyncEventDispatcher
+from .stats import STATS_EVENT, DispatcherStats, Histogram
+from .subscriptions import SubscriptionTrie, split_event_type
+from .queues import BoundedEventQueue
+from .pool import HandlerLane, PooledEventDispatcher
 
-__all__ = [ 'Event', 'EventHandler', 'EventDispatcher' ]
+__all__ = [ 'Event', 'intern_event_type', 'EventHandler', 'EventDispatcher', 'BatchStats',
+            'SyncHandlerAdapter', 'AsyncEventDispatcher',
+            'STATS_EVENT', 'DispatcherStats', 'Histogram',
+            'SubscriptionTrie', 'split_event_type', 'BoundedEventQueue',
+            'HandlerLane', 'PooledEventDispatcher' ]
@@ -0,0 +1,224 @@
+"""
+    asyncio event interface
+    Part of hdmi2usbd
+"""
+import asyncio
+import inspect
+import time
+
+from .events import BatchStats, Event, EventHandler, EventDispatcher, _handles_batches
+
+
+class SyncHandlerAdapter(EventHandler):
+    """
+    Adapter for a blocking (non-coroutine) handler
+    handle_event runs the wrapped handler in an executor so it doesn't stall the event loop
+    """
+    def __init__(self, handler, executor=None):
+        assert isinstance(handler, EventHandler)
+        self.handler = handler
+        self.executor = executor
+
+    def accept_event(self, event):
+        return self.handler.accept_event(event)
+
+    def handle_event(self, event):
+        loop = asyncio.get_event_loop()
+        return loop.run_in_executor(self.executor, self.handler.handle_event, event)
+
+    def event_types(self):
+        return self.handler.event_types()
+
+
+class AsyncEventDispatcher(EventDispatcher):
+    """
+    EventDispatcher using an asyncio.Queue
+    Handlers may be plain handlers or return awaitables (e.g. EventTypeHandler with a coroutine function),
+    which are awaited before the next handler is called.
+    send_event, dispatch_events and dispatch_batch are coroutines; every event taken from the queue is marked
+    done (asyncio.Queue.task_done) once its handlers have run, so eventq.join() waits for dispatch.
+    """
+
+    def __init__(self, maxsize=0, hclass=list, indexed=False):
+        super(AsyncEventDispatcher, self).__init__(qclass=lambda: asyncio.Queue(maxsize), hclass=hclass,
+                                                   indexed=indexed)
+
+    async def send_event(self, event, block=True, timeout=None):
+        """
+        Add an event to the event queue
+        :param event: event to queue
+        :param block: wait for space in the queue if it is full
+        :param timeout: wait timeout (block only)
+        :return: True if the event was queued
+        """
+        if event is not None:
+            assert isinstance(event, Event)
+            if self.stats is not None:
+                event.queued = time.monotonic()
+            try:
+                if not block:
+                    self.eventq.put_nowait(event)
+                else:
+                    await asyncio.wait_for(self.eventq.put(event), timeout)
+                return True
+            except (asyncio.QueueFull, asyncio.TimeoutError):
+                pass
+        return False
+
+    def send_event_nowait(self, event):
+        """
+        Add an event to the event queue without waiting, for use from synchronous code on the loop
+        :return: True if the event was queued
+        """
+        if event is not None:
+            assert isinstance(event, Event)
+            if self.stats is not None:
+                event.queued = time.monotonic()
+            try:
+                self.eventq.put_nowait(event)
+                return True
+            except asyncio.QueueFull:
+                pass
+        return False
+
+    async def dispatch_events(self, *events, **kwargs):
+        """
+        Dispatch events in the queue
+        :param events: zero or more events to add to the queue before dispatch
+        :param loop: whether to keep waiting for events (until cancelled)
+        :param timeout: wait timeout
+        """
+        loop = kwargs.get('loop', False)
+        block = kwargs.get('block', True)
+        timeout = kwargs.get('timeout', None)
+        hcount = qcount = 0
+        for event in events:
+            if not await self.send_event(event, block, timeout):
+                break
+            qcount += 1
+        while loop or not self.eventq.empty():
+            try:
+                if loop:
+                    event = await asyncio.wait_for(self.eventq.get(), timeout)
+                else:
+                    event = self.eventq.get_nowait()
+            except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                continue
+            try:
+                hcount += await self._dispatch_event(event)
+            finally:
+                self.eventq.task_done()
+        return qcount, hcount
+
+    async def _get_batch(self, max_events, max_latency):
+        """
+        Take up to max_events events from the queue
+        :param max_latency: seconds to keep collecting events, None or 0 only takes what is already queued
+        :return: list of events
+        """
+        eventq = self.eventq
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + max_latency if max_latency else None
+        batch = list()
+        while len(batch) < max_events:
+            try:
+                if deadline is None or not eventq.empty():
+                    batch.append(eventq.get_nowait())
+                else:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0.0:
+                        break
+                    batch.append(await asyncio.wait_for(eventq.get(), remaining))
+            except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                break
+        return batch
+
+    async def dispatch_batch(self, max_events=1024, max_latency=None):
+        """
+        Dispatch a batch of events from the queue, as EventDispatcher.dispatch_batch
+        Handlers that override handle_events get all the events they accept in one call after the
+        other handlers have been called; awaitables returned by handlers are awaited in turn.
+        :param max_events: maximum number of events to dispatch
+        :param max_latency: seconds to keep collecting events before dispatching, None or 0 to not wait
+        :return: BatchStats
+        """
+        stats = self.stats
+        if stats is not None:
+            stats.queue_depth.add(self.eventq.qsize())
+        start = time.time()
+        batch = await self._get_batch(max_events, max_latency)
+        dispatched = time.time()
+        if stats is not None:
+            self._record_waits(batch)
+        hcount = 0
+        batches = dict()
+        handlers = tuple(self.handlerq)
+        linear = tuple((handler, True) for handler in handlers)
+        try:
+            for event in batch:
+                route = self._route(event.event_type) if self.indexed else linear
+                for handler, check in route:
+                    if not check or handler.accept_event(event):
+                        if _handles_batches(handler):
+                            batches.setdefault(handler, []).append(event)
+                            continue
+                        await self._call(handler, handler.handle_event, event, 1)
+                        hcount += 1
+            for handler in handlers:
+                events = batches.get(handler)
+                if events:
+                    await self._call(handler, handler.handle_events, events, len(events))
+                    hcount += len(events)
+        finally:
+            for _ in batch:
+                self.eventq.task_done()
+        if stats is not None and batch:
+            stats.batches += 1
+            stats.events += len(batch)
+        return BatchStats(len(batch), hcount, dispatched - start, time.time() - dispatched)
+
+    async def _call(self, handler, method, argument, calls):
+        """
+        Call a handler method and await its result if it is awaitable
+        With stats enabled the call is timed as EventDispatcher._timed_call, including the time awaited
+        """
+        stats = self.stats
+        if stats is None:
+            result = method(argument)
+            if inspect.isawaitable(result):
+                await result
+            return
+        counters = stats.handler(handler)
+        start = time.perf_counter()
+        try:
+            result = method(argument)
+            if inspect.isawaitable(result):
+                await result
+        finally:
+            counters[0] += calls
+            counters[1] += time.perf_counter() - start
+
+    async def _dispatch_event(self, event):
+        """
+        Call the handlers that accept an event, recording the queue depth and wait time with stats enabled
+        :return: number of handlers called
+        """
+        stats = self.stats
+        if stats is not None:
+            stats.queue_depth.add(self.eventq.qsize())
+            self._record_waits((event,))
+            stats.events += 1
+        hcount = 0
+        if self.indexed:
+            route = self._route(event.event_type)
+        else:
+            route = tuple((handler, True) for handler in self.handlerq)
+        for handler, check in route:
+            if not check or handler.accept_event(event):
+                await self._call(handler, handler.handle_event, event, 1)
+                hcount += 1
+        return hcount
+
+    async def run(self):
+        """ Dispatch events until cancelled """
+        return await self.dispatch_events(loop=True)
@@ -3,32 +3,67 @@
     Part of hdmi2usbd
 """
 from abc import ABCMeta, abstractmethod
+from collections import OrderedDict, namedtuple
+import sys
 import time
 import six
 # Fix for py2.x with `pip install future`
 # noinspection PyCompatibility
 import queue
 
+from .stats import DispatcherStats
+from .subscriptions import SubscriptionTrie, is_pattern
+
+ROUTE_CACHE_SIZE = 1024
+_event_types = dict()
+
+
+def intern_event_type(event_type):
+    """
+    Split a comma separated event type string into a tuple of interned type names
+    Results are cached per string, so events of the same type share one tuple. The cache is not bounded: type
+    strings come from code and device names, and clearing it would make every hot type miss again.
+    :param event_type: event type string, e.g. 'dvisampler' or 'basic,error'
+    :return: tuple of str
+    """
+    types = _event_types.get(event_type)
+    if types is None:
+        types = tuple(sys.intern(str(name)) for name in event_type.split(','))
+        _event_types[event_type] = types
+    return types
+
 
 class Event(object):
     """
     Event: container for an event
-    records timestamp, event_type, and optionally data for the event
+    records timestamp, event_type (tuple of type names), and optionally data for the event
+    queued is set (time.monotonic()) by the send_event of a dispatcher with stats enabled, to measure queue waits
     """
-    __slots__ = ('timestamp', 'event_type', 'data')
+    __slots__ = ('timestamp', 'event_type', 'data', 'queued')
     DEFAULT_EVENT_TYPE = 'basic'
 
     def __init__(self, event_type=None, data=None, timestamp=None):
-        if isinstance(event_type, Event):
+        """
+        :param event_type: comma separated type string, list/tuple of type names, or an Event to copy
+        :param data: data related to the event
+        :param timestamp: event time, e.g. read once per batch of lines by the reader (default: time.time())
+        """
+        if type(event_type) is str:
+            types = _event_types.get(event_type)
+            self.event_type = intern_event_type(event_type) if types is None else types
+        elif isinstance(event_type, Event):
             self.timestamp = event_type.timestamp
             self.event_type = event_type.event_type
             self.data = event_type.data
+            return
+        elif event_type is None:
+            self.event_type = intern_event_type(self.DEFAULT_EVENT_TYPE)
+        elif isinstance(event_type, six.string_types):
+            self.event_type = intern_event_type(event_type)
         else:
-            event_type = Event.DEFAULT_EVENT_TYPE if event_type is None else event_type
-            if isinstance(event_type, six.string_types):
-                event_type = event_type.split(',')
-            self.timestamp = time.time() if timestamp is None else timestamp
-            self.data = data
+            self.event_type = tuple(event_type)
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.data = data
 
     @staticmethod
     def create_event(event_type=None, data=None, timestamp=None, _class=None):
@@ -67,10 +102,29 @@ class EventHandler(object):
         """
         pass
 
+    def handle_events(self, events):
+        """
+        handle_events: handle a batch of accepted events, used by EventDispatcher.dispatch_batch
+        Handlers that override this get the whole batch in one call instead of one handle_event call per event
+        :param events: list of events to handle, in queue order
+        """
+        for event in events:
+            self.handle_event(event)
+
+    def event_types(self):
+        """
+        event_types: event types this handler accepts, used by indexed dispatch
+        Types may be patterns such as 'dvisampler.*' (see subscriptions)
+        :return: iterable of event types, or None if accept_event must be called for every event
+        """
+        return None
+
 
 class EventTypeHandler(EventHandler):
     """
     Genmeric handler based on type and callable
+    Types may be patterns such as 'dvisampler.*' or 'status.output*' (see subscriptions, ValueError for
+    unsupported patterns)
     """
     def __init__(self, func, *types):
         self.func=func
@@ -80,6 +134,12 @@ class EventTypeHandler(EventHandler):
                 self.filter_only.extend(type)
             else:
                 self.filter_only.append(type)
+        self.patterns = None
+        for pattern in self.filter_only:
+            if is_pattern(pattern):
+                if self.patterns is None:
+                    self.patterns = SubscriptionTrie()
+                self.patterns.add(pattern, True)
 
     def accept_event(self, event):
         if not self.filter_only:
@@ -87,17 +147,131 @@ class EventTypeHandler(EventHandler):
         for event_type in event.event_type:
             if event_type in self.filter_only:
                 return True
-        return False
+        return self.patterns is not None and bool(self.patterns.match(event.event_type))
 
     def handle_event(self, event):
         return self.func(event)
 
+    def event_types(self):
+        # an empty filter accepts everything, so treat it like any other catch-all handler
+        return tuple(self.filter_only) or None
+
+
+def _handles_batches(handler):
+    """ True if the handler overrides EventHandler.handle_events """
+    return getattr(type(handler), 'handle_events', None) is not EventHandler.handle_events
+
+
+BatchStats = namedtuple('BatchStats', ('events', 'handled', 'wait_time', 'dispatch_time'))
+BatchStats.__doc__ = """
+Result of EventDispatcher.dispatch_batch
+events: number of events taken from the queue
+handled: number of handler calls (a handle_events call counts once per event in its batch)
+wait_time: seconds spent waiting for and collecting events
+dispatch_time: seconds spent in handlers
+"""
+
 
 class EventDispatcher(object):
 
-    def __init__(self, qclass=queue.Queue, hclass=list):
+    def __init__(self, qclass=queue.Queue, hclass=list, indexed=False):
+        """
+        :param qclass: event queue class
+        :param hclass: handler list class
+        :param indexed: route events through a precomputed event_type -> handler index
+        """
         self.eventq = qclass()
         self.handlerq = hclass()
+        self.indexed = indexed
+        self._index = None
+        self._patterns = None
+        self._routes = OrderedDict()
+        self.stats = None  # type: DispatcherStats
+
+    def enable_stats(self, enabled=True):
+        """
+        Turn instrumentation on or off, enabling it again starts from zero
+        When disabled (the default) dispatch only pays for one attribute test per handler call
+        :return: DispatcherStats or None
+        """
+        self.stats = DispatcherStats() if enabled else None
+        return self.stats
+
+    def snapshot(self):
+        """
+        :return: dict of the dispatcher counters (handler calls and time, queue depth and wait time histograms,
+                 and the counters of queues that keep some, e.g. BoundedEventQueue), None when stats are disabled
+        """
+        stats = self.stats
+        if stats is None:
+            return None
+        snapshot = stats.snapshot(tuple(self.handlerq))
+        if hasattr(self.eventq, 'stats'):
+            snapshot['queue'] = self.eventq.stats()
+        return snapshot
+
+    def _invalidate_routes(self):
+        self._index = None
+        self._routes = OrderedDict()
+
+    def _build_index(self):
+        """
+        Build the event_type -> [(position, handler)] index of the handlers declaring event types, with their
+        patterns compiled into a SubscriptionTrie of positions
+        Handlers without declared event types are stored under None and checked with accept_event
+        """
+        index = dict()
+        trie = SubscriptionTrie()
+        for position, handler in enumerate(self.handlerq):
+            types = handler.event_types()
+            if types is None:
+                index.setdefault(None, []).append((position, handler))
+            else:
+                for event_type in set(types):
+                    if is_pattern(event_type):
+                        trie.add(event_type, position)
+                    else:
+                        index.setdefault(event_type, []).append((position, handler))
+        self._index = index
+        self._patterns = trie if trie.patterns else None
+        return index
+
+    def _route(self, event_type):
+        """
+        Look up the handlers for an event type tuple, in handler list order
+        Routes are memoized in a least recently used cache of ROUTE_CACHE_SIZE event types,
+        cleared when handlers are added or removed
+        :param event_type: event type list/tuple of an event
+        :return: tuple of (handler, check) pairs, check is True when accept_event must still be called
+        """
+        routes = self._routes
+        try:
+            route = routes[event_type]
+        except (KeyError, TypeError):
+            return self._add_route(event_type)
+        routes.move_to_end(event_type)
+        return route
+
+    def _add_route(self, event_type):
+        key = tuple(event_type)
+        index = self._index
+        if index is None:
+            index = self._build_index()
+        matched = dict()
+        for position, handler in index.get(None, ()):
+            matched[position] = (handler, True)
+        for name in key:
+            for position, handler in index.get(name, ()):
+                matched[position] = (handler, False)
+        if self._patterns is not None:
+            for position in self._patterns.match(key):
+                matched[position] = (self.handlerq[position], False)
+        route = tuple(matched[position] for position in sorted(matched))
+        routes = self._routes
+        routes[key] = route
+        if len(routes) > ROUTE_CACHE_SIZE:
+            routes.popitem(last=False)
+        return route
 
     def add_handler(self, handler, at_pos=None):
         """
@@ -114,6 +288,7 @@ class EventDispatcher(object):
                 self.handlerq.insert(0, handler)
             else:
                 self.handlerq.insert(int(at_pos), handler)
+            self._invalidate_routes()
             return True
         return False
 
@@ -126,20 +301,24 @@ class EventDispatcher(object):
         if handler is None:
             self.handlerq.clear()
         elif handler in self.handlerq:
-            assert issubclass(handler, EventHandler)
+            assert isinstance(handler, EventHandler)
             del self.handlerq[self.handlerq.index(handler)]
         else:
             return False
+        self._invalidate_routes()
         return True
 
     def send_event(self, event, block=True, timeout=None):
         """
         Add an event to the event queue
         :param event: event to queue
+        :return: False if the event was not queued (queue full, see BoundedEventQueue for bounded policies)
         note: blocks
         """
         if event is not None:
             assert isinstance(event, Event)
+            if self.stats is not None:
+                event.queued = time.monotonic()
             try:
                 self.eventq.put(event, block, timeout)
                 return True
@@ -170,8 +349,148 @@ class EventDispatcher(object):
                 event = self.eventq.get(loop, timeout)
             except queue.Empty:
                 continue
+            hcount += self._dispatch_event(event)
+        return qcount, hcount
+
+    def _get_batch(self, max_events, max_latency):
+        """
+        Take up to max_events events from the queue
+        For queue.Queue (and subclasses) all events are taken under a single acquisition of the queue mutex,
+        through the queue.Queue storage methods _qsize() and _get(): subclasses must keep their semantics
+        (_qsize() the number of events _get() can return, _get() removing and returning the next one),
+        as BoundedEventQueue does. Other queue classes are read with get(False).
+        :param max_events: maximum number of events to take
+        :param max_latency: seconds to keep collecting events, None or 0 only takes what is already queued
+        :return: list of events
+        """
+        eventq = self.eventq
+        # monotonic: a wall clock adjustment must not stretch or cut the collection time
+        deadline = time.monotonic() + max_latency if max_latency else None
+        batch = list()
+        if not isinstance(eventq, queue.Queue):
+            while len(batch) < max_events:
+                try:
+                    if deadline is None:
+                        batch.append(eventq.get(False))
+                    else:
+                        batch.append(eventq.get(True, max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            return batch
+        with eventq.not_empty:
+            while True:
+                count = min(max_events - len(batch), eventq._qsize())
+                if count > 0:
+                    batch.extend(eventq._get() for _ in range(count))
+                    eventq.not_full.notify(count)
+                if len(batch) >= max_events or deadline is None:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0.0:
+                    break
+                eventq.not_empty.wait(remaining)
+        return batch
+
+    def dispatch_batch(self, max_events=1024, max_latency=None):
+        """
+        Dispatch a batch of events from the queue
+        Handlers that override handle_events get all the events they accept in one call after the
+        other handlers have been called; all other handlers get one handle_event call per event, in order.
+        :param max_events: maximum number of events to dispatch
+        :param max_latency: seconds to keep collecting events before dispatching, None or 0 to not wait
+        :return: BatchStats
+        """
+        stats = self.stats
+        if stats is not None:
+            stats.queue_depth.add(self.eventq.qsize())
+        start = time.time()
+        batch = self._get_batch(max_events, max_latency)
+        dispatched = time.time()
+        if stats is not None:
+            self._record_waits(batch)
+        hcount = 0
+        batches = dict()
+        handlers = tuple(self.handlerq)
+        linear = tuple((handler, True) for handler in handlers)
+        for event in batch:
+            route = self._route(event.event_type) if self.indexed else linear
+            for handler, check in route:
+                if not check or handler.accept_event(event):
+                    if _handles_batches(handler):
+                        batches.setdefault(handler, []).append(event)
+                        continue
+                    if stats is None:
+                        handler.handle_event(event)
+                    else:
+                        self._timed_call(handler, handler.handle_event, event, 1)
+                    hcount += 1
+        for handler in handlers:
+            events = batches.get(handler)
+            if events:
+                if stats is None:
+                    handler.handle_events(events)
+                else:
+                    self._timed_call(handler, handler.handle_events, events, len(events))
+                hcount += len(events)
+        if stats is not None and batch:
+            stats.batches += 1
+            stats.events += len(batch)
+        return BatchStats(len(batch), hcount, dispatched - start, time.time() - dispatched)
+
+    def _record_waits(self, events):
+        """
+        Add the time events spent in the queue to the stats, measured from their enqueue time (Event.queued)
+        rather than their timestamp, which is the read time and may come from another clock
+        """
+        now = time.monotonic()
+        add_wait = self.stats.wait_time.add
+        for event in events:
+            queued = getattr(event, 'queued', None)
+            if queued is not None:
+                add_wait(max(0.0, now - queued))
+
+    def _timed_call(self, handler, method, argument, calls):
+        counters = self.stats.handler(handler)
+        start = time.perf_counter()
+        try:
+            method(argument)
+        finally:
+            counters[0] += calls
+            counters[1] += time.perf_counter() - start
+
+    def _dispatch_event(self, event):
+        """
+        Call the handlers that accept an event
+        :return: number of handlers called
+        """
+        if self.stats is not None:
+            return self._dispatch_event_timed(event)
+        hcount = 0
+        if self.indexed:
+            for handler, check in self._route(event.event_type):
+                if not check or handler.accept_event(event):
+                    handler.handle_event(event)
+                    hcount += 1
+        else:
             for handler in tuple(self.handlerq):
                 if handler.accept_event(event):
                     handler.handle_event(event)
                     hcount += 1
-        return qcount, hcount
+        return hcount
+
+    def _dispatch_event_timed(self, event):
+        """ _dispatch_event, recording the queue depth, the event wait time and the handler timings """
+        stats = self.stats
+        stats.queue_depth.add(self.eventq.qsize())
+        self._record_waits((event,))
+        stats.events += 1
+        if self.indexed:
+            route = self._route(event.event_type)
+        else:
+            route = tuple((handler, True) for handler in self.handlerq)
+        hcount = 0
+        for handler, check in route:
+            if not check or handler.accept_event(event):
+                self._timed_call(handler, handler.handle_event, event, 1)
+                hcount += 1
+        return hcount
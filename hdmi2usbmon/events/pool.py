@@ -0,0 +1,267 @@
+"""
+Event dispatch on a thread pool: each handler runs on its own serial lane, so it sees its events in order,
+while different handlers run in parallel and a slow handler (disk writer, HTTP push) no longer holds up the
+others or the thread reading the devices.
+"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import queue
+import threading
+import time
+
+from .events import BatchStats, EventDispatcher, _handles_batches
+from .stats import handler_name
+
+# seconds join() waits between checks of the lanes, in case it missed the notification of an idle lane
+JOIN_POLL = 0.1
+
+
+class HandlerLane(object):
+    """
+    Serial work queue of one handler: at most one pool thread runs it at a time, taking its batches in order
+    """
+
+    def __init__(self, handler, executor, timeout=None, max_pending=10000, on_error=None, idle=None):
+        """
+        :param timeout: seconds a handler call may take; while a call runs longer, the lane is stalled and new
+                        events for it are dropped instead of piling up behind it
+        :param max_pending: maximum number of events waiting, the oldest batches are dropped beyond that
+        :param on_error: callable (handler, exception) for exceptions raised by the handler
+        :param idle: threading.Condition notified when the lane runs out of work
+        """
+        self.handler = handler
+        self.executor = executor
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self.on_error = on_error
+        self.idle = idle
+        self.batch_calls = _handles_batches(handler)
+        self.lock = threading.Lock()
+        self.batches = deque()
+        self.pending = 0
+        self.running = False
+        self.started = None  # start of the current handler call
+        self.calls = 0
+        self.seconds = 0.0
+        self.errors = 0
+        self.last_error = None
+        self.dropped = 0
+        self.timeouts = 0
+
+    @property
+    def stalled(self):
+        started = self.started
+        return self.timeout is not None and started is not None and time.perf_counter() - started > self.timeout
+
+    def submit(self, events):
+        """
+        Queue a batch of events for the handler
+        :return: False if the events were dropped because the handler is stalled
+        """
+        with self.lock:
+            if self.stalled:
+                self.dropped += len(events)
+                return False
+            self.batches.append(events)
+            self.pending += len(events)
+            while self.pending > self.max_pending and len(self.batches) > 1:
+                dropped = self.batches.popleft()
+                self.pending -= len(dropped)
+                self.dropped += len(dropped)
+            if self.running:
+                return True
+            self.running = True
+        self.executor.submit(self.run)
+        return True
+
+    def run(self):
+        handler = self.handler
+        done = False
+        try:
+            while True:
+                with self.lock:
+                    if not self.batches:
+                        self.running = False
+                        done = True
+                        break
+                    events = self.batches.popleft()
+                    self.pending -= len(events)
+                self.started = start = time.perf_counter()
+                try:
+                    if self.batch_calls:
+                        # a batch handler takes the batch as one unit
+                        self._call(handler.handle_events, events)
+                        self.calls += len(events)
+                    else:
+                        # an exception only costs the event that raised it
+                        for event in events:
+                            self._call(handler.handle_event, event)
+                            self.calls += 1
+                finally:
+                    self.started = None
+                    elapsed = time.perf_counter() - start
+                    self.seconds += elapsed
+                    if self.timeout is not None and elapsed > self.timeout:
+                        self.timeouts += 1
+        finally:
+            if not done:
+                # the loop was cut short (e.g. KeyboardInterrupt): let the next submit() start the lane again
+                with self.lock:
+                    self.running = False
+            if self.idle is not None:
+                with self.idle:
+                    self.idle.notify_all()
+
+    def _call(self, method, argument):
+        """ Call a handler method, exceptions are counted and passed to on_error """
+        try:
+            method(argument)
+        except Exception as exc:
+            self.errors += 1
+            self.last_error = exc
+            self._report(exc)
+
+    def _report(self, exc):
+        """ Pass a handler exception to on_error, an exception raised by on_error itself is only counted """
+        if self.on_error is None:
+            return
+        try:
+            self.on_error(self.handler, exc)
+        except Exception as error:
+            self.errors += 1
+            self.last_error = error
+
+    def snapshot(self):
+        return dict(pending=self.pending, calls=self.calls, seconds=self.seconds, errors=self.errors,
+                    dropped=self.dropped, timeouts=self.timeouts, stalled=self.stalled)
+
+
+class PooledEventDispatcher(EventDispatcher):
+    """
+    EventDispatcher that runs handlers on a ThreadPoolExecutor
+    accept_event is still called on the dispatching thread; accepted events go to the HandlerLane of each handler.
+    Exceptions raised by handlers are counted per lane (and passed to on_error), they don't reach the dispatcher.
+    dispatch_batch and dispatch_events return as soon as the events are handed to the lanes, join() waits
+    until the handlers are done with them.
+    """
+
+    def __init__(self, qclass=queue.Queue, hclass=list, indexed=False, max_workers=None, timeout=None,
+                 max_pending=10000, on_error=None):
+        """
+        :param max_workers: pool threads (default: ThreadPoolExecutor's default), a stalled handler holds one
+        :param timeout: default handler call timeout in seconds (see HandlerLane), add_handler can set one per handler
+        :param max_pending: maximum number of events waiting per handler
+        :param on_error: callable (handler, exception) called on the pool thread for handler exceptions
+        """
+        super(PooledEventDispatcher, self).__init__(qclass, hclass, indexed)
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix='EventHandler')
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self.on_error = on_error
+        self.idle = threading.Condition()
+        self.lanes = dict()  # handler -> HandlerLane
+
+    def add_handler(self, handler, at_pos=None, timeout=None):
+        """
+        :param timeout: call timeout of this handler (default: the dispatcher timeout)
+        """
+        added = super(PooledEventDispatcher, self).add_handler(handler, at_pos)
+        if added:
+            self.lanes[handler] = HandlerLane(handler, self.executor, self.timeout if timeout is None else timeout,
+                                              self.max_pending, self.on_error, self.idle)
+        return added
+
+    def remove_handler(self, handler):
+        """ Remove a handler (None for all), events already handed to its lane are still handled """
+        removed = super(PooledEventDispatcher, self).remove_handler(handler)
+        if removed:
+            for known in list(self.lanes):
+                if known not in self.handlerq:
+                    del self.lanes[known]
+        return removed
+
+    def _routes_for(self, event):
+        if self.indexed:
+            return self._route(event.event_type)
+        return tuple((handler, True) for handler in self.handlerq)
+
+    def _dispatch_event(self, event):
+        """
+        Hand an event to the lanes of the handlers that accept it
+        :return: number of lanes it was handed to
+        """
+        stats = self.stats
+        if stats is not None:
+            stats.queue_depth.add(self.eventq.qsize())
+            self._record_waits((event,))
+            stats.events += 1
+        hcount = 0
+        for handler, check in self._routes_for(event):
+            if not check or handler.accept_event(event):
+                self.lanes[handler].submit([event])
+                hcount += 1
+        return hcount
+
+    def dispatch_batch(self, max_events=1024, max_latency=None):
+        """
+        Take a batch of events from the queue and hand each handler the events it accepts in one lane batch
+        :return: BatchStats (dispatch_time: time spent handing the events to the lanes)
+        """
+        stats = self.stats
+        if stats is not None:
+            stats.queue_depth.add(self.eventq.qsize())
+        start = time.time()
+        batch = self._get_batch(max_events, max_latency)
+        dispatched = time.time()
+        accepted = dict()
+        for event in batch:
+            for handler, check in self._routes_for(event):
+                if not check or handler.accept_event(event):
+                    accepted.setdefault(handler, []).append(event)
+        hcount = 0
+        for handler, events in accepted.items():
+            self.lanes[handler].submit(events)
+            hcount += len(events)
+        if stats is not None and batch:
+            stats.batches += 1
+            stats.events += len(batch)
+            self._record_waits(batch)
+        return BatchStats(len(batch), hcount, dispatched - start, time.time() - dispatched)
+
+    def busy(self):
+        """ :return: True while any lane has events queued or running """
+        return any(lane.running for lane in list(self.lanes.values()))
+
+    def join(self, timeout=None):
+        """
+        Wait until the handlers are done with all events handed to them (stalled lanes are waited for too)
+        :param timeout: seconds to wait at most, None to wait until done
+        :return: True if all lanes are idle
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self.idle:
+            while self.busy():
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.idle.wait(JOIN_POLL if remaining is None else min(remaining, JOIN_POLL))
+        return True
+
+    def shutdown(self, timeout=None):
+        """
+        Wait for the handlers (see join) and stop the pool threads
+        :return: True if all lanes were idle
+        """
+        done = self.join(timeout)
+        self.executor.shutdown(wait=done)
+        return done
+
+    def snapshot(self):
+        """
+        :return: EventDispatcher.snapshot() with the lane counters per handler under 'lanes'
+                 (lane counters are kept even when stats are disabled)
+        """
+        snapshot = super(PooledEventDispatcher, self).snapshot() or dict()
+        snapshot['lanes'] = [dict(handler=handler_name(handler), **self.lanes[handler].snapshot())
+                             for handler in self.handlerq if handler in self.lanes]
+        return snapshot
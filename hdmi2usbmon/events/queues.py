@@ -0,0 +1,137 @@
+"""
+Bounded event queues for EventDispatcher(qclass=...), with explicit backpressure policies and priority lanes
+
+They are queue.Queue subclasses, so EventDispatcher.dispatch_batch still takes a batch under one lock.
+"""
+from collections import deque
+import queue
+
+# what put() does when the queue is full
+BLOCK = 'block'                # wait for room (or raise queue.Full after the timeout / when not blocking)
+DROP_OLDEST = 'drop-oldest'    # drop the oldest event of the lowest priority lane, unless all are more urgent
+DROP_NEWEST = 'drop-newest'    # drop the new event, unless an event of a lower priority lane can be dropped
+COALESCE = 'coalesce'          # replace the queued event with the same key, otherwise drop-oldest
+POLICIES = (BLOCK, DROP_OLDEST, DROP_NEWEST, COALESCE)
+
+
+class BoundedEventQueue(queue.Queue):
+    """
+    Event queue holding at most maxsize events, in priority lanes: get() returns the oldest event of the highest
+    priority lane (lane 0) that isn't empty, so urgent events overtake routine ones.
+
+    With the COALESCE policy, an event whose key(event) is not None replaces the queued event with the same key
+    (in its place in the queue) whether or not the queue is full, so only the latest value per key waits.
+    """
+
+    def __init__(self, maxsize=10000, policy=DROP_OLDEST, priority=None, lanes=1, key=None):
+        """
+        :param maxsize: maximum number of queued events (0: unbounded, the policy never applies)
+        :param policy: BLOCK, DROP_OLDEST, DROP_NEWEST or COALESCE
+        :param priority: callable event -> lane number, 0 being the most urgent (default: all events in lane 0)
+        :param lanes: number of priority lanes, lane numbers beyond are clamped
+        :param key: callable event -> hashable key or None, used by COALESCE
+        """
+        if policy not in POLICIES:
+            raise ValueError('unknown queue policy {!r}'.format(policy))
+        if policy == COALESCE and key is None:
+            raise ValueError('the coalesce policy needs a key function')
+        self.policy = policy
+        self.priority = priority
+        self.lane_count = max(1, lanes)
+        self.key = key if policy == COALESCE else None
+        self.dropped = 0
+        self.coalesced = 0
+        self.rejected = 0
+        queue.Queue.__init__(self, maxsize)
+
+    # queue.Queue storage
+
+    def _init(self, maxsize):
+        self.lanes = [deque() for _ in range(self.lane_count)]
+        self.keys = dict()  # key -> queued cell, for COALESCE
+        self.count = 0
+
+    def _qsize(self):
+        return self.count
+
+    def _lane(self, event):
+        if self.priority is None:
+            return 0
+        return min(max(0, self.priority(event)), self.lane_count - 1)
+
+    def _put(self, event):
+        # events are queued in cells [event, key] so a coalesced event can take the place of the queued one
+        key = self.key(event) if self.key is not None else None
+        cell = [event, key]
+        self.lanes[self._lane(event)].append(cell)
+        if key is not None:
+            self.keys[key] = cell
+        self.count += 1
+
+    def _get(self):
+        for lane in self.lanes:
+            if lane:
+                return self._remove(lane.popleft())
+        raise IndexError('pop from an empty queue')
+
+    def _remove(self, cell):
+        event, key = cell
+        if key is not None and self.keys.get(key) is cell:
+            del self.keys[key]
+        self.count -= 1
+        return event
+
+    # backpressure
+
+    def put(self, event, block=True, timeout=None):
+        """
+        Queue an event, applying the policy when the queue is full
+        Raises queue.Full when the event is not queued (BLOCK after the timeout, or a dropped new event: all queued
+        events are more urgent, or as urgent with DROP_NEWEST)
+        """
+        if self.policy == BLOCK:
+            return queue.Queue.put(self, event, block, timeout)
+        with self.not_full:
+            if self.key is not None:
+                key = self.key(event)
+                cell = self.keys.get(key) if key is not None else None
+                if cell is not None:
+                    cell[0] = event
+                    self.coalesced += 1
+                    return
+            if 0 < self.maxsize <= self.count:
+                number = self._lane(event)
+                if self.policy == DROP_NEWEST:
+                    victim = self._lowest_lane(number)
+                else:
+                    # never drop a more urgent event than the new one
+                    victim = self._lowest_lane(number - 1)
+                if victim is None:
+                    self.rejected += 1
+                    raise queue.Full
+                if self.policy == DROP_NEWEST:
+                    self._remove(victim.pop())
+                else:
+                    self._remove(victim.popleft())
+                # a dropped event will never be marked done
+                self.unfinished_tasks -= 1
+                self.dropped += 1
+            self._put(event)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+
+    def _lowest_lane(self, above):
+        """ :return: the lowest priority lane holding events, of the lanes numbered higher than above, or None """
+        for number in range(self.lane_count - 1, above, -1):
+            if self.lanes[number]:
+                return self.lanes[number]
+        return None
+
+    def stats(self):
+        """
+        :return: dict of queue counters: depth per lane, events dropped to make room, events coalesced into a
+                 queued one, new events rejected
+        """
+        with self.mutex:
+            return dict(depth=[len(lane) for lane in self.lanes], maxsize=self.maxsize, policy=self.policy,
+                        dropped=self.dropped, coalesced=self.coalesced, rejected=self.rejected)
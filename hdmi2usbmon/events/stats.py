@@ -0,0 +1,94 @@
+"""
+    Dispatcher instrumentation: handler timings and event queue histograms
+    Part of hdmi2usbd
+"""
+from bisect import bisect_left
+import time
+
+STATS_EVENT = 'stats'
+
+# time from send_event to dispatch in seconds: 1us .. ~16s
+WAIT_BOUNDS = tuple(1e-6 * 2 ** power for power in range(25))
+# events in the queue when a dispatch starts
+DEPTH_BOUNDS = (0,) + tuple(2 ** power for power in range(17))
+
+
+class Histogram(object):
+    """
+    Fixed bucket histogram, counts[i] counts values <= bounds[i] (and > bounds[i-1]), the last bucket the rest
+    """
+    __slots__ = ('bounds', 'counts', 'count', 'sum')
+
+    def __init__(self, bounds):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0
+
+    def add(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def percentile(self, fraction):
+        """
+        :return: upper bound of the bucket holding the given fraction of values (None if above all bounds)
+        """
+        if not self.count:
+            return 0
+        target = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return None
+
+    def snapshot(self):
+        return dict(bounds=list(self.bounds), counts=list(self.counts), count=self.count, sum=self.sum)
+
+
+def handler_name(handler):
+    """ readable name for a handler: the function of an EventTypeHandler, else its class """
+    func = getattr(handler, 'func', None)
+    if func is not None:
+        return getattr(func, '__qualname__', None) or getattr(func, '__name__', None) or repr(func)
+    return handler.__class__.__name__
+
+
+class DispatcherStats(object):
+    """
+    Counters kept by an EventDispatcher with stats enabled
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.events = 0
+        self.batches = 0
+        self.handlers = dict()  # handler -> [calls, seconds]
+        self.queue_depth = Histogram(DEPTH_BOUNDS)
+        self.wait_time = Histogram(WAIT_BOUNDS)
+
+    def handler(self, handler):
+        """ :return: the [calls, seconds] counters of a handler """
+        counters = self.handlers.get(handler)
+        if counters is None:
+            counters = self.handlers[handler] = [0, 0.0]
+        return counters
+
+    def snapshot(self, handlers=()):
+        """
+        :param handlers: handler list of the dispatcher, giving the order of the handler entries
+        :return: dict of plain values
+        """
+        order = list(handlers) + [handler for handler in self.handlers if handler not in handlers]
+        return dict(
+            uptime=time.time() - self.started,
+            events=self.events,
+            batches=self.batches,
+            handlers=[dict(handler=handler_name(handler), calls=self.handlers[handler][0],
+                           seconds=self.handlers[handler][1])
+                      for handler in order if handler in self.handlers],
+            queue_depth=self.queue_depth.snapshot(),
+            wait_time=self.wait_time.snapshot(),
+        )
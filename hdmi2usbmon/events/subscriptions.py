@@ -0,0 +1,127 @@
+"""
+Wildcard and hierarchical event type subscriptions
+
+Event type names are split into segments at '.', ':' and '/' ('device:opsis-07/dvisampler' has the segments
+device, opsis-07 and dvisampler). A subscription pattern is matched segment by segment:
+- a plain segment matches the same segment
+- 'prefix*' matches one segment starting with prefix ('status.output*' matches 'status.output0')
+- '*' matches any one segment, and as the last segment any number (at least one) of further segments
+  ('dvisampler.*' matches 'dvisampler.fifo_overflow', 'device:opsis-07/*' matches 'device:opsis-07/input1/wer')
+A pattern without '*' only matches the same type name. '*' anywhere else in a segment ('a*b', '*b') is rejected
+with a ValueError.
+
+The events hdmi2usbmon produces have flat types ('line', 'dvisampler', 'fifo_overflow', 'state', ...), which only
+have one segment: hierarchical patterns such as 'device:opsis-07/*' match types emitted by user code, e.g.
+Event('device:opsis-07/input1/wer', ...). On flat types, patterns are useful as prefixes ('status*', '*').
+
+Patterns are compiled into a trie over interned segments, so an event type is matched in one walk of its
+segments instead of once per pattern; EventDispatcher memoizes the result per event type tuple.
+"""
+import re
+import sys
+
+SEPARATORS = re.compile(r'[.:/]')
+WILDCARD = '*'
+_segments = dict()
+
+
+def split_event_type(name):
+    """
+    :param name: event type name or pattern
+    :return: tuple of interned segments (cached per name, like intern_event_type)
+    """
+    segments = _segments.get(name)
+    if segments is None:
+        segments = tuple(sys.intern(segment) for segment in SEPARATORS.split(name))
+        _segments[name] = segments
+    return segments
+
+
+def is_pattern(name):
+    return WILDCARD in name
+
+
+class _Node(object):
+    __slots__ = ('children', 'prefixes', 'star', 'values', 'subtree')
+
+    def __init__(self):
+        self.children = dict()  # segment -> _Node
+        self.prefixes = list()  # (prefix, _Node) of 'prefix*' segments
+        self.star = None        # _Node of a '*' segment followed by more segments
+        self.values = list()    # values of the patterns ending here
+        self.subtree = list()   # values of the patterns ending with '*' here
+
+
+class SubscriptionTrie(object):
+    """
+    Map patterns to values (e.g. handler positions) and find the values of all patterns matching event types
+    """
+
+    def __init__(self):
+        self.root = _Node()
+        self.patterns = 0
+
+    def add(self, pattern, value):
+        """
+        :param pattern: event type name or pattern
+        :param value: value returned by match() for the event types matching pattern
+        :raise ValueError: for a '*' that doesn't end a segment
+        """
+        node = self.root
+        segments = split_event_type(pattern)
+        for segment in segments:
+            if WILDCARD in segment[:-1]:
+                raise ValueError("'*' must end a segment: {!r}".format(pattern))
+        last = len(segments) - 1
+        for position, segment in enumerate(segments):
+            if segment == WILDCARD:
+                if position == last:
+                    node.subtree.append(value)
+                    self.patterns += 1
+                    return
+                if node.star is None:
+                    node.star = _Node()
+                node = node.star
+            elif segment.endswith(WILDCARD):
+                prefix = segment[:-1]
+                for existing, child in node.prefixes:
+                    if existing == prefix:
+                        node = child
+                        break
+                else:
+                    child = _Node()
+                    node.prefixes.append((prefix, child))
+                    node = child
+            else:
+                child = node.children.get(segment)
+                if child is None:
+                    child = node.children[segment] = _Node()
+                node = child
+        node.values.append(value)
+        self.patterns += 1
+
+    def match(self, event_type):
+        """
+        :param event_type: event type tuple (or list) of type names
+        :return: set of the values of the patterns matching any of the names
+        """
+        matched = set()
+        for name in event_type:
+            self._match(self.root, split_event_type(name), 0, matched)
+        return matched
+
+    def _match(self, node, segments, position, matched):
+        if position == len(segments):
+            matched.update(node.values)
+            return
+        if node.subtree:
+            matched.update(node.subtree)
+        segment = segments[position]
+        child = node.children.get(segment)
+        if child is not None:
+            self._match(child, segments, position + 1, matched)
+        for prefix, child in node.prefixes:
+            if segment.startswith(prefix):
+                self._match(child, segments, position + 1, matched)
+        if node.star is not None:
+            self._match(node.star, segments, position + 1, matched)
@@ -0,0 +1,203 @@
+#!/usr/bin/python3
+"""
+Prometheus exporter: serve live device telemetry as metrics over HTTP
+
+Metrics are aggregated in Hdmi2UsbStatus objects as events are dispatched,
+so a scrape only formats the current value of each series.
+
+usage: python -m hdmi2usbmon.exporter [--listen [HOST:]PORT] HOST:PORT ...
+"""
+import argparse
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from .device import Hdmi2UsbDevice
+from .events import EventDispatcher, EventHandler
+from .monitor import FleetMonitor
+from .status import Hdmi2UsbStatus, parsed_line
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_PORT = 9586
+
+# name, type, help, value of a ChannelStatus (None: not sampled yet)
+INPUT_METRICS = (
+    ('hdmi2usb_input_pixclk_hz', 'gauge', 'Pixel clock measured by the dvisampler',
+     lambda channel: channel.pixclk),
+    ('hdmi2usb_input_width_pixels', 'gauge', 'Horizontal resolution of the input',
+     lambda channel: channel.width),
+    ('hdmi2usb_input_height_pixels', 'gauge', 'Vertical resolution of the input',
+     lambda channel: channel.height),
+    ('hdmi2usb_input_chansync', 'gauge', 'Channel sync of the input (1: synchronised)',
+     lambda channel: channel.chansync),
+    ('hdmi2usb_input_samples_total', 'counter', 'dvisampler telemetry lines received',
+     lambda channel: channel.samples),
+    ('hdmi2usb_input_fifo_overflows_total', 'counter', 'dvisampler FIFO overflows',
+     lambda channel: channel.fifo_overflows),
+    ('hdmi2usb_input_pll_lock_lost_total', 'counter', 'dvisampler PLL lock losses',
+     lambda channel: channel.pll_lock_lost),
+)
+# name, type, help, values per TMDS channel of a ChannelStatus
+INPUT_CHANNEL_METRICS = (
+    ('hdmi2usb_input_phase', 'gauge', 'Phase per TMDS channel',
+     lambda channel: channel.ph),
+    ('hdmi2usb_input_wer', 'gauge', 'Word errors per TMDS channel in the last sample',
+     lambda channel: channel.wer),
+    ('hdmi2usb_input_wer_total', 'counter', 'Word errors per TMDS channel',
+     lambda channel: channel.wer_total if channel.samples else None),
+)
+# name, type, help, field of Hdmi2UsbStatus.encoder/ddr
+ENCODER_METRICS = (
+    ('hdmi2usb_encoder_enabled', 'gauge', 'Encoder enabled (1) or off (0)', 'enabled'),
+    ('hdmi2usb_encoder_fps', 'gauge', 'Encoder frame rate', 'fps'),
+    ('hdmi2usb_encoder_mbps', 'gauge', 'Encoder bit rate in Mbit/s', 'mbps'),
+)
+DDR_METRICS = (
+    ('hdmi2usb_ddr_read_mbps', 'gauge', 'DDR read bandwidth in Mbit/s', 'read'),
+    ('hdmi2usb_ddr_write_mbps', 'gauge', 'DDR write bandwidth in Mbit/s', 'write'),
+    ('hdmi2usb_ddr_all_mbps', 'gauge', 'DDR total bandwidth in Mbit/s', 'all'),
+)
+
+
+def _labels(**labels):
+    return ','.join('{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                    for key, value in sorted(labels.items()))
+
+
+class MetricsHandler(EventHandler):
+    """
+    Keep a Hdmi2UsbStatus per device from line events (raw from a monitor or parsed by parser.parse_line)
+    and render them in the Prometheus text format
+    """
+    EVENT_TYPES = (Hdmi2UsbDevice.LINE_EVENT,) + tuple(sorted(Hdmi2UsbStatus.LINE_TYPES))
+
+    def __init__(self):
+        self.status = dict()  # device name -> Hdmi2UsbStatus
+        self.lock = threading.Lock()
+
+    def accept_event(self, event):
+        return event.event_type[0] in self.EVENT_TYPES
+
+    def event_types(self):
+        return self.EVENT_TYPES
+
+    def handle_event(self, event):
+        parsed = parsed_line(event)
+        if parsed is None or parsed[0] is None:
+            return
+        device, kind, fields = parsed
+        with self.lock:
+            status = self.status.get(device)
+            if status is None:
+                status = self.status[device] = Hdmi2UsbStatus(device)
+            status.update(kind, fields)
+
+    def handle_events(self, events):
+        for event in events:
+            self.handle_event(event)
+
+    def render(self):
+        """ :return: metrics in the Prometheus text exposition format (str) """
+        lines = list()
+        with self.lock:
+            statuses = sorted(self.status.items())
+            for name, kind, text, value in INPUT_METRICS:
+                lines.append('# HELP {} {}\n# TYPE {} {}\n'.format(name, text, name, kind))
+                for device, status in statuses:
+                    for channel in status.devices:
+                        sample = value(channel)
+                        if sample is not None:
+                            lines.append('{}{{{}}} {}\n'.format(
+                                name, _labels(device=device, input=channel.channel), sample))
+            for name, kind, text, values in INPUT_CHANNEL_METRICS:
+                lines.append('# HELP {} {}\n# TYPE {} {}\n'.format(name, text, name, kind))
+                for device, status in statuses:
+                    for channel in status.devices:
+                        samples = values(channel)
+                        if samples is not None:
+                            for tmds, sample in enumerate(samples):
+                                lines.append('{}{{{}}} {}\n'.format(
+                                    name, _labels(device=device, input=channel.channel, channel=tmds), sample))
+            for metrics, attribute in ((ENCODER_METRICS, 'encoder'), (DDR_METRICS, 'ddr')):
+                for name, kind, text, key in metrics:
+                    lines.append('# HELP {} {}\n# TYPE {} {}\n'.format(name, text, name, kind))
+                    for device, status in statuses:
+                        value = getattr(getattr(status, attribute), key)
+                        if value is not None:
+                            lines.append('{}{{{}}} {}\n'.format(name, _labels(device=device), int(value)))
+        return ''.join(lines)
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.server.metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer(ThreadingMixIn, HTTPServer):
+    """
+    HTTP server for a MetricsHandler on its own thread
+    """
+    daemon_threads = True
+
+    def __init__(self, metrics, host='127.0.0.1', port=DEFAULT_PORT):
+        HTTPServer.__init__(self, (host, port), MetricsRequestHandler)
+        self.metrics = metrics
+        self.thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, name='MetricsServer')
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self.thread is not None:
+            self.thread.join()
+
+
+def main(*argv):
+    parser = argparse.ArgumentParser(description='Serve HDMI2USB telemetry as Prometheus metrics')
+    parser.add_argument('-l', '--listen', default=str(DEFAULT_PORT), help='[HOST:]PORT to serve /metrics on')
+    parser.add_argument('devices', nargs='+', help='hdmi2usbd HOST:PORT')
+    args = parser.parse_args(argv)
+    host, _, port = args.listen.rpartition(':')
+
+    dispatcher = EventDispatcher(indexed=True)
+    metrics = MetricsHandler()
+    dispatcher.add_handler(metrics)
+    monitor = FleetMonitor(dispatcher)
+    for address in args.devices:
+        device_host, _, device_port = address.rpartition(':')
+        monitor.add_device(Hdmi2UsbDevice(device_host or 'localhost', int(device_port)))
+    server = MetricsServer(metrics, host or '', int(port)).start()
+    try:
+        monitor.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        monitor.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*sys.argv[1:]))
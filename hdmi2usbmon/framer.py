@@ -0,0 +1,229 @@
+"""
+Incremental line framer: the common ingest layer between device sockets and line consumers
+"""
+from .device import Hdmi2UsbDevice
+
+
+class LineFramer(object):
+    """
+    Frame \\r\\n terminated lines received from a device in a preallocated buffer
+
+    Data is received straight into the buffer (recv_into) or copied in (feed_frames, feed_lines) after the
+    unterminated tail of the previous data. When the buffer end is reached, the unterminated tail (the line
+    straddling the wrap point) is moved to the front: that is the only copy the framer makes. A line longer
+    than the buffer is passed on in buffer sized pieces (the line ending after the last piece is dropped).
+    Complete lines are taken either with
+    - frames(): memoryviews of the buffer, without any copy, valid until more data is added
+      (for consumers that only look at each line once, e.g. LogWriter)
+    - lines(): bytes, split from one copy of all complete lines (faster for consumers that keep the lines)
+    Empty lines are skipped unless skip_empty is False.
+
+    hdmi2usbd prints its HDMI2USB> prompt without line ending, so it prefixes the next line (or is alone at the
+    end of the data). With strip_prompt, prompts are removed from the start of lines and of the unterminated
+    tail, and on_prompt is called for each of them (with frames(), before the line they prefix is yielded).
+    Otherwise lines keep their prompt prefix, and take_prompts() removes the prompts of the tail.
+    """
+    SIZE = 65536
+
+    def __init__(self, size=None, prompt=Hdmi2UsbDevice.PROMPT, strip_prompt=True, on_prompt=None,
+                 skip_empty=True):
+        """
+        :param size: buffer size in bytes (default: SIZE)
+        :param prompt: prompt (bytes)
+        :param strip_prompt: remove prompts from the lines
+        :param on_prompt: callable without arguments, called for each prompt removed
+        :param skip_empty: drop empty lines (after removing prompts)
+        """
+        self.size = size or self.SIZE
+        self.buffer = bytearray(self.size)
+        self.view = memoryview(self.buffer)
+        self.start = 0
+        self.end = 0
+        self.prompt = prompt
+        self.strip_prompt = strip_prompt
+        self.on_prompt = on_prompt
+        self.skip_empty = skip_empty
+        self.overflowed = False  # the last line was passed on in pieces, its line ending may follow
+        self.bytes = 0
+        self.framed = 0  # lines
+        self.prompts = 0
+        self.wraps = 0
+
+    @property
+    def pending(self):
+        """ number of bytes of the unterminated tail """
+        return self.end - self.start
+
+    def _reserve(self):
+        """ make room after the unterminated tail """
+        if self.start == self.end:
+            self.start = self.end = 0
+        elif self.end == self.size and self.start:
+            length = self.end - self.start
+            self.buffer[:length] = self.view[self.start:self.end]
+            self.start, self.end = 0, length
+            self.wraps += 1
+
+    def recv_into(self, sock):
+        """
+        Receive from a socket into the buffer (complete lines are discarded unless they were taken)
+        :return: number of bytes received, 0 at EOF (socket exceptions are passed on)
+        """
+        self._reserve()
+        count = sock.recv_into(self.view[self.end:])
+        self.end += count
+        self.bytes += count
+        return count
+
+    def feed_frames(self, data):
+        """
+        Add data received elsewhere and yield the complete lines as they are framed
+        This is a generator: data that doesn't fit into the buffer is only copied in once the frames before it
+        were consumed, so each frame must be used before the next one is taken.
+        :param data: bytes-like object
+        :return: generator of line memoryviews
+        """
+        offset = 0
+        while offset < len(data):
+            offset = self._copy(data, offset)
+            for line in self.frames():
+                yield line
+
+    def feed_lines(self, data):
+        """
+        Add data received elsewhere and take the complete lines
+        :param data: bytes-like object
+        :return: list of lines (bytes)
+        """
+        offset = self._copy(data, 0)
+        lines = self.lines()
+        while offset < len(data):
+            offset = self._copy(data, offset)
+            lines += self.lines()
+        return lines
+
+    def _copy(self, data, offset):
+        """ copy as much of data[offset:] as fits into the buffer, :return: offset of the rest """
+        self._reserve()
+        end = self.end
+        count = min(len(data) - offset, self.size - end)
+        if count == len(data):
+            self.buffer[end:end + count] = data
+        else:
+            self.buffer[end:end + count] = memoryview(data)[offset:offset + count]
+        self.end = end + count
+        self.bytes += count
+        return offset + count
+
+    def _skip_prompts(self, position, limit):
+        """ :return: position after the prompts at position, reporting each """
+        prompt = self.prompt
+        length = len(prompt)
+        buffer = self.buffer
+        while buffer.startswith(prompt, position, limit):
+            position += length
+            self.prompts += 1
+            if self.on_prompt is not None:
+                self.on_prompt()
+        return position
+
+    def take_prompts(self):
+        """
+        Remove the prompts at the start of the unterminated tail, which would only be seen with the next line
+        :return: number of prompts removed (on_prompt isn't called)
+        """
+        prompt = self.prompt
+        start = self.start
+        while self.buffer.startswith(prompt, start, self.end):
+            start += len(prompt)
+        count = (start - self.start) // len(prompt)
+        self.start = start
+        self.prompts += count
+        return count
+
+    def _overflow(self):
+        """
+        :return: the buffer if it is full without line ending (passed on as a line, without a trailing \\r
+                 that may start the line ending), else None
+        """
+        if self.start == 0 and self.end == self.size:
+            self.start = end = self.end
+            self.framed += 1
+            self.overflowed = True
+            if self.buffer[end - 1] == 13:
+                end -= 1
+            return self.view[:end]
+        return None
+
+    def frames(self):
+        """
+        Yield the complete lines in the buffer
+        :return: generator of line memoryviews
+        """
+        buffer = self.buffer
+        view = self.view
+        strip_prompt = self.strip_prompt
+        start = self.start
+        end = self.end
+        while True:
+            newline = buffer.find(b'\n', start, end)
+            if newline < 0:
+                break
+            self.start = newline + 1
+            line_end = newline - 1 if newline > start and buffer[newline - 1] == 13 else newline
+            if self.overflowed:
+                self.overflowed = False
+                if line_end <= start:
+                    # line ending of the last piece of a long line
+                    start = newline + 1
+                    continue
+            if strip_prompt:
+                start = self._skip_prompts(start, line_end)
+            if line_end > start or not self.skip_empty:
+                self.framed += 1
+                yield view[start:line_end]
+            start = newline + 1
+        if strip_prompt and start < end:
+            self.start = self._skip_prompts(start, end)
+        line = self._overflow()
+        if line is not None:
+            yield line
+
+    def lines(self):
+        """
+        Take the complete lines in the buffer
+        :return: list of lines (bytes)
+        """
+        start = self.start
+        last = self.buffer.rfind(b'\n', start, self.end)
+        if last < 0:
+            lines = []
+        else:
+            self.start = last + 1
+            lines = [line.rstrip(b'\r') for line in bytes(self.view[start:last]).split(b'\n')]
+            if self.overflowed:
+                self.overflowed = False
+                if not lines[0]:
+                    # line ending of the last piece of a long line
+                    del lines[0]
+            if self.strip_prompt and self.buffer.find(self.prompt, start, last) >= 0:
+                lines = [self._strip(line) for line in lines]
+            if self.skip_empty:
+                lines = [line for line in lines if line]
+            self.framed += len(lines)
+        if self.strip_prompt and self.start < self.end:
+            self.start = self._skip_prompts(self.start, self.end)
+        if self.end == self.size:
+            line = self._overflow()
+            if line is not None:
+                lines.append(bytes(line))
+        return lines
+
+    def _strip(self, line):
+        prompt = self.prompt
+        while line.startswith(prompt):
+            line = line[len(prompt):]
+            self.prompts += 1
+            if self.on_prompt is not None:
+                self.on_prompt()
+        return line
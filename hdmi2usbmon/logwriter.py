@@ -0,0 +1,200 @@
+"""
+Background, batched writer for hdmi2usbd logs in the logger_basic.py format
+"""
+import os
+import queue
+import threading
+import time
+
+from .framer import LineFramer
+
+LOG_FORMAT = '{} hdmi2usbd [{}]: {}\n'
+TIME_FORMAT = '%b %d %H:%M:%S'
+# TimedRotatingFileHandler suffix for hourly rotation
+ROTATE_SUFFIX = '%Y-%m-%d_%H'
+# seconds the writer thread waits for data before checking whether it was closed
+STOP_POLL = 0.1
+
+
+class LogWriter(threading.Thread):
+    """
+    Write raw data read from hdmi2usbd to an hourly rotated log file (and optionally a stream) on its own thread
+
+    The socket reader only calls put() with the bytes it received: it never waits for the disk.
+    If the queue is full, data is dropped and counted instead.
+    The writer thread splits lines, formats them like logger_basic.py and writes each batch in one write() call.
+    Empty lines are written too, as logging did for the original logger_basic.py.
+    """
+    MAX_QUEUE = 10000
+    BATCH_SIZE = 1000
+    ROTATE_INTERVAL = 3600
+
+    def __init__(self, filename, stream=None, pid=None, max_queue=None, batch_size=None, rotate_interval=None):
+        """
+        :param filename: log file name, rotated files get a '.%Y-%m-%d_%H' suffix like TimedRotatingFileHandler
+        :param stream: optional text stream to copy the log to (e.g. sys.stdout)
+        :param pid: process id written in each line (default: this process)
+        :param max_queue: maximum number of queued reads before data is dropped
+        :param batch_size: maximum number of queued reads written per batch
+        :param rotate_interval: seconds per log file, rotation happens on multiples of the interval in local time
+        """
+        super(LogWriter, self).__init__(name='LogWriter')
+        self.daemon = True
+        self.filename = filename
+        self.stream = stream
+        self.pid = os.getpid() if pid is None else pid
+        self.batch_size = batch_size or self.BATCH_SIZE
+        self.rotate_interval = rotate_interval or self.ROTATE_INTERVAL
+        self.queue = queue.Queue(max_queue or self.MAX_QUEUE)
+        self.framer = LineFramer(strip_prompt=False, skip_empty=False)
+        self.stopping = threading.Event()
+        self.file = None
+        self.rollover_at = None
+        self.dropped = 0
+        self.lines = 0
+        self.batches = 0
+        self.errors = 0
+        self._time_text = (None, None)
+
+    # Reader side
+
+    def put(self, data, timestamp=None):
+        """
+        Queue data read from the device, never blocks
+        :param data: bytes as received (partial lines are joined by the writer)
+        :param timestamp: time the data was read (default: now)
+        :return: False if the queue was full and the data was dropped
+        """
+        try:
+            self.queue.put_nowait((time.time() if timestamp is None else timestamp, data))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def stats(self):
+        """ :return: dict of queue depth, dropped reads, written lines/batches and write errors """
+        return dict(queue_depth=self.queue.qsize(), dropped=self.dropped, lines=self.lines,
+                    batches=self.batches, errors=self.errors)
+
+    def close(self, timeout=None):
+        """
+        Write everything queued so far and stop the writer thread
+        Never blocks on a full queue: the writer stops once it has emptied the queue.
+        :param timeout: seconds to wait for the writer thread, None to wait until it is done
+        """
+        self.stopping.set()
+        try:
+            # wake the writer thread up if it is waiting for data
+            self.queue.put_nowait((None, None))
+        except queue.Full:
+            pass
+        if self.is_alive():
+            self.join(timeout)
+
+    # Writer side
+
+    def format_time(self, timestamp):
+        second = int(timestamp)
+        if self._time_text[0] != second:
+            self._time_text = (second, time.strftime(TIME_FORMAT, time.localtime(second)))
+        return self._time_text[1]
+
+    def format_line(self, timestamp, line):
+        """ :param line: bytes-like object, surrounding whitespace is removed """
+        try:
+            message = str(line, 'ascii').strip()
+        except UnicodeDecodeError:
+            # non-ascii byte encountered (i.e. a ^C)
+            message = str(bytes(line).strip())
+        return LOG_FORMAT.format(self.format_time(timestamp), self.pid, message)
+
+    def interval_start(self, timestamp):
+        """ :return: start of the rotation interval of timestamp, aligned on local time like the file suffixes """
+        local = timestamp + time.localtime(timestamp).tm_gmtoff
+        return timestamp - local % self.rotate_interval
+
+    def _rename(self, start):
+        """ rename the log file to the suffix of the interval starting at start (unless that file exists) """
+        target = '{}.{}'.format(self.filename, time.strftime(ROTATE_SUFFIX, time.localtime(start)))
+        if not os.path.exists(target):
+            os.rename(self.filename, target)
+
+    def rotate(self, timestamp):
+        """
+        Open the log file for the interval of timestamp, renaming the previous one
+        A log file left by an earlier run is only appended to if it was last written in the same interval.
+        :return: False if the log file couldn't be renamed or opened (counted in errors, retried by the next batch)
+        """
+        start = self.interval_start(timestamp)
+        try:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+                self._rename(self.rollover_at - self.rotate_interval)
+            elif os.path.exists(self.filename):
+                written = self.interval_start(os.path.getmtime(self.filename))
+                if written < start:
+                    self._rename(written)
+            self.file = open(self.filename, 'a')
+        except OSError:
+            self.errors += 1
+            return False
+        self.rollover_at = start + self.rotate_interval
+        return True
+
+    def write_batch(self, batch):
+        """
+        write a batch of (timestamp, data) reads, one write() per log file
+        Without a log file (rotation failed), lines only go to the stream.
+        """
+        chunks = list()
+        rotated = True
+        for timestamp, data in batch:
+            if rotated and (self.file is None or timestamp >= self.rollover_at):
+                if chunks:
+                    self.write_text(''.join(chunks))
+                    chunks = list()
+                # after a failure, rotation is only tried again with the next batch
+                rotated = self.rotate(timestamp)
+            # frames are only decoded, so they aren't copied out of the framer buffer first
+            for line in self.framer.feed_frames(data):
+                chunks.append(self.format_line(timestamp, line))
+                self.lines += 1
+        if chunks:
+            self.write_text(''.join(chunks))
+        self.batches += 1
+
+    def write_text(self, text):
+        try:
+            if self.file is not None:
+                self.file.write(text)
+                self.file.flush()
+            if self.stream is not None:
+                self.stream.write(text)
+                self.stream.flush()
+        except (OSError, ValueError):
+            self.errors += 1
+
+    def run(self):
+        done = False
+        while not done:
+            try:
+                batch = [self.queue.get(timeout=STOP_POLL)]
+            except queue.Empty:
+                if self.stopping.is_set():
+                    break
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if any(data is None for _, data in batch):
+                batch = batch[:[data for _, data in batch].index(None)]
+                done = True
+            if batch:
+                self.write_batch(batch)
+        if self.file is not None:
+            self.file.close()
+            self.file = None
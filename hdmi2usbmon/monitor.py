@@ -1,7 +1,220 @@
 """
-
+Fleet monitor: multiplex many hdmi2usbd sockets through one selectors loop
 """
+import selectors
+import time
 
 from .events import *
+from .device import Hdmi2UsbDevice
+from .framer import LineFramer
+
+
+class DeviceBuffer(object):
+    """
+    Receive buffer for one device: frames lines incrementally from non-blocking recv data (see LineFramer),
+    and matches them against the pending commands of the device.
+    Lines keep their prompt prefix, the prompt ending the data read so far completes the pending command.
+    """
+    __slots__ = ('device', 'framer')
+
+    def __init__(self, device, size=None):
+        """
+        :param device: Hdmi2UsbDevice (None to only split lines)
+        :param size: receive buffer size (default: LineFramer.SIZE)
+        """
+        self.device = device
+        self.framer = LineFramer(size, strip_prompt=False)
+
+    @property
+    def bytes(self):
+        return self.framer.bytes
+
+    @property
+    def lines(self):
+        return self.framer.framed
+
+    @property
+    def pending(self):
+        """ number of bytes of the unterminated line """
+        return self.framer.pending
+
+    def feed(self, data):
+        """
+        Add received data to the buffer
+        :param data: bytes received from the device
+        :return: list of complete lines (bytes, line ending and empty lines removed)
+        """
+        return self._commands(self.framer.feed_lines(data))
+
+    def recv(self, sock):
+        """
+        Receive from a socket straight into the buffer
+        :return: list of complete lines, None if the connection was closed (socket exceptions are passed on)
+        """
+        if not self.framer.recv_into(sock):
+            return None
+        return self._commands(self.framer.lines())
+
+    def _commands(self, lines):
+        device = self.device
+        if device is not None and device.commands:
+            commands = device.commands
+            for line in lines:
+                commands.feed_line(line)
+            commands.feed_prompts(self.framer.take_prompts())
+        return lines
+
+
+class FleetMonitor(object):
+    """
+    Read lines from any number of Hdmi2UsbDevice sockets in one thread, tag them with their device
+    (Hdmi2UsbDevice.line_event, or parsed with parser.parse_line) and send them to an EventDispatcher
+    """
+    RECV_SIZE = 65536
+
+    def __init__(self, dispatcher, commands=Hdmi2UsbDevice.SUBSCRIBE_COMMANDS, selector=None, clock=time.time,
+                 parser=None):
+        """
+        :param dispatcher: EventDispatcher receiving line events
+        :param commands: commands sent to each device when it is added
+        :param selector: selectors.BaseSelector instance (default: selectors.DefaultSelector())
+        :param clock: timestamp of the lines, read once per recv (e.g. time.monotonic; dispatcher stats
+                      measure queue waits from the enqueue time, so they work with any clock)
+        :param parser: object with a parse_line(line, device, timestamp) method (the parser module, or a
+                       stats.ParseStats to measure parsing) to send parsed events instead of raw line events
+        """
+        self.dispatcher = dispatcher
+        self.clock = clock
+        self.parser = parser
+        self.commands = commands
+        self.selector = selector or selectors.DefaultSelector()
+        self.buffers = dict()
+        self.removed = dict()  # device name -> [bytes, lines] read on connections that were removed
+
+    @property
+    def devices(self):
+        return [buffer.device for buffer in self.buffers.values()]
+
+    def device_stats(self):
+        """
+        :return: dict of device name -> dict(bytes=, lines=) read so far, including removed devices
+        """
+        stats = dict((name, dict(bytes=counts[0], lines=counts[1])) for name, counts in self.removed.items())
+        for buffer in self.buffers.values():
+            counts = stats.setdefault(buffer.device.name, dict(bytes=0, lines=0))
+            counts['bytes'] += buffer.bytes
+            counts['lines'] += buffer.lines
+        return stats
+
+    def add_device(self, device):
+        """
+        Add a device, connecting it if necessary
+        :param device: Hdmi2UsbDevice
+        :return: True if the device was added
+        """
+        if device.sock is not None and device.sock in self.buffers:
+            return False
+        device.connect()
+        self._register(device)
+        return True
+
+    def _register(self, device):
+        """ start reading from a connected device, after sending it the subscription commands """
+        device.sock.setblocking(False)
+        if self.commands:
+            device.sock.sendall(b''.join(command.encode() + b'\r\n' for command in self.commands))
+        buffer = DeviceBuffer(device, self.RECV_SIZE)
+        self.buffers[device.sock] = buffer
+        self.selector.register(device.sock, selectors.EVENT_READ, buffer)
+
+    def remove_device(self, device, close=True):
+        """
+        Remove a device
+        :param close: close the device connection
+        :return: True if the device was being monitored
+        """
+        sock = device.sock
+        if sock is None or sock not in self.buffers:
+            return False
+        self.selector.unregister(sock)
+        buffer = self.buffers.pop(sock)
+        counts = self.removed.setdefault(device.name, [0, 0])
+        counts[0] += buffer.bytes
+        counts[1] += buffer.lines
+        if close:
+            device.close()
+        return True
+
+    def poll(self, timeout=None):
+        """
+        Wait for data from any device and queue the lines received
+        Devices that close their connection (or fail) are removed
+        :param timeout: select timeout in seconds, None to wait forever
+        :return: number of lines queued
+        """
+        count = 0
+        send_event = self.dispatcher.send_event
+        for key, mask in self.selector.select(timeout):
+            buffer = key.data
+            if not isinstance(buffer, DeviceBuffer):
+                self._ready(key, mask)
+                continue
+            try:
+                lines = buffer.recv(key.fileobj)
+            except (BlockingIOError, InterruptedError):
+                continue
+            except OSError:
+                lines = None
+            if lines is None:
+                self.remove_device(buffer.device)
+                continue
+            device = buffer.device
+            timestamp = self.clock()
+            if self.parser is None:
+                for line in lines:
+                    send_event(device.line_event(line, timestamp))
+            else:
+                parse_line = self.parser.parse_line
+                for line in lines:
+                    send_event(parse_line(line, device.name, timestamp))
+            count += len(lines)
+        return count
+
+    def _ready(self, key, mask):
+        """ called for sockets registered by subclasses with data that isn't a DeviceBuffer """
+        pass
+
+    def run(self, timeout=1.0, max_events=4096):
+        """
+        Poll devices and dispatch their events until no devices are left
+        :param timeout: select timeout in seconds
+        :param max_events: maximum events per dispatch batch
+        :return: number of lines read
+        """
+        count = 0
+        while self.buffers:
+            count += self.poll(timeout)
+            while self.dispatcher.dispatch_batch(max_events).events:
+                pass
+        return count
 
+    def wait(self, futures, timeout=None, max_events=4096):
+        """
+        Poll devices and dispatch their events until futures (e.g. from Hdmi2UsbDevice.send_commands) are done
+        :param timeout: seconds to wait at most, None to wait until done or no devices are left
+        :return: True if all futures are done
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while not all(future.done() for future in futures) and self.buffers:
+            remaining = None if deadline is None else deadline - time.time()
+            if remaining is not None and remaining <= 0:
+                break
+            self.poll(remaining)
+            while self.dispatcher.dispatch_batch(max_events).events:
+                pass
+        return all(future.done() for future in futures)
 
+    def close(self):
+        for device in self.devices:
+            self.remove_device(device)
+        self.selector.close()
@@ -0,0 +1,324 @@
+"""
+Parsers for hdmi2usbd debug/status lines
+"""
+import time
+from collections import namedtuple
+
+from .events import Event, intern_event_type
+from .device import Hdmi2UsbDevice
+
+PROMPT = Hdmi2UsbDevice.PROMPT
+
+# line types returned by classify_line, also used as event types by parse_line
+DVISAMPLER_EVENT = 'dvisampler'
+DVISAMPLER_MESSAGE = 'dvisampler_message'
+FIFO_OVERFLOW = 'fifo_overflow'
+PLL_LOCK_LOST = 'pll_lock_lost'
+PLL_LOCKED = 'pll_locked'
+PHASE_INIT_OK = 'phase_init_ok'
+PHASE_INIT_FAILED = 'phase_init_failed'
+IDELAY_BUSY_TIMEOUT = 'idelay_busy_timeout'
+DELAYS_CALIBRATED = 'delays_calibrated'
+GIVING_UP = 'giving_up'
+INPUT_STATUS = 'input'
+OUTPUT_STATUS = 'output'
+ENCODER_STATUS = 'encoder'
+DDR_STATUS = 'ddr'
+STATUS1 = 'status1'
+STATUS2 = 'status2'
+UNKNOWN_LINE = Hdmi2UsbDevice.LINE_EVENT
+
+DVISAMPLER_MESSAGES = {
+    b'FIFO overflow': FIFO_OVERFLOW,
+    b'lost PLL lock': PLL_LOCK_LOST,
+    b'PLL locked': PLL_LOCKED,
+    b'phase init OK': PHASE_INIT_OK,
+    b'phase init failed': PHASE_INIT_FAILED,
+    b'IDELAY busy timeout': IDELAY_BUSY_TIMEOUT,
+    b'delays calibrated': DELAYS_CALIBRATED,
+    b'giving up': GIVING_UP,
+}
+
+DviSamplerRecord = namedtuple('DviSamplerRecord', (
+    'device', 'input', 'ph', 'charsync', 'ctl_pos', 'wer', 'chansync', 'width', 'height', 'pixclk'))
+DviSamplerRecord.__doc__ = """
+dvisampler telemetry line, e.g.
+dvisampler1: ph:   4    4    4 // charsync:111 [9 9 9] // WER:  0   0   0 // chansync:1 // res:1280x720 // pixclk:74249958 Hz
+device: device name (or None)
+input: input number (int)
+ph: phase per channel (3 ints)
+charsync: character sync per channel (3 ints, 0/1)
+ctl_pos: control token position per channel (3 ints)
+wer: word error count per channel (3 ints)
+chansync: channel sync (int, 0/1)
+width, height: resolution (ints)
+pixclk: pixel clock in Hz (int)
+"""
+
+# The part of a dvisampler line before the pixel clock only takes a few hundred distinct values
+# (phases move a little, WER is usually 0), so its parsed fields are cached by their raw bytes.
+DVISAMPLER_CACHE_SIZE = 4096
+_dvisampler_cache = dict()
+
+
+def strip_prefix(line):
+    """
+    Remove what hdmi2usbd can print before a status line: HDMI2USB> prompts, and the echo of a command typed
+    while telemetry is printed (e.g. 'x c dvisampler1: ph: ...')
+    :param line: line (bytes, without line ending)
+    :return: line from its first status line name
+    """
+    while line.startswith(PROMPT):
+        line = line[len(PROMPT):]
+    if not line.startswith(b'dvisampler'):
+        start = line.find(b'dvisampler')
+        if start > 0:
+            line = line[start:]
+    return line
+
+
+def _parse_dvisampler_fields(prefix):
+    """
+    Parse the fields of a dvisampler line before ' // pixclk:'
+    :param prefix: line from 'dvisampler' up to the pixclk separator
+    :return: tuple of DviSamplerRecord fields from input to height, or None
+    """
+    # splitting after every ':' copes with both 'WER:  0   0   0' and 'WER:31212 545 2921'
+    tokens = prefix.replace(b':', b': ').split()
+    if (len(tokens) != 22 or tokens[1] != b'ph:' or tokens[6] != b'charsync:' or tokens[12] != b'WER:'
+            or tokens[17] != b'chansync:' or tokens[20] != b'res:'):
+        return None
+    try:
+        charsync = tokens[7]
+        width, _, height = tokens[21].partition(b'x')
+        return (int(tokens[0][10:-1]),
+                (int(tokens[2]), int(tokens[3]), int(tokens[4])),
+                (charsync[0] - 48, charsync[1] - 48, charsync[2] - 48),
+                (int(tokens[8][1:]), int(tokens[9]), int(tokens[10][:-1])),
+                (int(tokens[13]), int(tokens[14]), int(tokens[15])),
+                int(tokens[18]),
+                int(width),
+                int(height))
+    except (ValueError, IndexError):
+        return None
+
+
+def parse_dvisampler(line, device=None):
+    """
+    Parse a dvisampler telemetry line without regular expressions
+    Column spacing may vary; prompts and command echoes before 'dvisampler' are ignored (see strip_prefix).
+    :param line: line (bytes, without line ending)
+    :param device: device name to record
+    :return: DviSamplerRecord, or None if the line isn't a dvisampler telemetry line
+    """
+    line = strip_prefix(line)
+    end = line.rfind(b' // pixclk:')
+    if end < 0 or not line.endswith(b' Hz') or not line.startswith(b'dvisampler'):
+        return None
+    prefix = line[:end]
+    fields = _dvisampler_cache.get(prefix)
+    if fields is None:
+        fields = _parse_dvisampler_fields(prefix)
+        if fields is None:
+            return None
+        if len(_dvisampler_cache) >= DVISAMPLER_CACHE_SIZE:
+            _dvisampler_cache.clear()
+        _dvisampler_cache[prefix] = fields
+    try:
+        pixclk = int(line[end + 11:-3])
+    except ValueError:
+        return None
+    return tuple.__new__(DviSamplerRecord, (device,) + fields + (pixclk,))
+
+
+def _resolution(text):
+    width, _, height = text.partition(b'x')
+    return int(width), int(height)
+
+
+def _classify_dvisampler(line, number, rest, device):
+    if rest.startswith(b' ph:') or rest.startswith(b'ph:'):
+        record = parse_dvisampler(line, device)
+        if record is not None:
+            return DVISAMPLER_EVENT, record
+    message = rest.strip()
+    kind = DVISAMPLER_MESSAGES.get(message, DVISAMPLER_MESSAGE)
+    return kind, {'input': number, 'message': message.decode('ascii', 'replace')}
+
+
+def _classify_input(line, number, rest, device):
+    # input1:  1280x720 (@ 74250 kHz)
+    tokens = rest.split()
+    width, height = _resolution(tokens[0])
+    return INPUT_STATUS, {'name': 'input%d' % number, 'input': number, 'width': width, 'height': height,
+                          'freq_khz': int(tokens[2])}
+
+
+def _classify_output(line, number, rest, device):
+    # output0: off | output1: 1280x720@50Hz from input1
+    tokens = rest.split()
+    fields = {'name': 'output%d' % number, 'output': number, 'enabled': tokens[0] != b'off'}
+    if fields['enabled']:
+        resolution, _, refresh = tokens[0].partition(b'@')
+        fields['width'], fields['height'] = _resolution(resolution)
+        fields['refresh'] = int(refresh.rstrip(b'Hz'))
+        fields['source'] = tokens[2].decode('ascii')
+    return OUTPUT_STATUS, fields
+
+
+def _classify_encoder(line, number, rest, device):
+    # encoder: 1280x720 @ 0fps (0Mbps) from input1 (q: 85)
+    tokens = rest.split()
+    fields = {'name': 'encoder', 'enabled': tokens[0] != b'off'}
+    if fields['enabled']:
+        fields['width'], fields['height'] = _resolution(tokens[0])
+        fields['fps'] = int(tokens[2].rstrip(b'fps'))
+        fields['mbps'] = int(tokens[3].strip(b'()').rstrip(b'Mbps'))
+        fields['source'] = tokens[5].decode('ascii')
+        fields['quality'] = int(tokens[7].rstrip(b')'))
+    return ENCODER_STATUS, fields
+
+
+def _classify_ddr(line, number, rest, device):
+    # ddr: read:  734Mbps  write:  736Mbps  all: 1470Mbps
+    tokens = rest.replace(b':', b' ').split()
+    fields = {'name': 'ddr'}
+    for key, value in zip(tokens[0::2], tokens[1::2]):
+        fields[key.decode('ascii')] = int(value.rstrip(b'Mbps'))
+    return DDR_STATUS, fields
+
+
+def _classify_status(line, number, rest, device):
+    # status1: in0: ..., in1: ..., out0: ..., out1: ...
+    # status2: EDID: primary/secondary, enc: ..., ddr: ...
+    names = {b'in0': 'input0', b'in1': 'input1', b'out0': 'output0', b'out1': 'output1',
+             b'enc': 'encoder', b'ddr': 'ddr'}
+    fields = dict()
+    for item in rest.split(b', '):
+        key, _, value = item.strip().partition(b': ')
+        if key == b'EDID':
+            fields['edid_primary'], _, fields['edid_secondary'] = value.partition(b'/')
+        elif key in names:
+            fields[names[key]] = value
+    return (STATUS1 if number == 1 else STATUS2), fields
+
+
+_CLASSIFIERS = {
+    b'dvisampler': _classify_dvisampler,
+    b'input': _classify_input,
+    b'output': _classify_output,
+    b'encoder': _classify_encoder,
+    b'ddr': _classify_ddr,
+    b'status': _classify_status,
+}
+
+
+def classify_line(line, device=None):
+    """
+    Classify a line by its prefix and parse its fields in one pass
+    :param line: line (bytes, without line ending), prompts and command echoes before it are ignored
+                 as by parse_dvisampler (see strip_prefix)
+    :param device: device name recorded in DviSamplerRecords
+    :return: (line type, fields): a DviSamplerRecord for DVISAMPLER_EVENT lines, a dict otherwise;
+             lines that aren't recognised are (UNKNOWN_LINE, {'line': line without the prefix})
+    """
+    line = strip_prefix(line)
+    name, colon, rest = line.partition(b':')
+    if colon:
+        prefix = name.rstrip(b'0123456789')
+        classify = _CLASSIFIERS.get(prefix)
+        if classify is not None:
+            try:
+                number = int(name[len(prefix):]) if len(name) > len(prefix) else None
+                return classify(line, number, rest, device)
+            except (ValueError, IndexError):
+                pass
+    return UNKNOWN_LINE, {'line': line}
+
+
+class DviSamplerEvent(Event):
+    """
+    Event of a dvisampler telemetry line: data is a DviSamplerRecord, the type tuple is shared
+    """
+    __slots__ = ()
+    EVENT_TYPE = intern_event_type(DVISAMPLER_EVENT)
+
+    def __init__(self, record, timestamp=None):
+        self.event_type = self.EVENT_TYPE
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.data = record
+
+
+class StatusEvent(Event):
+    """
+    Event of a status line (input, output, encoder, ddr, status1/2): data is the dict of parsed fields
+    """
+    __slots__ = ()
+    TYPES = frozenset((INPUT_STATUS, OUTPUT_STATUS, ENCODER_STATUS, DDR_STATUS, STATUS1, STATUS2))
+
+    def __init__(self, kind, fields, timestamp=None):
+        self.event_type = intern_event_type(kind)
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.data = fields
+
+
+def parse_line(line, device=None, timestamp=None):
+    """
+    Parse a line read from a device into an event
+    :param line: line (bytes, without line ending)
+    :param device: device name
+    :param timestamp: event timestamp (default: now)
+    :return: Event with the line type from classify_line as event type: a DviSamplerEvent for 'dvisampler'
+             telemetry, a StatusEvent for status lines, otherwise an Event; data is the parsed fields,
+             dicts include the device name
+    """
+    kind, fields = classify_line(line, device)
+    if kind == DVISAMPLER_EVENT:
+        return DviSamplerEvent(fields, timestamp)
+    fields['device'] = device
+    if kind in StatusEvent.TYPES:
+        return StatusEvent(kind, fields, timestamp)
+    return Event(kind, data=fields, timestamp=timestamp)
+
+
+# logger_basic.py log lines: 'Jan 15 17:25:45 hdmi2usbd [671]: message'
+LOG_TIME_FORMAT = '%b %d %H:%M:%S %Y'
+LOG_TIME_LENGTH = 15
+LOG_TIME_CACHE_SIZE = 65536
+_log_time_cache = dict()
+
+
+def parse_log_time(text, year=None):
+    """
+    Convert a syslog style timestamp ('Jan 15 17:25:45') to seconds since the epoch (local time)
+    Results are cached, consecutive log lines mostly share their timestamp.
+    :param text: timestamp (bytes)
+    :param year: year of the timestamp (default: current year)
+    :return: float
+    """
+    key = (text, year)
+    timestamp = _log_time_cache.get(key)
+    if timestamp is None:
+        year = time.localtime().tm_year if year is None else year
+        timestamp = time.mktime(time.strptime('{} {}'.format(text.decode('ascii'), year), LOG_TIME_FORMAT))
+        if len(_log_time_cache) >= LOG_TIME_CACHE_SIZE:
+            _log_time_cache.clear()
+        _log_time_cache[key] = timestamp
+    return timestamp
+
+
+def parse_log_line(line, year=None):
+    """
+    Split a logger_basic.py log line into its timestamp and message
+    :param line: log line (bytes)
+    :param year: year of the log (default: current year)
+    :return: (timestamp, message) or None if the line isn't in the log format
+    """
+    _, separator, message = line.partition(b']: ')
+    if not separator:
+        return None
+    try:
+        timestamp = parse_log_time(line[:LOG_TIME_LENGTH], year)
+    except (ValueError, UnicodeDecodeError):
+        return None
+    return timestamp, message.rstrip(b'\r\n')
@@ -0,0 +1,212 @@
+"""
+hdmi2usbd simulator: replays captured logs over TCP and answers the commands the UIs send
+"""
+import asyncio
+import threading
+import time
+
+from .device import Hdmi2UsbDevice
+from .parser import PROMPT, parse_log_line
+
+SOURCES = ('input0', 'input1', 'pattern')
+SINKS = ('output0', 'output1', 'encoder')
+
+
+def load_capture(path, year=None):
+    """
+    Load a logger_basic.py log as a capture to replay
+    :return: list of (timestamp, message)
+    """
+    lines = list()
+    with open(path, 'rb') as logfile:
+        for line in logfile:
+            parsed = parse_log_line(line, year)
+            if parsed is not None:
+                lines.append(parsed)
+    return lines
+
+
+class Hdmi2UsbSimulator(object):
+    """
+    Stand-in for hdmi2usbd speaking its line protocol on a TCP port
+
+    Each client gets the whole capture replayed from the start, as fast as possible or at a multiple of
+    the recorded speed, and the connection is closed at the end unless linger is set.
+    Commands are echoed, answered and followed by the HDMI2USB> prompt (without a line ending, as the
+    firmware does), so the next line arrives prefixed with the prompt.
+    """
+
+    def __init__(self, lines, host='127.0.0.1', port=0, speed=None, repeat=1, linger=False):
+        """
+        :param lines: capture, list of (timestamp, message bytes)
+        :param host: address to listen on
+        :param port: port to listen on, 0 for any free port
+        :param speed: replay speed relative to the capture timestamps (1.0 = recorded speed), None for no delays
+        :param repeat: number of times the capture is replayed per connection
+        :param linger: keep connections open after the replay
+        """
+        self.lines = lines
+        self.host = host
+        self.port = port
+        self.speed = speed
+        self.repeat = repeat
+        self.linger = linger
+        self.server = None
+        self.commands = list()
+        self.connections = 0
+        self.matrix = dict((sink, None) for sink in SINKS)
+        self.debug = dict((source, False) for source in SOURCES[:2])
+        self.status_short = False
+
+    @classmethod
+    def from_log(cls, path, year=None, **kwargs):
+        return cls(load_capture(path, year), **kwargs)
+
+    @property
+    def device(self):
+        """ Hdmi2UsbDevice for this simulator (started) """
+        return Hdmi2UsbDevice(self.host, self.port)
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle_client, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    # Commands
+
+    def respond(self, command):
+        """
+        Answer a command
+        :param command: command line (str)
+        :return: list of response lines (str)
+        """
+        words = command.split()
+        if not words:
+            return []
+        if words[0] in ('video_matrix', 'x') and len(words) >= 2 and words[1] in ('connect', 'c'):
+            source = words[2] if len(words) > 2 else ''
+            sink = words[3] if len(words) > 3 else ''
+            if source not in SOURCES:
+                return ["Unknown video source: '{}'".format(source)]
+            if sink not in SINKS:
+                return ["Unknown video sink: '{}'".format(sink)]
+            self.matrix[sink] = source
+            return ['Connecting {} to {}'.format(source, sink)]
+        if words[0] == 'debug' and len(words) == 3 and words[1] in self.debug and words[2] in ('on', 'off'):
+            self.debug[words[1]] = words[2] == 'on'
+            return ['HDMI Input {} debug {}'.format(words[1][-1], words[2])]
+        if words[:2] == ['status', 'short'] and len(words) == 3:
+            self.status_short = words[2] == 'on'
+            return []
+        if words[0] in SINKS[:2] + SOURCES[:2] and len(words) == 2 and words[1] in ('on', 'off'):
+            if words[0] in SINKS and words[1] == 'off':
+                self.matrix[words[0]] = None
+            return ['{} {}'.format('Enabling' if words[1] == 'on' else 'Disabling', words[0])]
+        if words[0] == 'version':
+            return ['hdmi2usbmon simulator']
+        return ["Unknown command '{}'".format(words[0])]
+
+    async def read_commands(self, reader, writer):
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            command = line.decode('ascii', 'replace').strip()
+            self.commands.append(command)
+            response = [command] + self.respond(command)
+            writer.write(b''.join(text.encode('ascii') + b'\r\n' for text in response) + PROMPT)
+
+    # Replay
+
+    async def replay(self, writer):
+        if not self.lines:
+            return
+        first = self.lines[0][0]
+        pending = list()
+        for _ in range(self.repeat):
+            start = time.monotonic()
+            for timestamp, message in self.lines:
+                if self.speed:
+                    delay = (timestamp - first) / self.speed - (time.monotonic() - start)
+                    if delay > 0:
+                        writer.write(b''.join(pending))
+                        pending = list()
+                        await writer.drain()
+                        await asyncio.sleep(delay)
+                pending.append(message + b'\r\n')
+                if len(pending) >= 256:
+                    writer.write(b''.join(pending))
+                    pending = list()
+                    await writer.drain()
+        writer.write(b''.join(pending))
+        await writer.drain()
+
+    async def handle_client(self, reader, writer):
+        self.connections += 1
+        commands = asyncio.ensure_future(self.read_commands(reader, writer))
+        try:
+            await self.replay(writer)
+            if self.linger:
+                await commands
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            commands.cancel()
+            writer.close()
+
+
+class SimulatorThread(threading.Thread):
+    """
+    Run any number of simulators on an event loop in a background thread, for synchronous clients
+    """
+
+    def __init__(self, *simulators):
+        super(SimulatorThread, self).__init__(name='SimulatorThread')
+        self.daemon = True
+        self.simulators = simulators
+        self.loop = None
+        self.ready = threading.Event()
+        self.error = None
+
+    @property
+    def devices(self):
+        return [simulator.device for simulator in self.simulators]
+
+    def start(self):
+        """ start the thread and wait until every simulator is listening """
+        super(SimulatorThread, self).start()
+        self.ready.wait()
+        if self.error is not None:
+            raise self.error
+        return self
+
+    def run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            for simulator in self.simulators:
+                self.loop.run_until_complete(simulator.start())
+        except Exception as exc:
+            self.error = exc
+        self.ready.set()
+        if self.error is None:
+            self.loop.run_forever()
+        for simulator in self.simulators:
+            self.loop.run_until_complete(simulator.close())
+        # end the client connections still being served
+        tasks = asyncio.all_tasks(self.loop)
+        for task in tasks:
+            task.cancel()
+        self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self.loop.close()
+
+    def stop(self, timeout=None):
+        if self.loop is not None and self.is_alive():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        self.join(timeout)
@@ -0,0 +1,116 @@
+"""
+Instrumentation: snapshots of dispatcher, device reader and parser counters, optionally sent as periodic stats events
+"""
+import threading
+import time
+
+from .events import Event, STATS_EVENT
+from . import parser
+
+
+class ParseStats(object):
+    """
+    Count lines and parse time per line type
+
+    Drop-in replacement for parser.classify_line/parse_line when parsing should be measured,
+    code calling the parser functions directly pays nothing. Readers parse through it when it is passed as
+    their parser (FleetMonitor, AsyncDeviceReader, monitor_devices).
+    """
+
+    def __init__(self):
+        self.types = dict()  # line type -> [lines, seconds]
+
+    def _add(self, kind, seconds):
+        counters = self.types.get(kind)
+        if counters is None:
+            counters = self.types[kind] = [0, 0.0]
+        counters[0] += 1
+        counters[1] += seconds
+
+    def classify_line(self, line, device=None):
+        """ parser.classify_line, timed """
+        start = time.perf_counter()
+        kind, fields = parser.classify_line(line, device)
+        self._add(kind, time.perf_counter() - start)
+        return kind, fields
+
+    def parse_line(self, line, device=None, timestamp=None):
+        """ parser.parse_line, timed """
+        start = time.perf_counter()
+        event = parser.parse_line(line, device, timestamp)
+        self._add(event.event_type[0], time.perf_counter() - start)
+        return event
+
+    def snapshot(self):
+        """ :return: dict of line type -> dict(lines=, seconds=) """
+        return dict((kind, dict(lines=counters[0], seconds=counters[1])) for kind, counters in self.types.items())
+
+
+class Instrumentation(object):
+    """
+    Collect the counters of a dispatcher, device readers and a ParseStats into one snapshot
+    """
+
+    def __init__(self, dispatcher=None, readers=(), parse_stats=None):
+        """
+        :param dispatcher: EventDispatcher (stats are enabled if they aren't yet), also receives the stats events
+        :param readers: objects with a device_stats() method (FleetMonitor, AsyncDeviceReader)
+        :param parse_stats: ParseStats
+        """
+        self.dispatcher = dispatcher
+        self.readers = list(readers)
+        self.parse_stats = parse_stats
+        if dispatcher is not None and dispatcher.stats is None:
+            dispatcher.enable_stats()
+
+    def add_reader(self, reader):
+        self.readers.append(reader)
+
+    def snapshot(self):
+        """
+        :return: dict(time=, dispatcher=, devices=, parser=), parts that are not instrumented are None
+        """
+        devices = None
+        if self.readers:
+            devices = dict()
+            for reader in self.readers:
+                for name, counts in reader.device_stats().items():
+                    total = devices.setdefault(name, dict(bytes=0, lines=0))
+                    total['bytes'] += counts['bytes']
+                    total['lines'] += counts['lines']
+        return dict(
+            time=time.time(),
+            dispatcher=self.dispatcher.snapshot() if self.dispatcher is not None else None,
+            devices=devices,
+            parser=self.parse_stats.snapshot() if self.parse_stats is not None else None,
+        )
+
+    def stats_event(self):
+        """ :return: Event of type STATS_EVENT with a snapshot as data """
+        return Event(STATS_EVENT, self.snapshot())
+
+    def send_stats(self):
+        """ queue a stats event on the dispatcher, never blocks """
+        return self.dispatcher.send_event(self.stats_event(), block=False)
+
+
+class StatsReporter(threading.Thread):
+    """
+    Send a stats event through the dispatcher every interval seconds
+    """
+
+    def __init__(self, instrumentation, interval=10.0):
+        super(StatsReporter, self).__init__(name='StatsReporter')
+        self.daemon = True
+        self.instrumentation = instrumentation
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.instrumentation.send_stats()
+
+    def stop(self, timeout=None):
+        self.stopped.set()
+        if self.is_alive():
+            self.join(timeout)
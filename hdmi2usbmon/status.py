@@ -1,18 +1,299 @@
 """
 USB Hdmi2Usb status objects
+
+Hdmi2UsbStatus is updated in place from parsed lines (parser.classify_line) and reports which fields changed,
+so consumers can handle state transitions instead of every line. Noisy fields only count as changed once they
+moved further than their threshold from the value last reported.
 """
+from .device import Hdmi2UsbDevice
+from .events import Event, EventHandler
+from .parser import (DVISAMPLER_EVENT, DVISAMPLER_MESSAGE, DVISAMPLER_MESSAGES, FIFO_OVERFLOW, PLL_LOCK_LOST,
+                     PLL_LOCKED, INPUT_STATUS, OUTPUT_STATUS, ENCODER_STATUS, DDR_STATUS, STATUS2, classify_line)
+
+STATE_EVENT = 'state'
+
+# default thresholds of the noisy fields: pixclk jitters by some kHz, phases by a step or two
+THRESHOLDS = {
+    'pixclk': 10000,
+    'freq_khz': 10,
+    'ph': 2,
+}
+
+_MISSING = object()
+
+
+def _changed(previous, value, threshold):
+    if previous is _MISSING:
+        return value is not None
+    if previous == value:
+        return False
+    if not threshold or previous is None or value is None:
+        return True
+    if isinstance(value, tuple):
+        return len(value) != len(previous) or any(abs(a - b) > threshold for a, b in zip(value, previous))
+    return abs(value - previous) > threshold
+
+
+class StatusItem(object):
+    """
+    Part of the device state: FIELDS are compared against the values last reported by changes()
+    """
+    FIELDS = ()
+
+    def __init__(self, name, thresholds=None):
+        self.name = name
+        self.thresholds = THRESHOLDS if thresholds is None else thresholds
+        self.reported = dict()
+        for field in self.FIELDS:
+            setattr(self, field, None)
+
+    def values(self):
+        """ :return: dict of the current field values """
+        return dict((field, getattr(self, field)) for field in self.FIELDS)
 
+    def set(self, fields):
+        """ set the FIELDS present in a dict of parsed fields """
+        for field in self.FIELDS:
+            if field in fields:
+                setattr(self, field, fields[field])
 
-class ChannelStatus(object):
+    def changes(self):
+        """
+        Compare the fields with the values last reported, and mark the changed ones as reported
+        :return: dict of changed fields -> new value
+        """
+        changes = dict()
+        reported = self.reported
+        thresholds = self.thresholds
+        for field in self.FIELDS:
+            value = getattr(self, field)
+            if _changed(reported.get(field, _MISSING), value, thresholds.get(field)):
+                changes[field] = value
+                reported[field] = value
+        return changes
 
-    def __init__(self, channel):
+
+class ChannelStatus(StatusItem):
+    """
+    State of one HDMI input: input status line, the last dvisampler telemetry and running counters
+    """
+    FIELDS = ('width', 'height', 'freq_khz', 'pixclk', 'ph', 'charsync', 'wer', 'chansync', 'locked')
+
+    def __init__(self, channel, thresholds=None):
+        super(ChannelStatus, self).__init__('input%d' % channel, thresholds)
         self.channel = channel
+        self.samples = 0
+        self.wer_total = [0, 0, 0]
+        self.fifo_overflows = 0
+        self.pll_lock_lost = 0
+        self.messages = 0
+
+    def update(self, record):
+        """
+        :param record: parser.DviSamplerRecord of this input
+        """
+        self.samples += 1
+        self.ph = record.ph
+        self.charsync = record.charsync
+        self.wer = record.wer
+        self.chansync = record.chansync
+        self.width = record.width
+        self.height = record.height
+        self.pixclk = record.pixclk
+        wer_total = self.wer_total
+        for channel, count in enumerate(record.wer):
+            wer_total[channel] += count
+
+    def add_message(self, kind):
+        """
+        :param kind: line type of a dvisampler message (parser.FIFO_OVERFLOW, ...)
+        """
+        self.messages += 1
+        if kind == FIFO_OVERFLOW:
+            self.fifo_overflows += 1
+        elif kind == PLL_LOCK_LOST:
+            self.pll_lock_lost += 1
+            self.locked = False
+        elif kind == PLL_LOCKED:
+            self.locked = True
+
+
+class OutputStatus(StatusItem):
+    FIELDS = ('enabled', 'width', 'height', 'refresh', 'source')
+
+    def __init__(self, output, thresholds=None):
+        super(OutputStatus, self).__init__('output%d' % output, thresholds)
+        self.output = output
+
+
+class EncoderStatus(StatusItem):
+    FIELDS = ('enabled', 'width', 'height', 'fps', 'mbps', 'source', 'quality')
+
+    def __init__(self, thresholds=None):
+        super(EncoderStatus, self).__init__('encoder', thresholds)
+
+
+class DdrStatus(StatusItem):
+    FIELDS = ('read', 'write', 'all')
+
+    def __init__(self, thresholds=None):
+        super(DdrStatus, self).__init__('ddr', thresholds)
+
+
+class EdidStatus(StatusItem):
+    FIELDS = ('primary', 'secondary')
+
+    def __init__(self, thresholds=None):
+        super(EdidStatus, self).__init__('edid', thresholds)
 
 
 class Hdmi2UsbStatus(object):
+    """
+    State of a device: inputs, outputs, encoder, EDID and DDR
+    """
+    MESSAGE_TYPES = frozenset(DVISAMPLER_MESSAGES.values()) | {DVISAMPLER_MESSAGE}
+    # line types update() applies
+    LINE_TYPES = MESSAGE_TYPES | {DVISAMPLER_EVENT, INPUT_STATUS, OUTPUT_STATUS, ENCODER_STATUS, DDR_STATUS, STATUS2}
 
-    def __init__(self, port):
+    def __init__(self, device, thresholds=None):
+        """
+        :param device: name of the device the status belongs to
+        :param thresholds: dict of field name -> threshold for noisy fields (default: THRESHOLDS)
+        """
         self.connected = False
-        self.port = port
-        self.devices = [ChannelStatus(0), ChannelStatus(1)]
+        self.device = device
+        self.thresholds = THRESHOLDS if thresholds is None else thresholds
+        self.devices = [ChannelStatus(0, self.thresholds), ChannelStatus(1, self.thresholds)]
+        self.outputs = [OutputStatus(0, self.thresholds), OutputStatus(1, self.thresholds)]
+        self.encoder = EncoderStatus(self.thresholds)
+        self.ddr = DdrStatus(self.thresholds)
+        self.edid = EdidStatus(self.thresholds)
+
+    @property
+    def port(self):
+        """ former name of device """
+        return self.device
+
+    def channel(self, number):
+        """ :return: ChannelStatus of an input, created if the device has more inputs than expected """
+        while number >= len(self.devices):
+            self.devices.append(ChannelStatus(len(self.devices), self.thresholds))
+        return self.devices[number]
+
+    def output(self, number):
+        """ :return: OutputStatus of an output, created if the device has more outputs than expected """
+        while number >= len(self.outputs):
+            self.outputs.append(OutputStatus(len(self.outputs), self.thresholds))
+        return self.outputs[number]
+
+    def items(self):
+        """ :return: list of all StatusItems """
+        return self.devices + self.outputs + [self.encoder, self.ddr, self.edid]
+
+    def _item(self, kind, fields):
+        """ apply a parsed line, :return: the StatusItem it updated or None """
+        if kind == DVISAMPLER_EVENT:
+            item = self.channel(fields.input)
+            item.update(fields)
+        elif kind in self.MESSAGE_TYPES:
+            if fields['input'] is None:
+                return None
+            item = self.channel(fields['input'])
+            item.add_message(kind)
+        elif kind == INPUT_STATUS:
+            item = self.channel(fields['input'])
+            item.set(fields)
+        elif kind == OUTPUT_STATUS:
+            item = self.output(fields['output'])
+            if not fields['enabled']:
+                item.width = item.height = item.refresh = item.source = None
+            item.set(fields)
+        elif kind == ENCODER_STATUS:
+            item = self.encoder
+            if not fields['enabled']:
+                for field in item.FIELDS:
+                    setattr(item, field, None)
+            item.set(fields)
+        elif kind == DDR_STATUS:
+            item = self.ddr
+            item.set(fields)
+        elif kind == STATUS2 and 'edid_primary' in fields:
+            item = self.edid
+            item.primary = fields['edid_primary'].decode('ascii', 'replace')
+            item.secondary = fields['edid_secondary'].decode('ascii', 'replace')
+        else:
+            return None
+        return item
+
+    def update(self, kind, fields):
+        """
+        Apply a parsed line
+        :param kind: line type
+        :param fields: parsed fields
+        :return: (item name, dict of changed fields) if the line changed reported state, else None
+        """
+        item = self._item(kind, fields)
+        if item is None:
+            return None
+        changes = item.changes()
+        return (item.name, changes) if changes else None
+
+
+def parsed_line(event):
+    """
+    Get the parsed line of a line event, either raw from a monitor or parsed by parser.parse_line
+    :return: (device, line type, fields), or None for events that aren't lines
+    """
+    data = event.data
+    kind = event.event_type[0]
+    if kind == Hdmi2UsbDevice.LINE_EVENT:
+        if not isinstance(data, dict) or 'line' not in data:
+            return None
+        device = data.get('device')
+        kind, data = classify_line(data['line'], device)
+    elif isinstance(data, tuple):
+        device = data.device
+    elif isinstance(data, dict):
+        device = data.get('device')
+    else:
+        return None
+    return device, kind, data
+
+
+class StatusHandler(EventHandler):
+    """
+    Keep a Hdmi2UsbStatus per device from line events and send a STATE_EVENT for each change:
+    data = {'device': name, 'item': 'input1', 'changes': {'pixclk': 74250000, ...}}
+    State events are sent without blocking the dispatch, those the queue has no room for are counted in dropped.
+    """
+
+    def __init__(self, dispatcher, thresholds=None):
+        """
+        :param dispatcher: dispatcher the state events are sent to (they are dispatched with its next batch)
+        :param thresholds: thresholds of noisy fields (default: THRESHOLDS)
+        """
+        self.dispatcher = dispatcher
+        self.thresholds = thresholds
+        self.status = dict()  # device name -> Hdmi2UsbStatus
+        self.dropped = 0
+
+    def device_status(self, device):
+        status = self.status.get(device)
+        if status is None:
+            status = self.status[device] = Hdmi2UsbStatus(device, self.thresholds)
+        return status
+
+    def accept_event(self, event):
+        return event.event_type[0] != STATE_EVENT
 
+    def handle_event(self, event):
+        parsed = parsed_line(event)
+        if parsed is None or parsed[0] is None:
+            return
+        device, kind, fields = parsed
+        diff = self.device_status(device).update(kind, fields)
+        if diff is not None:
+            state = Event(STATE_EVENT, {'device': device, 'item': diff[0], 'changes': diff[1]},
+                          timestamp=event.timestamp)
+            if not self.dispatcher.send_event(state, block=False):
+                self.dropped += 1
@@ -0,0 +1,178 @@
+"""
+Compact in-memory store for dvisampler telemetry
+"""
+from array import array
+from bisect import bisect_left
+
+from .events import EventHandler
+from .parser import DVISAMPLER_EVENT, DviSamplerRecord
+
+# column name -> array typecode, about 37 bytes per sample
+COLUMNS = (
+    ('timestamp', 'd'),
+    ('device', 'H'),
+    ('input', 'B'),
+    ('ph0', 'h'), ('ph1', 'h'), ('ph2', 'h'),
+    ('wer0', 'I'), ('wer1', 'I'), ('wer2', 'I'),
+    ('pixclk', 'I'),
+    ('width', 'H'), ('height', 'H'),
+)
+TYPECODES = dict(COLUMNS)
+
+
+class TelemetryChunk(object):
+    """
+    Fixed-size block of samples, one preallocated array per column
+    """
+    __slots__ = ('columns', 'count', 'size', 'first', 'last', 'ordered')
+
+    def __init__(self, size):
+        self.columns = dict((name, array(typecode, [0]) * size) for name, typecode in COLUMNS)
+        self.count = 0
+        self.size = size
+        self.first = self.last = None
+        self.ordered = True
+
+    @property
+    def full(self):
+        return self.count >= self.size
+
+    @property
+    def nbytes(self):
+        return sum(column.itemsize * len(column) for column in self.columns.values())
+
+    def append(self, timestamp, device, record):
+        index = self.count
+        columns = self.columns
+        columns['timestamp'][index] = timestamp
+        columns['device'][index] = device
+        columns['input'][index] = record.input
+        columns['ph0'][index], columns['ph1'][index], columns['ph2'][index] = record.ph
+        columns['wer0'][index], columns['wer1'][index], columns['wer2'][index] = record.wer
+        columns['pixclk'][index] = record.pixclk
+        columns['width'][index] = record.width
+        columns['height'][index] = record.height
+        # first and last are the lowest and highest timestamps, which query() skips chunks by
+        if self.first is None:
+            self.first = self.last = timestamp
+        else:
+            if timestamp < self.last:
+                self.ordered = False
+            self.first = min(self.first, timestamp)
+            self.last = max(self.last, timestamp)
+        self.count = index + 1
+
+    def select(self, start, end):
+        """
+        :return: list of row indexes with start <= timestamp < end
+        """
+        timestamps = self.columns['timestamp']
+        if self.ordered:
+            return range(bisect_left(timestamps, start, 0, self.count), bisect_left(timestamps, end, 0, self.count))
+        return [index for index in range(self.count) if start <= timestamps[index] < end]
+
+
+class TelemetryStore(EventHandler):
+    """
+    Columnar store of dvisampler telemetry (DviSamplerRecord events), filled in fixed-size chunks
+    Device names are kept in a table and stored as indexes. As an EventHandler it stores every
+    'dvisampler' event dispatched to it.
+    """
+    CHUNK_SIZE = 65536
+
+    def __init__(self, chunk_size=None):
+        self.chunk_size = chunk_size or self.CHUNK_SIZE
+        self.chunks = list()
+        self.devices = list()
+        self._device_index = dict()
+
+    def __len__(self):
+        return sum(chunk.count for chunk in self.chunks)
+
+    @property
+    def nbytes(self):
+        """ memory used by the column arrays """
+        return sum(chunk.nbytes for chunk in self.chunks)
+
+    def device_index(self, device):
+        index = self._device_index.get(device)
+        if index is None:
+            index = self._device_index[device] = len(self.devices)
+            self.devices.append(device)
+        return index
+
+    def append(self, timestamp, record):
+        """
+        Add a sample
+        :param timestamp: sample timestamp
+        :param record: DviSamplerRecord
+        """
+        if not self.chunks or self.chunks[-1].full:
+            self.chunks.append(TelemetryChunk(self.chunk_size))
+        self.chunks[-1].append(timestamp, self.device_index(record.device), record)
+
+    # EventHandler interface
+
+    def accept_event(self, event):
+        return DVISAMPLER_EVENT in event.event_type
+
+    def handle_event(self, event):
+        self.append(event.timestamp, event.data)
+
+    def handle_events(self, events):
+        append = self.append
+        for event in events:
+            append(event.timestamp, event.data)
+
+    def event_types(self):
+        return DVISAMPLER_EVENT,
+
+    # Queries
+
+    def query(self, start=None, end=None, device=None, input=None, columns=None):
+        """
+        Select samples by time range, device and input
+        :param start: first timestamp (inclusive), None for no limit
+        :param end: last timestamp (exclusive), None for no limit
+        :param device: device name, None for all devices
+        :param input: input number, None for all inputs
+        :param columns: column names to return, None for all
+        :return: dict of column name -> array of the selected samples, in insertion order
+        """
+        start = float('-inf') if start is None else start
+        end = float('inf') if end is None else end
+        names = columns or [name for name, _ in COLUMNS]
+        result = dict((name, array(TYPECODES[name])) for name in names)
+        if device is not None:
+            device = self._device_index.get(device)
+            if device is None:
+                return result
+        for chunk in self.chunks:
+            if not chunk.count or chunk.last < start or chunk.first >= end:
+                continue
+            rows = chunk.select(start, end)
+            if device is not None or input is not None:
+                devices, inputs = chunk.columns['device'], chunk.columns['input']
+                rows = [index for index in rows
+                        if (device is None or devices[index] == device) and (input is None or inputs[index] == input)]
+            if isinstance(rows, range):
+                for name in names:
+                    result[name].extend(chunk.columns[name][rows.start:rows.stop])
+            else:
+                for name in names:
+                    column = chunk.columns[name]
+                    result[name].extend(column[index] for index in rows)
+        return result
+
+    def records(self, start=None, end=None, device=None, input=None):
+        """
+        Select samples as (timestamp, DviSamplerRecord) pairs; charsync, ctl_pos and chansync aren't stored
+        :return: generator of (timestamp, DviSamplerRecord)
+        """
+        result = self.query(start, end, device, input)
+        for index, timestamp in enumerate(result['timestamp']):
+            yield timestamp, DviSamplerRecord(
+                self.devices[result['device'][index]], result['input'][index],
+                (result['ph0'][index], result['ph1'][index], result['ph2'][index]), None, None,
+                (result['wer0'][index], result['wer1'][index], result['wer2'][index]), None,
+                result['width'][index], result['height'][index], result['pixclk'][index])
@@ -3,66 +3,64 @@
 Basic script to log hdmi2usbd streaming debug/status messages into a rotating log file.
 Requires 'nextgen' hdmi2usb firmware post 15 Jan 2016.
 """
-import logging
-import socket
 import sys
+import time
 
-from logging.handlers import TimedRotatingFileHandler
+from hdmi2usbmon.connection import Backoff
 from hdmi2usbmon.device import Hdmi2UsbDevice
+from hdmi2usbmon.logwriter import LogWriter
 
-
-def log_setup(log_filename):
-    """
-    Sets up logging for hourly rotating files in specified location, and stdout
-    """
-    format = logging.Formatter(
-        '%(asctime)s hdmi2usbd [%(process)d]: %(message)s',
-        '%b %d %H:%M:%S')
-
-    logger = logging.getLogger()
-    logger.setLevel(logging.INFO)
-
-    logfile_handler = TimedRotatingFileHandler(log_filename,
-                                           when="h",
-                                           interval=1)
-    logfile_handler.setFormatter(format)
-    logger.addHandler(logfile_handler)
-
-    stdout_handler = logging.StreamHandler(sys.stdout)
-    stdout_handler.setFormatter(format)
-    logger.addHandler(stdout_handler)
-
+# seconds a connection must stay up before the reconnect backoff starts from the first attempt again
+STABLE_CONNECTION = 60.0
 
 if __name__ == "__main__":
-    log_setup('/var/log/hdmi2usb/hdmi2usb')
+    # socket reads only queue the received bytes; formatting, hourly rotation and disk writes
+    # happen in batches on the LogWriter thread
+    writer = LogWriter('/var/log/hdmi2usb/hdmi2usb', stream=sys.stdout)
+    writer.start()
 
-    print("Attempting to connect to hdmi2usbd...")
+    # reconnect with jittered exponential backoff whenever hdmi2usbd goes away
+    backoff = Backoff()
+    attempt = 0
     h = Hdmi2UsbDevice('localhost', 8501)
-    h.connect()
-    h.sock.settimeout(5)
-    print("Connected.")
-
-    device = h.sock.makefile(mode='rwb')
-
-    device.write(b'version\r\n')
-    device.write(b'debug input0 on\r\n')
-    device.write(b'debug input1 on\r\n')
-    device.write(b'status short on\r\n')
-    device.flush()
-
-    while h.connected:
-        try:
-            line = device.readline()
+    try:
+        while True:
+            print("Attempting to connect to hdmi2usbd...")
+            try:
+                h.connect()
+            except OSError as exc:
+                delay = backoff.delay(attempt)
+                attempt += 1
+                print("Connect failed ({}), retrying in {:.1f}s".format(exc, delay))
+                time.sleep(delay)
+                continue
+            connected = time.time()
+            h.sock.settimeout(5)
+            print("Connected.")
+            h.sock.sendall(b''.join(command.encode() + b'\r\n'
+                                    for command in ('version',) + Hdmi2UsbDevice.SUBSCRIBE_COMMANDS))
 
-            if line:
-                line = line.strip()
+            while h.connected:
                 try:
-                    logging.info(line.decode('ascii'))
-                except UnicodeDecodeError:
-                    # non-ascii byte encountered (i.e. a ^C)
-                    logging.info(line)
+                    data = h.sock.recv(65536)
+                    if data:
+                        writer.put(data)
+                    else:
+                        # connection closed by hdmi2usbd
+                        h.close()
 
-        except socket.timeout:
-            # either not getting data, or connection terminated
-            h.close()
+                except OSError:
+                    # either not getting data (socket.timeout), or connection terminated
+                    h.close()
+            # a device that drops right after connecting keeps backing off
+            if time.time() - connected >= STABLE_CONNECTION:
+                attempt = 0
+            delay = backoff.delay(attempt)
+            attempt += 1
+            print("Disconnected, reconnecting in {:.1f}s".format(delay))
+            time.sleep(delay)
+    except KeyboardInterrupt:
+        h.close()
 
+    writer.close()
+    print("Log writer: {}".format(writer.stats()))
@@ -4,16 +4,20 @@ Simple UI to select opsis inputs via hdmi2usb.
 Requires 'nextgen' hdmi2usb firmware post 15 Jan 2016.
 """
 import logging
-import socket
 import sys
 import tkinter
 import threading
-import re
+import time
 
 from collections import OrderedDict
 from copy import deepcopy
 
+from hdmi2usbmon.channel import LatestValueChannel
+from hdmi2usbmon.connection import Backoff
 from hdmi2usbmon.device import Hdmi2UsbDevice
+from hdmi2usbmon.monitor import DeviceBuffer
+from hdmi2usbmon.status import Hdmi2UsbStatus
+from hdmi2usbmon import parser
 
 
 class Hdmi2UsbException(Exception): pass
@@ -48,89 +52,117 @@ class Hdmi2Usb(object):
         ('ddr', None),
     ])
 
+    # line types whose text is shown as the state of the item named in the line
+    STATE_LINE_TYPES = (parser.INPUT_STATUS, parser.OUTPUT_STATUS, parser.ENCODER_STATUS, parser.DDR_STATUS)
+
+    # seconds without data before reconnecting
+    READ_TIMEOUT = 30
+    # seconds a connection must stay up before the reconnect backoff starts from the first attempt again
+    STABLE_CONNECTION = 60.0
+
     def __init__(self, host, port):
         # parent_device should be device; workaround as using incomplete library
-        self.device, self.parent_device = self.get_hdmi2usb(host, port)
-        self.readthread = self.run_read_thread()
+        self.parent_device = self.get_hdmi2usb(host, port)
+        # frames lines and matches command replies, including the prompt ending the data read so far
+        self.buffer = DeviceBuffer(self.parent_device)
         self.state = deepcopy(self.HDMI2USB_STATES)
-        self.event_queue = []
+        self.status = Hdmi2UsbStatus(self.parent_device.name)
+        self.channel = LatestValueChannel()
+        self.backoff = Backoff()
+        self.attempt = 0
+        self.connected_at = time.time()
+        self.readthread = self.run_read_thread()
 
     def get_hdmi2usb(self, host='localhost', port=8501):
         h = Hdmi2UsbDevice(host, port)
         h.connect()
-        h.sock.settimeout(30)
+        h.sock.settimeout(self.READ_TIMEOUT)
         print("Connected.")
-        device = h.sock.makefile(mode='rwb')
-        return device, h
+        return h
 
     @property
     def connected(self):
         return self.parent_device.connected
 
-    def writeline(self, data):
-       """Converts string to byte, sends with \r\n and flushes"""
-       data = data.encode()
-       self.device.write(b'%b\r\n' % data)
-       self.device.flush()
+    def writeline(self, *commands):
+        """Sends commands in one write, returns a future CommandReply per command"""
+        return self.parent_device.send_commands(*commands)
 
     def run_read_thread(self):
-        """Runs thread that repeatedly reads from serial device"""
-        thread = threading.Thread(target=self.read_from_device)
+        """Runs thread that repeatedly reads from serial device, it ends with the UI"""
+        thread = threading.Thread(target=self.read_from_device, daemon=True)
         thread.start()
         return thread
 
     def read_from_device(self):
         # hacky; firmware should have machine readable output mode, don't hard code inputs/outputs/etc
-        while self.connected:
-            line = self.readline()
-            if line:
-                self.state_update(
-                    line,
-                    regex=b'^status1: in0: (?P<input0>.*), in1: (?P<input1>.*), out0: (?P<output0>.*), out1: (?P<output1>.*)\r\n')
-                self.state_update(
-                    line,
-                    regex=b'^status2: EDID: (?P<edid_primary>.*)/(?P<edid_secondary>.*), enc: (?P<encoder>.*), ddr: (?P<ddr>.*)\r\n')
-
-
-    def state_update(self, line, regex):
-        try:
-            result = [ item.groupdict() for item in re.finditer(regex, line) ]
-            if result:
-                for key, value in result[0].items():
-                    if value != self.state.get(key):
-                        #print('changed - %s:%s' % (key, value))
-                        self.state[key] = value
-                        self.event_queue.append({key: value})
-        except ValueError:
-            pass
-
-    def readline(self):
+        while True:
+            while self.connected:
+                for line in self.readlines():
+                    kind, fields = parser.classify_line(line)
+                    # the status model filters out repeated lines and pixclk jitter
+                    changed = self.status.update(kind, fields) is not None
+                    if kind == parser.STATUS1 or (kind == parser.STATUS2 and changed):
+                        self.state_update(fields)
+                    elif kind in self.STATE_LINE_TYPES and changed:
+                        self.state_update({fields['name']: line.partition(b':')[2].strip()})
+            self.reconnect()
+
+    def state_update(self, values):
+        for key, value in values.items():
+            if key in self.state and value != self.state[key]:
+                self.state[key] = value
+                self.channel.put(key, value)
+                self.channel.append_line('%s: %s' % (key, value.decode('ascii', 'replace')))
+
+    def readlines(self):
+        """ :return: lines received (prompts kept), empty once the connection is lost """
         try:
-            return self.device.readline()
-        except socket.timeout:
-            # doesn't work
-            print("Connect timed out, attempting to reconnect...")
-            self.device.close()
-            self.device.connect()
+            lines = self.buffer.recv(self.parent_device.sock)
+        except OSError as exc:
+            # socket.timeout or connection reset
+            print("Connection lost ({})".format(exc))
+            lines = None
+        if lines is None:
+            self.parent_device.close()
+            return []
+        return lines
+
+    def reconnect(self):
+        """Connects again with jittered exponential backoff, until it succeeds"""
+        # a device that drops right after connecting keeps backing off
+        if time.time() - self.connected_at >= self.STABLE_CONNECTION:
+            self.attempt = 0
+        while not self.connected:
+            delay = self.backoff.delay(self.attempt)
+            self.attempt += 1
+            print("Disconnected, reconnecting in {:.1f}s".format(delay))
+            time.sleep(delay)
+            try:
+                self.parent_device.connect()
+                self.parent_device.sock.settimeout(self.READ_TIMEOUT)
+                self.buffer = DeviceBuffer(self.parent_device)
+                self.enable_device_info()
+            except OSError as exc:
+                print("Connect failed ({})".format(exc))
+                self.parent_device.close()
+        self.connected_at = time.time()
+        print("Connected.")
 
     def connect_input_output(self, input, output):
         if input in self.inputs and output in self.outputs:
             print("Connecting {} to {}...".format(input, output))
-            self.writeline('%s on' % input)
-            self.writeline('video_matrix connect %s %s' % (input, output))
+            return self.writeline('%s on' % input, 'video_matrix connect %s %s' % (input, output))
         else:
             raise Hdmi2UsbException('Invalid input or output')
 
     def output_off(self, output):
         if output in self.outputs:
             print("Turning output {} off...".format(output))
-            output = output.encode()
-            self.writeline('%s off' % output)
+            return self.writeline('%s off' % output)
 
     def enable_device_info(self):
-        for input in self.inputs:
-            self.writeline('debug %s on' % input)
-        self.writeline('status short on')
+        return self.writeline(*['debug %s on' % input for input in self.inputs] + ['status short on'])
 
     @property
     def inputs(self):
@@ -143,7 +175,11 @@ class Hdmi2Usb(object):
 
 class Hdmi2UsbControlUI(object):
 
-    UPDATE_DELAY = 500
+    # ms per frame: state labels and the debug pane are updated at most once per frame
+    UPDATE_DELAY = 100
+    # lines kept in the debug pane, trimmed in bulk when DEBUG_TRIM more have been added
+    DEBUG_LINES = 1000
+    DEBUG_TRIM = 200
 
     def __init__(self, host, port):
         self.device = Hdmi2Usb(host, port)
@@ -181,15 +217,18 @@ class Hdmi2UsbControlUI(object):
         return debug_frame, debug_text
 
     def update_hdmi2usb_state(self):
-        while self.device.event_queue:
-            event = self.device.event_queue.pop()
-            for key, value in event.items():
-                try:
-                    self.statelabels[key].config(text='{}: {}'.format(key, value.decode()))
-                except KeyError:
-                    pass
-                self.debug_text.insert(tkinter.END, '%s: %s\n' % (key, value))
-                self.debug_text.see(tkinter.END)
+        values, lines = self.device.channel.drain()
+        for key, value in values.items():
+            try:
+                self.statelabels[key].config(text='{}: {}'.format(key, value.decode()))
+            except KeyError:
+                pass
+        if lines:
+            self.debug_text.insert(tkinter.END, '\n'.join(lines) + '\n')
+            count = int(self.debug_text.index('end-1c').split('.')[0]) - 1
+            if count > self.DEBUG_LINES + self.DEBUG_TRIM:
+                self.debug_text.delete('1.0', '%d.0' % (count - self.DEBUG_LINES + 1))
+            self.debug_text.see(tkinter.END)
         self.root.after(self.UPDATE_DELAY, self.update_hdmi2usb_state)
 
     def draw_root_window(self):
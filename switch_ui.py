@@ -8,6 +8,7 @@ import socket
 import sys
 import tkinter
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 from hdmi2usbmon.device import Hdmi2UsbDevice
 
@@ -29,8 +30,13 @@ class Hdmi2Usb(object):
         ('e', 'encoder'),
     ])
 
+    # seconds to wait for command replies
+    TIMEOUT = 5
+
     def __init__(self, host, port):
         self.device = self.get_hdmi2usb(host, port)
+        # one worker: commands are executed in order, without blocking the UI thread
+        self.executor = ThreadPoolExecutor(max_workers=1)
 
     # possible __call__ wrapper to catch socket timeout; reconnect
 
@@ -40,28 +46,32 @@ class Hdmi2Usb(object):
         h.connect()
         #h.sock.settimeout(5)
         print("Connected.")
-        device = h.sock.makefile(mode='rwb')
-        return device
+        return h
+
+    def execute(self, *commands):
+        """Sends commands in one write, the replies are waited for and printed on the worker thread"""
+        return self.executor.submit(self._execute, *commands)
 
-    def write(self, data):
-       self.device.write(data)
-       self.device.flush()
+    def _execute(self, *commands):
+        try:
+            replies = self.device.execute(*commands, timeout=self.TIMEOUT)
+        except OSError as exc:
+            # TimeoutError or ConnectionError
+            print("{}: {}".format(', '.join(commands), exc))
+            return
+        for reply in replies:
+            print("{} ({:.1f} ms): {}".format(reply.command, reply.latency * 1000,
+                                             b' / '.join(reply.lines).decode('ascii', 'replace')))
 
     def connect_input_output(self, input, output):
         if input in self.inputs and output in self.outputs:
             print("Connecting {} to {}...".format(input, output))
-            input = input.encode()
-            output = output.encode()
-            self.write(b'%b on\r\n' % (input))
-            self.write(b'video_matrix connect %b %b\r\n' % (input, output))
+            self.execute('%s on' % input, 'video_matrix connect %s %s' % (input, output))
         else:
             raise Hdmi2UsbException('Invalid input or output')
 
     def enable_device_info(self):
-        self.write(b'debug input0 on\r\n')
-        self.write(b'debug input1 on\r\n')
-        self.write(b'status short on\r\n')
-        self.flush()
+        self.execute(*Hdmi2UsbDevice.SUBSCRIBE_COMMANDS)
 
     @property
     def inputs(self):
@@ -0,0 +1,130 @@
+import asyncio
+from unittest import TestCase
+
+from hdmi2usbmon.aio import monitor_devices
+from hdmi2usbmon.device import Hdmi2UsbDevice
+from hdmi2usbmon.events import AsyncEventDispatcher, Event, EventHandler, EventTypeHandler, SyncHandlerAdapter
+
+
+class ListHandler(EventHandler):
+    def __init__(self):
+        self.events = list()
+
+    def accept_event(self, event):
+        return True
+
+    def handle_event(self, event):
+        self.events.append(event)
+
+
+class TestAsyncEventDispatcher(TestCase):
+
+    def test_coroutine_and_sync_handlers(self):
+        seen = list()
+
+        async def handler(event):
+            await asyncio.sleep(0)
+            seen.append(event.data)
+
+        sync_handler = ListHandler()
+        dispatcher = AsyncEventDispatcher(indexed=True)
+        dispatcher.add_handler(EventTypeHandler(handler, 'a'))
+        dispatcher.add_handler(SyncHandlerAdapter(sync_handler))
+        counts = asyncio.run(dispatcher.dispatch_events(Event('a', 1), Event('b', 2)))
+        self.assertEqual(counts, (2, 3))
+        self.assertEqual(seen, [1])
+        self.assertEqual([event.data for event in sync_handler.events], [1, 2])
+
+    def test_dispatch_batch(self):
+        seen, batches = list(), list()
+
+        async def handler(event):
+            await asyncio.sleep(0)
+            seen.append(event.data)
+
+        class BatchHandler(ListHandler):
+            async def handle_events(self, events):
+                await asyncio.sleep(0)
+                batches.append([event.data for event in events])
+
+        async def dispatch():
+            dispatcher = AsyncEventDispatcher()
+            dispatcher.add_handler(EventTypeHandler(handler))
+            dispatcher.add_handler(BatchHandler())
+            for item in range(5):
+                dispatcher.send_event_nowait(Event('a', item))
+            first = await dispatcher.dispatch_batch(max_events=3)
+            second = await dispatcher.dispatch_batch(max_events=3, max_latency=0.01)
+            await asyncio.wait_for(dispatcher.eventq.join(), 1)
+            return first, second
+
+        first, second = asyncio.run(dispatch())
+        self.assertEqual((first.events, first.handled), (3, 6))
+        self.assertEqual((second.events, second.handled), (2, 4))
+        self.assertEqual(seen, [0, 1, 2, 3, 4])
+        self.assertEqual(batches, [[0, 1, 2], [3, 4]])
+
+    def test_stats(self):
+        async def handler(event):
+            await asyncio.sleep(0.01)
+
+        async def dispatch():
+            dispatcher = AsyncEventDispatcher()
+            dispatcher.add_handler(EventTypeHandler(handler, 'a'))
+            dispatcher.add_handler(ListHandler())
+            dispatcher.enable_stats()
+            await dispatcher.dispatch_events(Event('a', timestamp=1000.0), Event('b'))
+            dispatcher.send_event_nowait(Event('a'))
+            await dispatcher.dispatch_batch()
+            return dispatcher.snapshot()
+
+        snapshot = asyncio.run(dispatch())
+        self.assertEqual((snapshot['events'], snapshot['batches']), (3, 1))
+        self.assertEqual([entry['calls'] for entry in snapshot['handlers']], [2, 3])
+        self.assertGreaterEqual(snapshot['handlers'][0]['seconds'], 0.02)
+        self.assertEqual(snapshot['wait_time']['count'], 3)
+        self.assertLess(snapshot['wait_time']['sum'], 1.0)
+        self.assertEqual(snapshot['queue_depth']['count'], 3)
+
+
+class TestMonitorDevices(TestCase):
+
+    LINES = [b'HDMI2USB>dvisampler1: lost PLL lock', b'output0: off']
+
+    async def serve(self, count, handler=None):
+        received = list()
+
+        async def client(reader, writer):
+            received.append(await reader.readline())
+            writer.write(b''.join(line + b'\r\n' for line in self.LINES))
+            await writer.drain()
+            writer.close()
+
+        servers = [await asyncio.start_server(client, '127.0.0.1', 0) for _ in range(count)]
+        devices = [Hdmi2UsbDevice('127.0.0.1', server.sockets[0].getsockname()[1]) for server in servers]
+        handler = handler or ListHandler()
+        dispatcher = AsyncEventDispatcher()
+        dispatcher.add_handler(handler)
+        results = await monitor_devices(dispatcher, *devices, commands=('status short on',))
+        for server in servers:
+            server.close()
+        return devices, received, results, handler.events
+
+    def test_monitor_devices(self):
+        devices, received, results, events = asyncio.run(self.serve(3))
+        self.assertEqual(received, [b'status short on\r\n'] * 3)
+        self.assertEqual(results, [2, 2, 2])
+        self.assertEqual(len(events), 6)
+        for device in devices:
+            lines = [event.data['line'] for event in events if event.data['device'] == device.name]
+            self.assertEqual(lines, self.LINES)
+
+    def test_slow_handler_not_cancelled(self):
+        class SlowHandler(ListHandler):
+            async def handle_event(self, event):
+                await asyncio.sleep(0.01)
+                self.events.append(event)
+
+        devices, received, results, events = asyncio.run(self.serve(2, SlowHandler()))
+        self.assertEqual(results, [2, 2])
+        self.assertEqual(len(events), 4)
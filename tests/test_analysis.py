@@ -0,0 +1,58 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from hdmi2usbmon import parser
+from hdmi2usbmon.analysis import LogSummary, RunningStats, analyze_file, analyze_logs, format_summary
+
+TEST_LOG = os.path.join(os.path.dirname(__file__), '..', 'test-data', 'hdmi2usb.2017-01-15_17')
+
+
+class TestAnalysis(TestCase):
+
+    def test_running_stats_merge(self):
+        values = [3.0, 5.0, 8.0, 13.0, 21.0]
+        whole, first, second = RunningStats(), RunningStats(), RunningStats()
+        for index, value in enumerate(values):
+            whole.add(value)
+            (first if index < 2 else second).add(value)
+        merged = first.merge(second)
+        self.assertEqual((merged.count, merged.minimum, merged.maximum), (5, 3.0, 21.0))
+        self.assertAlmostEqual(merged.mean, whole.mean)
+        self.assertAlmostEqual(merged.stddev, whole.stddev)
+
+    def test_split_files_match_whole(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            with open(TEST_LOG, 'rb') as logfile:
+                lines = logfile.readlines()
+            # TimedRotatingFileHandler names: the live file 'hdmi2usb' (the newest part) sorts first
+            names = ('hdmi2usb.2017-01-15_14', 'hdmi2usb.2017-01-15_15', 'hdmi2usb.2017-01-15_16', 'hdmi2usb')
+            for index, name in enumerate(names):
+                with open(os.path.join(tmpdir, name), 'wb') as part:
+                    part.writelines(lines[index * len(lines) // 4:(index + 1) * len(lines) // 4])
+            whole = analyze_file(TEST_LOG, 2017)
+            merged = analyze_logs(os.path.join(tmpdir, 'hdmi2usb*'), 2017, max_workers=2)
+        finally:
+            shutil.rmtree(tmpdir)
+        self.assertEqual((merged.files, merged.lines, merged.first, merged.last),
+                         (4, whole.lines, whole.first, whole.last))
+        expected, result = whole.inputs[1], merged.inputs[1]
+        self.assertEqual(result.samples, expected.samples)
+        self.assertEqual(result.wer, expected.wer)
+        self.assertEqual(result.messages, expected.messages)
+        self.assertEqual(result.pll_lost, expected.pll_lost)
+        self.assertEqual(result.resolutions, expected.resolutions)
+        self.assertEqual(len(result.pll_lost), expected.messages[parser.PLL_LOCK_LOST])
+        self.assertAlmostEqual(result.pixclk.mean, expected.pixclk.mean, places=3)
+        self.assertEqual(result.pixclk_drift, expected.pixclk_drift)
+
+    def test_unnumbered_message(self):
+        summary = LogSummary()
+        summary.add_line(100.0, b'dvisampler1: lost PLL lock')
+        summary.add_line(101.0, b'dvisampler: lost PLL lock')
+        self.assertEqual(list(summary.inputs), [1])
+        self.assertEqual(summary.lines, 2)
+        merged = LogSummary().merge(summary)
+        self.assertIn('input1: 0 samples', format_summary(merged))
@@ -0,0 +1,121 @@
+from unittest import TestCase
+
+from hdmi2usbmon.anomaly import (ANOMALY_EVENT, PHASE, PHASE_JITTER, PIXCLK_PPM, WER_RATE, AnomalyHandler, Ewma,
+                                 nominal_pixclk)
+from hdmi2usbmon.device import Hdmi2UsbDevice
+from hdmi2usbmon.events import EventDispatcher, EventTypeHandler
+from hdmi2usbmon.parser import classify_line, parse_line
+
+
+def dvisampler(pixclk=74250000, ph=(4, 4, 4), wer=(0, 0, 0), res=b'1280x720'):
+    return (b'dvisampler1: ph:   %d    %d    %d // charsync:111 [9 9 9] // WER:  %d   %d   %d // '
+            b'chansync:1 // res:%s // pixclk:%d Hz' % (ph + wer + (res, pixclk)))
+
+
+class TestEwma(TestCase):
+
+    def test_constant(self):
+        average = Ewma(0.1)
+        for _ in range(50):
+            average.add(5)
+        self.assertEqual(average.mean, 5.0)
+        self.assertEqual(average.variance, 0.0)
+        self.assertEqual(average.zscore(6), 0.0)
+        self.assertEqual(average.zscore(6, min_stddev=0.5), 2.0)
+
+    def test_alternating(self):
+        average = Ewma(0.05)
+        for index in range(2000):
+            average.add(index % 2)
+        self.assertAlmostEqual(average.mean, 0.5, delta=0.05)
+        self.assertAlmostEqual(average.stddev, 0.5, delta=0.05)
+
+
+class TestAnomalyHandler(TestCase):
+
+    def setUp(self):
+        self.dispatcher = EventDispatcher()
+        self.detector = AnomalyHandler(self.dispatcher)
+        self.dispatcher.add_handler(self.detector)
+        self.anomalies = list()
+        self.dispatcher.add_handler(EventTypeHandler(self.anomalies.append, ANOMALY_EVENT))
+
+    def feed(self, *lines):
+        for line in lines:
+            self.dispatcher.send_event(parse_line(line, 'dev'))
+            while self.dispatcher.dispatch_batch().events:
+                pass
+        return [(event.data['metric'], event.data['channel'], event.data['active']) for event in self.anomalies]
+
+    def steady(self, count=50):
+        return [dvisampler(ph=(4 + index % 2, 4, 5 - index % 2)) for index in range(count)]
+
+    def test_steady(self):
+        self.assertEqual(self.feed(*self.steady(200)), [])
+        stats = self.detector.inputs[('dev', 1)]
+        self.assertEqual(stats.samples, 200)
+        self.assertAlmostEqual(stats.phases[0].mean, 4.5, delta=0.1)
+
+    def test_phase_drift(self):
+        self.feed(*self.steady())
+        self.assertEqual(self.feed(dvisampler(ph=(8, 4, 4))), [(PHASE, 0, True)])
+        event = self.anomalies[0]
+        self.assertEqual(event.data['device'], 'dev')
+        self.assertEqual(event.data['input'], 1)
+        self.assertGreater(event.data['value'], event.data['limit'])
+        self.assertEqual(self.feed(dvisampler(ph=(5, 4, 4)))[1:], [(PHASE, 0, False)])
+
+    def test_phase_jitter(self):
+        self.feed(*self.steady())
+        lines = [dvisampler(ph=(4, 4 + 4 * (index % 2), 4)) for index in range(30)]
+        self.assertIn((PHASE_JITTER, 1, True), self.feed(*lines))
+
+    def test_wer_rate(self):
+        self.feed(*self.steady())
+        anomalies = self.feed(*[dvisampler(wer=(10, 0, 3)) for _ in range(5)])
+        self.assertEqual(anomalies.count((WER_RATE, None, True)), 1)
+        self.feed(*self.steady(100))
+        self.assertEqual(self.anomalies[-1].data['metric'], WER_RATE)
+        self.assertFalse(self.anomalies[-1].data['active'])
+
+    def test_pixclk(self):
+        self.assertEqual(self.feed(dvisampler(pixclk=74249958)), [])
+        self.assertEqual(self.feed(dvisampler(pixclk=74400000)), [(PIXCLK_PPM, None, True)])
+        self.assertAlmostEqual(self.anomalies[0].data['value'], 2020, delta=1)
+
+    def test_pixclk_59_94(self):
+        self.assertEqual(nominal_pixclk((1280, 720), 74175824), 74250000 * 1000.0 / 1001)
+        self.assertEqual(nominal_pixclk((1280, 720), 74240000), 74250000)
+        self.assertEqual(nominal_pixclk((640, 480), 25200000), 25175000 * 1001.0 / 1000)
+        self.assertIsNone(nominal_pixclk((1920, 1080), 148500000))
+        self.assertEqual(self.feed(*[dvisampler(pixclk=74175824) for _ in range(30)]), [])
+
+    def test_reset_clears_active(self):
+        self.feed(*self.steady())
+        self.feed(dvisampler(ph=(8, 4, 4)))
+        self.assertEqual(self.feed(b'dvisampler1: lost PLL lock'), [(PHASE, 0, True), (PHASE, 0, False)])
+        self.assertIsNone(self.anomalies[-1].data['value'])
+        self.assertEqual(self.detector.inputs[('dev', 1)].active, {})
+
+    def test_reset(self):
+        self.feed(*self.steady())
+        self.feed(b'dvisampler1: lost PLL lock')
+        self.assertEqual(self.detector.inputs[('dev', 1)].samples, 0)
+        # no z-scores before the statistics warmed up again
+        self.assertEqual(self.feed(dvisampler(ph=(20, 20, 20))), [])
+
+    def test_add_sample(self):
+        self.feed(*self.steady())
+        self.detector.add_sample(classify_line(dvisampler(ph=(9, 4, 4)), 'dev')[1])
+        self.dispatcher.dispatch_batch()
+        self.assertEqual(self.anomalies[0].data['metric'], PHASE)
+
+    def test_line_events(self):
+        device = Hdmi2UsbDevice('dev', 1)
+        for line in self.steady() + [b'HDMI2USB>' + dvisampler(ph=(4, 4, 9))]:
+            self.dispatcher.send_event(device.line_event(line))
+        while self.dispatcher.dispatch_batch().events:
+            pass
+        self.assertEqual(len(self.anomalies), 1)
+        self.assertEqual(self.anomalies[0].data['channel'], 2)
+        self.assertEqual(self.anomalies[0].data['device'], device.name)
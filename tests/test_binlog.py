@@ -0,0 +1,98 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from hdmi2usbmon import parser
+from hdmi2usbmon.binlog import BinaryLogReader, BinaryLogWriter, import_text_log, segment_paths
+from hdmi2usbmon.device import Hdmi2UsbDevice
+from hdmi2usbmon.events import EventDispatcher
+
+TEST_LOG = os.path.join(os.path.dirname(__file__), '..', 'test-data', 'hdmi2usb.2017-01-15_17')
+
+
+class TestBinaryLog(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.prefix = os.path.join(self.tmpdir, 'hdmi2usb')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_write_read(self):
+        writer = BinaryLogWriter(self.prefix, segment_size=1024, index_interval=4)
+        dispatcher = EventDispatcher()
+        dispatcher.add_handler(writer)
+        for index in range(100):
+            device = Hdmi2UsbDevice('opsis', index % 2)
+            line = (b'dvisampler1: ph:  %d 2 3 // charsync:111 [9 9 9] // WER:0 0 0 // chansync:1 // '
+                    b'res:1280x720 // pixclk:74250000 Hz' % index) if index % 3 else b'output0: off'
+            dispatcher.send_event(device.line_event(line, timestamp=1000.0 + index))
+        dispatcher.dispatch_events()
+        writer.close()
+        self.assertGreater(len(segment_paths(self.prefix)), 1)
+        reader = BinaryLogReader(self.prefix)
+        events = list(reader.query(1050.0, 1060.0))
+        self.assertEqual([event.timestamp for event in events], [1050.0 + index for index in range(10)])
+        self.assertEqual((events[0].data.device, events[0].data.ph), ('opsis:0', (50, 2, 3)))
+        self.assertEqual(list(events[1].event_type), [parser.OUTPUT_STATUS])
+        self.assertEqual(events[1].data['device'], 'opsis:1')
+        events = list(reader.query(1050.0, 1060.0, device='opsis:1'))
+        self.assertEqual(len(events), 5)
+        reader.close()
+
+    def test_import(self):
+        writer = BinaryLogWriter(self.prefix)
+        count = import_text_log(TEST_LOG, writer, device='opsis', year=2017)
+        writer.close()
+        self.assertGreater(count, 8000)
+        reader = BinaryLogReader(self.prefix)
+        start = parser.parse_log_time(b'Jan 15 17:42:00', 2017)
+        events = list(reader.query(start, start + 60))
+        self.assertTrue(events)
+        self.assertTrue(all(start <= event.timestamp < start + 60 for event in events))
+        self.assertEqual(len(list(reader.query())), count)
+        reader.close()
+
+    def write_lines(self, timestamps, **kwargs):
+        writer = BinaryLogWriter(self.prefix, **kwargs)
+        for timestamp in timestamps:
+            writer.write(timestamp, 'opsis', b'output0: off')
+        writer.close()
+        return segment_paths(self.prefix)
+
+    def test_truncated_segment(self):
+        path = self.write_lines([1000.0 + index for index in range(10)])[-1]
+        with open(path, 'r+b') as segment:
+            segment.truncate(os.path.getsize(path) - 3)
+        # an empty segment (created, not written) and one without an index
+        open(self.prefix + '-000001.seg', 'wb').close()
+        open(self.prefix + '-000001.idx', 'wb').close()
+        self.write_lines([2000.0, 2001.0])
+        os.remove(self.prefix + '-000002.idx')
+        reader = BinaryLogReader(self.prefix)
+        timestamps = [event.timestamp for event in reader.query()]
+        self.assertEqual(timestamps, [1000.0 + index for index in range(9)] + [2000.0, 2001.0])
+        self.assertEqual([event.timestamp for event in reader.query(2001.0)], [2001.0])
+        reader.close()
+
+    def test_clock_set_back(self):
+        # the wall clock is set back by 5s after 20 records
+        timestamps = [1000.0 + index for index in range(20)] + [1015.0 + index for index in range(20)]
+        self.write_lines(timestamps, index_interval=4)
+        reader = BinaryLogReader(self.prefix)
+        events = [event.timestamp for event in reader.query(1016.0, 1019.0)]
+        self.assertEqual(events, [1016.0, 1017.0, 1018.0, 1016.0, 1017.0, 1018.0])
+        reader.close()
+
+    def test_clock_set_back_interval(self):
+        # an interval out of order with the ones before and after it
+        self.write_lines([100.0, 101.0, 200.0, 201.0, 50.0, 125.0, 150.0, 151.0], index_interval=2)
+        reader = BinaryLogReader(self.prefix)
+        self.assertEqual([event.timestamp for event in reader.query(120.0, 130.0)], [125.0])
+        self.assertEqual([event.timestamp for event in reader.query(40.0, 60.0)], [50.0])
+        self.assertEqual([event.timestamp for event in reader.query(300.0)], [])
+        segment = reader.segments[0]
+        self.assertEqual(segment._spans(120.0, 130.0), [(segment.starts[2], segment.ends[2])])
+        reader.close()
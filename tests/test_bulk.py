@@ -0,0 +1,69 @@
+import os
+import unittest
+from unittest import TestCase
+
+from hdmi2usbmon import bulk
+from hdmi2usbmon.parser import parse_dvisampler, parse_log_line
+
+TEST_LOG = os.path.join(os.path.dirname(__file__), '..', 'test-data', 'hdmi2usb.2017-01-15_17')
+
+
+@unittest.skipIf(bulk.np is None, 'numpy is not installed')
+class TestBulkLoad(TestCase):
+
+    def test_load_buffer(self):
+        data = (b'Jan 15 17:25:45 hdmi2usbd [671]: HDMI2USB>dvisampler1: ph:   4    2   6 // charsync:110 [9 8 9] // '
+                b'WER:31212 545 2921 // chansync:0 // res:1280x720 // pixclk:74249958 Hz\n'
+                b'Jan 15 17:25:46 hdmi2usbd [671]: output0: off\n'
+                b'garbage\n'
+                b'Jan 15 17:25:47 hdmi2usbd [671]: dvisampler0: ph: 1 2 3 // charsync:111 [9 9 9] // '
+                b'WER: 0 0 0 // chansync:1 // res:0x0 // pixclk:25 Hz')
+        telemetry, others = bulk.load_buffer(data, 2017)
+        self.assertEqual(len(telemetry), 2)
+        first = telemetry[0]
+        self.assertEqual(first['timestamp'], parse_log_line(data.split(b'\n')[0], 2017)[0])
+        self.assertEqual((first['input'], list(first['ph']), list(first['charsync']), list(first['ctl_pos'])),
+                         (1, [4, 2, 6], [1, 1, 0], [9, 8, 9]))
+        self.assertEqual((list(first['wer']), first['chansync'], first['width'], first['height'], first['pixclk']),
+                         ([31212, 545, 2921], 0, 1280, 720, 74249958))
+        self.assertEqual((telemetry[1]['input'], telemetry[1]['pixclk']), (0, 25))
+        self.assertEqual(others, [(first['timestamp'] + 1, b'output0: off')])
+
+    def test_input_numbers(self):
+        line = (b'Jan 15 17:25:45 hdmi2usbd [671]: dvisampler%s: ph: 1 2 3 // charsync:111 [9 9 9] // '
+                b'WER: 0 0 0 // chansync:1 // res:0x0 // pixclk:25 Hz\n')
+        data = b''.join(line % number for number in (b'1', b'12', b'', b'x', b'1234'))
+        telemetry, others = bulk.load_buffer(data, 2017)
+        self.assertEqual(telemetry['input'].tolist(), [1, 12])
+        self.assertEqual(len(others), 3)
+
+    def test_command_echo(self):
+        line = (b'Jan 15 17:25:45 hdmi2usbd [671]: %sdvisampler1: ph: 1 2 3 // charsync:111 [9 9 9] // '
+                b'WER: 0 0 0 // chansync:1 // res:0x0 // pixclk:25 Hz\n')
+        data = b''.join(line % prefix for prefix in (b'HDMI2USB>HDMI2USB>', b'x c ', b'output0 of'))
+        telemetry, others = bulk.load_buffer(data, 2017)
+        self.assertEqual(telemetry['input'].tolist(), [1, 1, 1])
+        self.assertEqual(others, [])
+
+    def test_load_log(self):
+        telemetry, others = bulk.load_log(TEST_LOG, 2017)
+        expected = list()
+        with open(TEST_LOG, 'rb') as logfile:
+            for line in logfile:
+                timestamp, message = parse_log_line(line, 2017)
+                record = parse_dvisampler(message)
+                if record is not None:
+                    expected.append((timestamp, record))
+        # including the lines after a command echo ('x c dvisampler1: ph: ...')
+        self.assertEqual(len(telemetry), len(expected))
+        self.assertEqual(len(expected), 7682)
+        for row, (timestamp, record) in zip(telemetry, expected):
+            self.assertEqual((row['timestamp'], tuple(row['ph']), tuple(row['wer']), row['pixclk']),
+                             (timestamp, record.ph, record.wer, record.pixclk))
+        self.assertEqual(len(telemetry) + len(others), 8069)
+
+    def test_load_logs(self):
+        telemetry, others = bulk.load_logs([TEST_LOG, TEST_LOG], 2017, max_workers=2)
+        single, single_others = bulk.load_log(TEST_LOG, 2017)
+        self.assertEqual(len(telemetry), 2 * len(single))
+        self.assertEqual(len(others), 2 * len(single_others))
@@ -0,0 +1,49 @@
+import threading
+from unittest import TestCase
+
+from hdmi2usbmon.channel import LatestValueChannel
+
+
+class TestLatestValueChannel(TestCase):
+
+    def test_latest_value_per_key(self):
+        channel = LatestValueChannel()
+        channel.put('input0', b'a')
+        channel.put('input1', b'b')
+        channel.put('input0', b'c')
+        values, lines = channel.drain()
+        self.assertEqual(list(values.items()), [('input1', b'b'), ('input0', b'c')])
+        self.assertEqual(lines, [])
+        self.assertEqual(channel.drain(), ({}, []))
+        self.assertEqual(channel.stats()['coalesced'], 1)
+
+    def test_bounded(self):
+        channel = LatestValueChannel(max_keys=2, max_lines=3)
+        for key in 'abc':
+            channel.put(key, key)
+        for number in range(5):
+            channel.append_line(str(number))
+        values, lines = channel.drain()
+        self.assertEqual(list(values), ['b', 'c'])
+        self.assertEqual(lines, ['2', '3', '4'])
+        self.assertEqual(channel.stats()['dropped'], 3)
+
+    def test_threads(self):
+        channel = LatestValueChannel()
+
+        def reader(name):
+            for number in range(10000):
+                channel.put(name, number)
+                channel.append_line(number)
+
+        threads = [threading.Thread(target=reader, args=(name,)) for name in ('input0', 'input1')]
+        for thread in threads:
+            thread.start()
+        latest = dict()
+        while any(thread.is_alive() for thread in threads):
+            values, lines = channel.drain()
+            self.assertLessEqual(len(lines), channel.max_lines)
+            latest.update(values)
+        values, _ = channel.drain()
+        latest.update(values)
+        self.assertEqual(latest, {'input0': 9999, 'input1': 9999})
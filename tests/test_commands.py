@@ -0,0 +1,123 @@
+import asyncio
+import socket
+from unittest import TestCase
+
+from hdmi2usbmon.aio import AsyncDeviceReader
+from hdmi2usbmon.device import CommandQueue, Hdmi2UsbDevice
+from hdmi2usbmon.events import AsyncEventDispatcher, EventDispatcher, EventTypeHandler
+from hdmi2usbmon.monitor import DeviceBuffer, FleetMonitor
+from hdmi2usbmon.simulator import Hdmi2UsbSimulator, SimulatorThread
+
+TELEMETRY = (b'dvisampler1: ph:   4    4    4 // charsync:111 [9 9 9] // WER:  0   0   0 // '
+             b'chansync:1 // res:1280x720 // pixclk:74249958 Hz')
+
+
+class TestCommandQueue(TestCase):
+
+    def test_log_sequence(self):
+        """ echo, reply and prompt as captured in test-data (the prompt prefixes the next echo) """
+        commands = CommandQueue(Hdmi2UsbDevice.PROMPT)
+        futures = commands.add(['debug input0 on', 'debug input1 on', 'status short on'])
+        for line in (b'HDMI2USB>', b'debug input0 on', b'HDMI Input 0 debug on', TELEMETRY,
+                     b'HDMI2USB>debug input1 on', b'HDMI Input 1 debug on', b'HDMI2USB>status short on'):
+            commands.feed_line(line)
+        self.assertEqual(futures[0].result(0).lines, [b'HDMI Input 0 debug on'])
+        self.assertEqual(futures[1].result(0).lines, [b'HDMI Input 1 debug on'])
+        self.assertFalse(futures[2].done())
+        commands.feed_prompts(1)
+        self.assertEqual(futures[2].result(0).lines, [])
+        self.assertGreaterEqual(futures[2].result(0).latency, 0)
+        self.assertEqual(len(commands), 0)
+
+    def test_device_buffer(self):
+        device = Hdmi2UsbDevice('dev', 1)
+        futures = device.commands.add(['x c input1 output0'])
+        buffer = DeviceBuffer(device)
+        self.assertEqual(buffer.feed(b'x c input1 output0\r\nConnecting input1 to output0\r\nHDMI2'), [
+            b'x c input1 output0', b'Connecting input1 to output0'])
+        self.assertFalse(futures[0].done())
+        self.assertEqual(buffer.feed(b'USB>'), [])
+        self.assertEqual(futures[0].result(0).lines, [b'Connecting input1 to output0'])
+
+    def test_timeout_resync(self):
+        """ a command that never gets its reply must not hold up the ones sent after it """
+        commands = CommandQueue(Hdmi2UsbDevice.PROMPT)
+        lost = commands.add(['debug input0 on'], timeout=0)
+        futures = commands.add(['status'])
+        for line in (b'HDMI2USB>', b'status', b'input0: 1280x720', b'HDMI2USB>'):
+            commands.feed_line(line)
+        self.assertIsInstance(lost[0].exception(0), TimeoutError)
+        self.assertEqual(futures[0].result(0).lines, [b'input0: 1280x720'])
+        self.assertEqual(len(commands), 0)
+        lost = commands.add(['version'], timeout=0)
+        self.assertEqual(commands.expire(), 1)
+        self.assertIsInstance(lost[0].exception(0), TimeoutError)
+
+    def test_execute_timeout(self):
+        device = Hdmi2UsbDevice('dev', 1)
+        device.sock, peer = socket.socketpair()
+        try:
+            self.assertRaises(TimeoutError, device.execute, 'status', timeout=0.05)
+            self.assertEqual(len(device.commands), 0)
+        finally:
+            device.close()
+            peer.close()
+
+    def test_close_fails_pending(self):
+        device = Hdmi2UsbDevice('dev', 1)
+        futures = device.commands.add(['status'])
+        device.close()
+        self.assertIsInstance(futures[0].exception(0), ConnectionError)
+
+
+class TestDeviceCommands(TestCase):
+
+    def setUp(self):
+        self.simulators = [Hdmi2UsbSimulator([], linger=True) for _ in range(3)]
+        self.thread = SimulatorThread(*self.simulators).start()
+
+    def tearDown(self):
+        self.thread.stop(5)
+
+    def test_execute(self):
+        device = self.thread.devices[0]
+        device.connect()
+        try:
+            replies = device.execute('input1 on', 'video_matrix connect input1 output0', 'x c nothing output1')
+        finally:
+            device.close()
+        self.assertEqual([reply.lines for reply in replies], [
+            [b'Enabling input1'], [b'Connecting input1 to output0'], [b"Unknown video source: 'nothing'"]])
+        self.assertEqual(self.simulators[0].matrix['output0'], 'input1')
+
+    def test_fleet(self):
+        dispatcher = EventDispatcher()
+        lines = list()
+        dispatcher.add_handler(EventTypeHandler(lines.append, Hdmi2UsbDevice.LINE_EVENT))
+        monitor = FleetMonitor(dispatcher, commands=None)
+        devices = self.thread.devices
+        for device in devices:
+            monitor.add_device(device)
+        futures = list()
+        for device in devices:
+            futures.extend(device.send_commands('x c input0 encoder', 'output1 off'))
+        self.assertTrue(monitor.wait(futures, timeout=5))
+        monitor.close()
+        self.assertEqual([future.result().lines for future in futures],
+                         [[b'Connecting input0 to encoder'], [b'Disabling output1']] * 3)
+        self.assertEqual([simulator.commands for simulator in self.simulators],
+                         [['x c input0 encoder', 'output1 off']] * 3)
+        self.assertEqual(len(lines), 4 * 3)
+
+    def test_async(self):
+        async def scenario():
+            reader = AsyncDeviceReader(self.thread.devices[1], AsyncEventDispatcher(), commands=None)
+            await reader.connect()
+            task = asyncio.ensure_future(reader.run())
+            replies = await asyncio.gather(*await reader.send_commands('debug input0 on', 'version'))
+            await reader.close()
+            await task
+            return replies
+
+        replies = asyncio.run(scenario())
+        self.assertEqual([reply.lines for reply in replies], [[b'HDMI Input 0 debug on'], [b'hdmi2usbmon simulator']])
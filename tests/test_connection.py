@@ -0,0 +1,136 @@
+import socket
+import time
+from unittest import TestCase
+
+from hdmi2usbmon.connection import (Backoff, ConnectionManager, CONNECTION_EVENT, CONNECTED, CONNECTING,
+                                    DISCONNECTED)
+from hdmi2usbmon.device import Hdmi2UsbDevice
+from hdmi2usbmon.events import EventDispatcher, EventTypeHandler
+from hdmi2usbmon.simulator import Hdmi2UsbSimulator, SimulatorThread
+
+LINE = b'input1:  1280x720 (@ 74250 kHz)'
+
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+class TestBackoff(TestCase):
+
+    def test_delay(self):
+        backoff = Backoff(initial=0.5, maximum=4.0, random=lambda: 1.0)
+        self.assertEqual([backoff.delay(attempt) for attempt in range(6)], [0.5, 1.0, 2.0, 4.0, 4.0, 4.0])
+        self.assertEqual(Backoff(random=lambda: 0.0).delay(3), 0.0)
+        self.assertEqual(Backoff(maximum=60).delay(10 ** 6) <= 60, True)
+
+    def test_jitter_spreads_reconnects(self):
+        backoff = Backoff(initial=1.0, maximum=8.0)
+        delays = [backoff.delay(3) for _ in range(1000)]
+        self.assertTrue(all(0 <= delay <= 8.0 for delay in delays))
+        self.assertGreater(len(set(round(delay, 1) for delay in delays)), 50)
+
+
+class TestConnectionManager(TestCase):
+
+    def setUp(self):
+        self.dispatcher = EventDispatcher(indexed=True)
+        self.states = list()
+        self.lines = list()
+        self.dispatcher.add_handler(EventTypeHandler(self.states.append, CONNECTION_EVENT))
+        self.dispatcher.add_handler(EventTypeHandler(self.lines.append, Hdmi2UsbDevice.LINE_EVENT))
+        self.threads = list()
+
+    def tearDown(self):
+        for thread in self.threads:
+            thread.stop(5)
+
+    def start(self, *simulators):
+        thread = SimulatorThread(*simulators).start()
+        self.threads.append(thread)
+        return thread
+
+    def manager(self, **kwargs):
+        kwargs.setdefault('backoff', Backoff(initial=0.01, maximum=0.05))
+        return ConnectionManager(self.dispatcher, **kwargs)
+
+    def transitions(self):
+        return [event.data['state'] for event in self.states]
+
+    def test_reconnect_and_resubscribe(self):
+        simulator = Hdmi2UsbSimulator([(index * 0.02, LINE) for index in range(5)], speed=1.0)
+        thread = self.start(simulator)
+        manager = self.manager()
+        manager.add_device(thread.devices[0])
+        manager.run(timeout=0.1, until=lambda: self.transitions().count(CONNECTED) >= 3)
+        manager.close()
+        self.assertGreaterEqual(simulator.connections, 2)
+        self.assertEqual(simulator.commands[:6], list(Hdmi2UsbDevice.SUBSCRIBE_COMMANDS) * 2)
+        self.assertEqual(self.transitions()[:5], [CONNECTING, CONNECTED, DISCONNECTED, CONNECTING, CONNECTED])
+        self.assertEqual(self.states[2].data['error'], 'connection closed')
+
+    def test_flapping_device_backs_off(self):
+        # accepts connections and closes them right away
+        thread = self.start(Hdmi2UsbSimulator([]))
+        manager = self.manager(idle_timeout=None)
+        manager.add_device(thread.devices[0])
+        manager.run(timeout=0.05, until=lambda: self.transitions().count(CONNECTED) >= 4)
+        manager.close()
+        attempts = [event.data['attempt'] for event in self.states if event.data['state'] == CONNECTED]
+        self.assertEqual(attempts[:4], [0, 1, 2, 3])
+
+    def test_stable_connection_resets_backoff(self):
+        thread = self.start(Hdmi2UsbSimulator([], linger=True))
+        device = thread.devices[0]
+        manager = self.manager(idle_timeout=None, stable_after=0.5)
+        manager.add_device(device)
+        manager.run(timeout=0.05, until=lambda: manager.state(device) == CONNECTED)
+        link = manager.links[device]
+        link.attempt = 3
+        manager.check(link.connected_at + 0.1)
+        self.assertEqual(link.attempt, 3)
+        manager.check(link.connected_at + 0.5)
+        self.assertEqual(link.attempt, 0)
+        manager.close()
+
+    def test_buffered_commands(self):
+        port = free_port()
+        device = Hdmi2UsbDevice('127.0.0.1', port)
+        manager = self.manager()
+        manager.add_device(device)
+        futures = manager.send_commands(device, 'x c input1 output0')
+        manager.run(timeout=0.05, until=lambda: len(self.states) >= 4)
+        self.assertIn(DISCONNECTED, self.transitions())
+        self.assertFalse(futures[0].done())
+        simulator = Hdmi2UsbSimulator([], port=port, linger=True)
+        self.start(simulator)
+        manager.run(timeout=0.05, until=futures[0].done)
+        manager.close()
+        self.assertEqual(futures[0].result().lines, [b'Connecting input1 to output0'])
+        self.assertEqual(simulator.matrix['output0'], 'input1')
+
+    def test_idle_timeout(self):
+        simulator = Hdmi2UsbSimulator([], linger=True)
+        thread = self.start(simulator)
+        device = thread.devices[0]
+        manager = self.manager(idle_timeout=0.2)
+        manager.add_device(device)
+        start = time.time()
+        manager.run(timeout=0.05, until=lambda: simulator.connections >= 2 and manager.state(device) == CONNECTED)
+        manager.close()
+        self.assertGreaterEqual(time.time() - start, 0.2)
+        lost = [event for event in self.states if event.data['state'] == DISCONNECTED]
+        self.assertTrue(lost[0].data['error'].startswith('no data'))
+
+    def test_forget(self):
+        device = Hdmi2UsbDevice('127.0.0.1', free_port())
+        manager = self.manager()
+        manager.add_device(device)
+        futures = manager.send_commands(device, 'status')
+        self.assertTrue(manager.forget(device))
+        self.assertIsInstance(futures[0].exception(0), ConnectionError)
+        self.assertFalse(manager.forget(device))
+        manager.close()
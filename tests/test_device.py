@@ -1,10 +1,19 @@
 from unittest import TestCase
-from hdmi2usbmon2.device import Hdmi2UsbDevice, which
+
+from hdmi2usbmon.device import Hdmi2UsbDevice, which
+from hdmi2usbmon.simulator import Hdmi2UsbSimulator, SimulatorThread
+
 
 class TestDevice(TestCase):
 
     def setUp(self):
-        self.device = Hdmi2UsbDevice('localhost', 8150)
+        # a simulated hdmi2usbd instead of the daemon, which needs the board
+        self.simulator = SimulatorThread(Hdmi2UsbSimulator([], linger=True)).start()
+        self.device = Hdmi2UsbDevice(*self.simulator.devices[0].remoteaddr())
+
+    def tearDown(self):
+        self.device.close()
+        self.simulator.stop(5)
 
     PROGS = ['ls', 'cat', 'python', 'RuBb1sH']
 
@@ -17,29 +26,21 @@ class TestDevice(TestCase):
             else:
                 self.assertIsNotNone(program)
 
-    def try_connect(self):
-        self.error = None
-        try:
-            self.device.connect()
-            return True
-        except ConnectionRefusedError:
-            # we don't appear to be running hdmi2usbd or it isn't listening to our port
-            return False
-        except Exception as exc:
-            self.error = exc
-            return False
-
     def test_connect(self):
-        done = False
-        while not done:
-            self.assertFalse(self.device.connected)
-            if self.try_connect():
-                done = True
-            elif self.error is not None:
-                done = True
-                err = self.error
-                self.fail('connect({}) -> {}: {}'.format(self.device.remoteaddr(), str(err.__class__.__name__), str(err)))
-            else:
-                # assume hdmi2usbd isn't running
-                rc = self.device.start_daemon()
-                self.assertEqual(rc, 0)
+        self.assertFalse(self.device.connected)
+        self.assertTrue(self.device.connect())
+        self.assertTrue(self.device.connected)
+        self.device.close()
+        self.assertFalse(self.device.connected)
+
+    def test_connect_refused(self):
+        address = self.device.remoteaddr()
+        self.simulator.stop(5)
+        self.assertRaises(ConnectionRefusedError, self.device.connect, *address)
+        self.assertFalse(self.device.connected)
+
+    def test_execute(self):
+        self.device.connect()
+        replies = self.device.execute('debug input0 on', 'x c input1 output0', timeout=5)
+        self.assertEqual([reply.lines for reply in replies],
+                         [[b'HDMI Input 0 debug on'], [b'Connecting input1 to output0']])
@@ -0,0 +1,98 @@
+from unittest import TestCase, mock
+
+from hdmi2usbmon.events import Event, EventDispatcher, EventHandler, EventTypeHandler
+
+
+class OddHandler(EventHandler):
+    """ handler without declared event types: decides per event """
+    def __init__(self, calls):
+        self.calls = calls
+
+    def accept_event(self, event):
+        return event.data % 2 == 1
+
+    def handle_event(self, event):
+        self.calls.append(('odd', event.data))
+
+
+class TestIndexedDispatcher(TestCase):
+
+    def create_dispatcher(self, calls, indexed=True):
+        dispatcher = EventDispatcher(indexed=indexed)
+        dispatcher.add_handler(EventTypeHandler(lambda e: calls.append(('a', e.data)), 'a'))
+        dispatcher.add_handler(OddHandler(calls))
+        dispatcher.add_handler(EventTypeHandler(lambda e: calls.append(('ab', e.data)), 'a', 'b'))
+        dispatcher.add_handler(EventTypeHandler(lambda e: calls.append(('all', e.data))))
+        return dispatcher
+
+    def dispatch(self, dispatcher):
+        events = [Event('a', 1), Event('b', 2), Event('c', 3), Event('a,b', 4)]
+        return dispatcher.dispatch_events(*events)
+
+    def test_matches_linear_dispatch(self):
+        linear, indexed = list(), list()
+        self.assertEqual(self.dispatch(self.create_dispatcher(linear, False)),
+                         self.dispatch(self.create_dispatcher(indexed, True)))
+        self.assertEqual(linear, indexed)
+        self.assertEqual(indexed[:3], [('a', 1), ('odd', 1), ('ab', 1)])
+
+    def test_index_rebuilt_on_change(self):
+        calls = list()
+        dispatcher = self.create_dispatcher(calls)
+        self.dispatch(dispatcher)
+        handler = EventTypeHandler(lambda e: calls.append(('c', e.data)), 'c')
+        dispatcher.add_handler(handler, True)
+        del calls[:]
+        dispatcher.dispatch_events(Event('c', 5))
+        self.assertEqual(calls, [('c', 5), ('odd', 5), ('all', 5)])
+        self.assertTrue(dispatcher.remove_handler(handler))
+        del calls[:]
+        dispatcher.dispatch_events(Event('c', 5))
+        self.assertEqual(calls, [('odd', 5), ('all', 5)])
+
+
+class BatchHandler(EventHandler):
+    def __init__(self):
+        self.batches = list()
+
+    def accept_event(self, event):
+        return 'b' in event.event_type
+
+    def handle_event(self, event):
+        raise AssertionError('batch handler called per event')
+
+    def handle_events(self, events):
+        self.batches.append([event.data for event in events])
+
+
+class TestBatchDispatch(TestCase):
+
+    def test_dispatch_batch(self):
+        for indexed in (False, True):
+            calls = list()
+            batch_handler = BatchHandler()
+            dispatcher = EventDispatcher(indexed=indexed)
+            dispatcher.add_handler(EventTypeHandler(lambda e: calls.append(e.data), 'a'))
+            dispatcher.add_handler(batch_handler)
+            for index in range(10):
+                dispatcher.send_event(Event('a' if index % 2 else 'b', index))
+            stats = dispatcher.dispatch_batch(max_events=8)
+            self.assertEqual(stats.events, 8)
+            self.assertEqual(stats.handled, 8)
+            self.assertEqual(calls, [1, 3, 5, 7])
+            self.assertEqual(batch_handler.batches, [[0, 2, 4, 6]])
+            self.assertEqual(dispatcher.dispatch_batch(max_events=8).events, 2)
+            self.assertEqual(dispatcher.dispatch_batch(max_events=8).events, 0)
+
+    def test_dispatch_batch_latency(self):
+        dispatcher = EventDispatcher()
+        stats = dispatcher.dispatch_batch(max_events=8, max_latency=0.05)
+        self.assertEqual(stats.events, 0)
+        self.assertGreaterEqual(stats.wait_time, 0.04)
+
+    def test_dispatch_batch_latency_monotonic(self):
+        # a stopped (or adjusted) wall clock doesn't change how long events are collected
+        dispatcher = EventDispatcher()
+        with mock.patch('time.time', return_value=1e9):
+            stats = dispatcher.dispatch_batch(max_events=8, max_latency=0.05)
+        self.assertEqual(stats.events, 0)
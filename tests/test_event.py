@@ -3,7 +3,7 @@ import queue
 import unittest
 from unittest import TestCase
 
-from hdmi2usbmon2.events import Event, EventDispatcher, EventHandler, EventTypeHandler
+from hdmi2usbmon.events import Event, EventDispatcher, EventHandler, EventTypeHandler
 
 
 class BasicEvent(Event):
@@ -39,6 +39,15 @@ class TestEvent(unittest.TestCase):
     def test_event_types(self):
         self.common_test_event(*(self.create_test_events()))
 
+    def test_event_type_tuples(self):
+        event = Event('basic,error', timestamp=1.0)
+        self.assertEqual(event.event_type, ('basic', 'error'))
+        self.assertIs(Event('basic,error').event_type, event.event_type)
+        self.assertEqual(Event().event_type, ('basic',))
+        self.assertEqual(Event(['a', 'b']).event_type, ('a', 'b'))
+        copy = Event(event)
+        self.assertEqual((copy.event_type, copy.timestamp), (('basic', 'error'), 1.0))
+
 
 class TestEventDispatcher(TestCase):
 
@@ -54,9 +63,9 @@ class TestEventDispatcher(TestCase):
     def create_dispatcher_with_handlers(self):
         dispatcher = self.create_dispatcher()
         handler_list = (
-            EventTypeHandler('basic', func=self.handler_basic),
-            EventTypeHandler('general', func=self.handler_general),
-            EventTypeHandler('error', func=self.handler_error)
+            EventTypeHandler(self.handler_basic, 'basic'),
+            EventTypeHandler(self.handler_general, 'general'),
+            EventTypeHandler(self.handler_error, 'error')
         )
         for handler in handler_list:
             dispatcher.add_handler(handler)
@@ -0,0 +1,92 @@
+import os
+from unittest import TestCase
+from urllib.request import urlopen
+
+from hdmi2usbmon.events import Event, EventDispatcher, STATS_EVENT
+from hdmi2usbmon.exporter import MetricsHandler, MetricsServer
+from hdmi2usbmon.monitor import FleetMonitor
+from hdmi2usbmon.parser import parse_line
+from hdmi2usbmon.simulator import Hdmi2UsbSimulator, SimulatorThread, load_capture
+
+TEST_LOG = os.path.join(os.path.dirname(__file__), '..', 'test-data', 'hdmi2usb.2017-01-15_17')
+
+DVISAMPLER_LINE = (b'dvisampler1: ph:   4    5    3 // charsync:111 [9 9 9] // WER:  0   2   0 // '
+                   b'chansync:1 // res:1280x720 // pixclk:74249958 Hz')
+
+
+def samples(text):
+    """ :return: dict of 'name{labels}' -> value """
+    values = dict()
+    for line in text.splitlines():
+        if line and not line.startswith('#'):
+            key, _, value = line.rpartition(' ')
+            values[key] = float(value)
+    return values
+
+
+class TestMetricsHandler(TestCase):
+
+    def setUp(self):
+        self.metrics = MetricsHandler()
+        self.dispatcher = EventDispatcher(indexed=True)
+        self.dispatcher.add_handler(self.metrics)
+
+    def send(self, *lines):
+        self.dispatcher.dispatch_events(*(parse_line(line, 'dev:1') for line in lines))
+
+    def test_render(self):
+        self.send(DVISAMPLER_LINE, DVISAMPLER_LINE, b'dvisampler1: lost PLL lock', b'dvisampler1: FIFO overflow',
+                  b'encoder: 1280x720 @ 30fps (12Mbps) from input1 (q: 85)',
+                  b'ddr: read:  734Mbps  write:  736Mbps  all: 1470Mbps')
+        values = samples(self.metrics.render())
+        self.assertEqual(values['hdmi2usb_input_pixclk_hz{device="dev:1",input="1"}'], 74249958)
+        self.assertEqual(values['hdmi2usb_input_width_pixels{device="dev:1",input="1"}'], 1280)
+        self.assertEqual(values['hdmi2usb_input_samples_total{device="dev:1",input="1"}'], 2)
+        self.assertEqual(values['hdmi2usb_input_pll_lock_lost_total{device="dev:1",input="1"}'], 1)
+        self.assertEqual(values['hdmi2usb_input_fifo_overflows_total{device="dev:1",input="1"}'], 1)
+        self.assertEqual(values['hdmi2usb_input_phase{channel="1",device="dev:1",input="1"}'], 5)
+        self.assertEqual(values['hdmi2usb_input_wer_total{channel="1",device="dev:1",input="1"}'], 4)
+        self.assertEqual(values['hdmi2usb_encoder_fps{device="dev:1"}'], 30)
+        self.assertEqual(values['hdmi2usb_encoder_mbps{device="dev:1"}'], 12)
+        self.assertEqual(values['hdmi2usb_ddr_all_mbps{device="dev:1"}'], 1470)
+        # input0 has not been sampled
+        self.assertNotIn('hdmi2usb_input_pixclk_hz{device="dev:1",input="0"}', values)
+        self.assertEqual(values['hdmi2usb_input_fifo_overflows_total{device="dev:1",input="0"}'], 0)
+
+    def test_series_do_not_grow(self):
+        self.send(DVISAMPLER_LINE)
+        series = len(self.metrics.render().splitlines())
+        self.send(*[DVISAMPLER_LINE] * 100)
+        self.assertEqual(len(self.metrics.render().splitlines()), series)
+
+    def test_event_types(self):
+        for indexed in (False, True):
+            dispatcher = EventDispatcher(indexed=indexed)
+            dispatcher.add_handler(self.metrics)
+            self.assertEqual(dispatcher.dispatch_events(Event(STATS_EVENT, {}), Event('state', {})), (2, 0))
+            self.assertEqual(dispatcher.dispatch_events(parse_line(DVISAMPLER_LINE, 'dev:1')), (1, 1))
+
+
+class TestMetricsServer(TestCase):
+
+    def test_scrape(self):
+        capture = load_capture(TEST_LOG, 2017)
+        thread = SimulatorThread(Hdmi2UsbSimulator(capture)).start()
+        metrics = MetricsHandler()
+        server = MetricsServer(metrics, port=0).start()
+        try:
+            dispatcher = EventDispatcher(indexed=True)
+            dispatcher.add_handler(metrics)
+            monitor = FleetMonitor(dispatcher, commands=None)
+            monitor.add_device(thread.devices[0])
+            monitor.run(timeout=5)
+            response = urlopen('http://127.0.0.1:{}/metrics'.format(server.port), timeout=5)
+            self.assertTrue(response.headers['Content-Type'].startswith('text/plain'))
+            values = samples(response.read().decode('utf-8'))
+            name = thread.devices[0].name
+            self.assertAlmostEqual(values['hdmi2usb_input_pixclk_hz{{device="{}",input="1"}}'.format(name)],
+                                   74250000, delta=1000)
+            self.assertGreater(values['hdmi2usb_input_pll_lock_lost_total{{device="{}",input="1"}}'.format(name)], 0)
+        finally:
+            server.stop()
+            thread.stop(5)
@@ -0,0 +1,88 @@
+import socket
+from unittest import TestCase
+
+from hdmi2usbmon.framer import LineFramer
+
+TELEMETRY = (b'dvisampler1: ph:   4    4    4 // charsync:111 [9 9 9] // WER:  0   0   0 // '
+             b'chansync:1 // res:1280x720 // pixclk:74249958 Hz')
+
+
+class TestLineFramer(TestCase):
+
+    def test_frames(self):
+        framer = LineFramer(64)
+        self.assertEqual([bytes(line) for line in framer.feed_frames(b'output0: o')], [])
+        self.assertEqual([bytes(line) for line in framer.feed_frames(b'ff\r\n\r\ninput0:')], [b'output0: off'])
+        self.assertEqual([bytes(line) for line in framer.feed_frames(b'  0x0\r\n')], [b'input0:  0x0'])
+        self.assertEqual(framer.framed, 2)
+        self.assertEqual(framer.pending, 0)
+
+    def test_frames_are_views(self):
+        framer = LineFramer(64)
+        lines = list(framer.feed_frames(b'abc\r\nde'))
+        self.assertIsInstance(lines[0], memoryview)
+        self.assertEqual(lines[0].obj, framer.buffer)
+
+    def test_prompt(self):
+        prompts = list()
+        framer = LineFramer(256, on_prompt=lambda: prompts.append(framer.framed))
+        lines = [bytes(line) for line in framer.feed_frames(b'HDMI2USB>\r\nHDMI2USB>' + TELEMETRY + b'\r\nok\r\nHDMI2USB>')]
+        self.assertEqual(lines, [TELEMETRY, b'ok'])
+        # prompts are reported before the line they prefix is yielded, the trailing one without waiting for a line
+        self.assertEqual(prompts, [0, 0, 2])
+        self.assertEqual(framer.pending, 0)
+        self.assertEqual(framer.prompts, 3)
+
+    def test_keep_prompt(self):
+        framer = LineFramer(256, strip_prompt=False)
+        self.assertEqual(framer.feed_lines(b'HDMI2USB>' + TELEMETRY + b'\r\nHDMI2USB>HDMI2USB>'),
+                         [b'HDMI2USB>' + TELEMETRY])
+        self.assertEqual(framer.take_prompts(), 2)
+        self.assertEqual(framer.feed_lines(b'status\r\n'), [b'status'])
+
+    def test_lines_strip_prompt(self):
+        framer = LineFramer(256)
+        self.assertEqual(framer.feed_lines(b'a\r\nHDMI2USB>b\r\nHDMI2USB>\r\nc\r\nHDMI2'), [b'a', b'b', b'c'])
+        self.assertEqual(framer.feed_lines(b'USB>'), [])
+        self.assertEqual(framer.prompts, 3)
+
+    def test_wrap(self):
+        """ only the line straddling the buffer end is moved, lines are the same as with a large buffer """
+        data = b''.join(b'line %d\r\n' % index for index in range(1000))
+        for size in (16, 17, 64, 99):
+            framer = LineFramer(size)
+            lines = list()
+            for offset in range(0, len(data), 13):
+                lines += [bytes(line) for line in framer.feed_frames(data[offset:offset + 13])]
+            self.assertEqual(lines, data.split(b'\r\n')[:-1])
+            self.assertGreater(framer.wraps, 0)
+            self.assertEqual(framer.feed_lines(data), lines)
+
+    def test_long_line(self):
+        framer = LineFramer(8)
+        self.assertEqual([bytes(line) for line in framer.feed_frames(b'0123456789\r\nab\r\n')],
+                         [b'01234567', b'89', b'ab'])
+
+    def test_long_line_split_line_ending(self):
+        """ the \\r\\n ending a long line may be split by the buffer end, or follow it """
+        for data in (b'012345\r\nab\r\n', b'0123456\r\nab\r\n', b'01234567\r\nab\r\n'):
+            framer = LineFramer(8, skip_empty=False)
+            self.assertEqual([bytes(line) for line in framer.feed_frames(data)], [data[:-6], b'ab'])
+            framer = LineFramer(8, skip_empty=False)
+            self.assertEqual(framer.feed_lines(data), [data[:-6], b'ab'])
+
+    def test_recv_into(self):
+        local, remote = socket.socketpair()
+        try:
+            framer = LineFramer(32, strip_prompt=False)
+            remote.sendall(b'line a\r\nline ')
+            self.assertEqual(framer.recv_into(local), 13)
+            self.assertEqual(framer.lines(), [b'line a'])
+            remote.sendall(b'b\r\n')
+            framer.recv_into(local)
+            self.assertEqual([bytes(line) for line in framer.frames()], [b'line b'])
+            remote.close()
+            self.assertEqual(framer.recv_into(local), 0)
+            self.assertEqual(framer.bytes, 16)
+        finally:
+            local.close()
@@ -0,0 +1,125 @@
+import io
+import os
+import shutil
+import tempfile
+import time
+from unittest import TestCase
+
+from hdmi2usbmon.logwriter import LogWriter
+from hdmi2usbmon.parser import parse_log_line
+
+# 2017-01-15 17:59:58 local time
+TIMESTAMP = parse_log_line(b'Jan 15 17:59:58 hdmi2usbd [1]: x', 2017)[0]
+
+
+class TestLogWriter(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'hdmi2usb')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_write(self):
+        stream = io.StringIO()
+        writer = LogWriter(self.filename, stream=stream, pid=671)
+        writer.put(b'output0: o', TIMESTAMP)
+        writer.put(b'ff\r\nHDMI2USB>\r\ninput1:  0x0 (@ 0 kHz)\r\n\xff\r\n', TIMESTAMP + 1)
+        writer.start()
+        writer.close()
+        expected = ('Jan 15 17:59:59 hdmi2usbd [671]: output0: off\n'
+                    'Jan 15 17:59:59 hdmi2usbd [671]: HDMI2USB>\n'
+                    'Jan 15 17:59:59 hdmi2usbd [671]: input1:  0x0 (@ 0 kHz)\n'
+                    "Jan 15 17:59:59 hdmi2usbd [671]: b'\\xff'\n")
+        with open(self.filename) as logfile:
+            self.assertEqual(logfile.read(), expected)
+        self.assertEqual(stream.getvalue(), expected)
+        self.assertEqual(writer.stats(), dict(queue_depth=0, dropped=0, lines=4, batches=1, errors=0))
+
+    def test_rotate(self):
+        writer = LogWriter(self.filename, pid=1)
+        writer.start()
+        for offset in range(4):
+            writer.put(b'line %d\r\n' % offset, TIMESTAMP + offset)
+        writer.close()
+        with open(self.filename + '.2017-01-15_17') as logfile:
+            self.assertEqual(len(logfile.readlines()), 2)
+        with open(self.filename) as logfile:
+            self.assertTrue(logfile.readline().startswith('Jan 15 18:00:00 hdmi2usbd [1]: line 2'))
+
+    def test_rotate_error(self):
+        stream = io.StringIO()
+        directory = os.path.join(self.tmpdir, 'missing')
+        writer = LogWriter(os.path.join(directory, 'hdmi2usb'), stream=stream, pid=1)
+        writer.start()
+        writer.put(b'line 0\r\n', TIMESTAMP)
+        writer.close()
+        # the writer thread survives, the line still goes to the stream
+        self.assertEqual(writer.stats()['errors'], 1)
+        self.assertEqual(writer.stats()['batches'], 1)
+        self.assertEqual(stream.getvalue(), 'Jan 15 17:59:58 hdmi2usbd [1]: line 0\n')
+        # the next batch opens the log file again
+        os.mkdir(directory)
+        writer.write_batch([(TIMESTAMP + 1, b'line 1\r\n')])
+        writer.file.close()
+        with open(os.path.join(directory, 'hdmi2usb')) as logfile:
+            self.assertEqual(logfile.read(), 'Jan 15 17:59:59 hdmi2usbd [1]: line 1\n')
+        self.assertEqual(writer.stats()['errors'], 1)
+
+    def test_drop(self):
+        writer = LogWriter(self.filename, max_queue=2)
+        results = [writer.put(b'line\r\n') for _ in range(3)]
+        self.assertEqual(results, [True, True, False])
+        self.assertEqual(writer.stats()['dropped'], 1)
+        self.assertEqual(writer.stats()['queue_depth'], 2)
+        writer.queue.get_nowait()
+        writer.start()
+        writer.close()
+        self.assertEqual(writer.stats()['lines'], 1)
+
+    def test_empty_lines(self):
+        writer = LogWriter(self.filename, pid=1)
+        writer.put(b'a\r\n\r\nb\r\n', TIMESTAMP)
+        writer.start()
+        writer.close()
+        with open(self.filename) as logfile:
+            self.assertEqual([line.split(']: ', 1)[1] for line in logfile], ['a\n', '\n', 'b\n'])
+
+    def test_stale_file(self):
+        # a log file last written an hour earlier is rotated instead of appended to
+        with open(self.filename, 'w') as logfile:
+            logfile.write('Jan 15 16:30:00 hdmi2usbd [1]: old\n')
+        os.utime(self.filename, (TIMESTAMP - 3600, TIMESTAMP - 3600))
+        writer = LogWriter(self.filename, pid=1)
+        writer.put(b'new\r\n', TIMESTAMP)
+        writer.start()
+        writer.close()
+        with open(self.filename + '.2017-01-15_16') as logfile:
+            self.assertEqual(logfile.read(), 'Jan 15 16:30:00 hdmi2usbd [1]: old\n')
+        with open(self.filename) as logfile:
+            self.assertEqual(logfile.read(), 'Jan 15 17:59:58 hdmi2usbd [1]: new\n')
+
+    def test_local_hours(self):
+        timezone = os.environ.get('TZ')
+        os.environ['TZ'] = 'Asia/Kolkata'  # UTC+05:30
+        time.tzset()
+        try:
+            start = LogWriter(self.filename).interval_start(TIMESTAMP)
+            # local 23:29:58 rotates at 23:00 local time, not on the UTC hour (23:30 local)
+            self.assertEqual(time.localtime(start)[3:6], (time.localtime(TIMESTAMP).tm_hour, 0, 0))
+            self.assertNotEqual(start % 3600, 0)
+        finally:
+            if timezone is None:
+                del os.environ['TZ']
+            else:
+                os.environ['TZ'] = timezone
+            time.tzset()
+
+    def test_close_full_queue(self):
+        # close doesn't block on a full queue, even if the writer thread isn't running
+        writer = LogWriter(self.filename, max_queue=2)
+        writer.put(b'a\r\n')
+        writer.put(b'b\r\n')
+        writer.close(1)
+        self.assertEqual(writer.stats()['queue_depth'], 2)
@@ -0,0 +1,43 @@
+import socket
+from unittest import TestCase
+
+from hdmi2usbmon.device import Hdmi2UsbDevice
+from hdmi2usbmon.events import EventDispatcher, EventTypeHandler
+from hdmi2usbmon.monitor import DeviceBuffer, FleetMonitor
+
+
+class TestDeviceBuffer(TestCase):
+
+    def test_feed(self):
+        buffer = DeviceBuffer(None)
+        self.assertEqual(buffer.feed(b'output0: o'), [])
+        self.assertEqual(buffer.feed(b'ff\r\nHDMI2USB>\r\n\r\ninput0:'), [b'output0: off', b'HDMI2USB>'])
+        self.assertEqual(buffer.feed(b'  0x0 (@ 0 kHz)\r\n'), [b'input0:  0x0 (@ 0 kHz)'])
+        self.assertEqual(buffer.lines, 3)
+        self.assertEqual(buffer.pending, 0)
+
+
+class TestFleetMonitor(TestCase):
+
+    def test_run(self):
+        events = list()
+        dispatcher = EventDispatcher()
+        dispatcher.add_handler(EventTypeHandler(events.append, Hdmi2UsbDevice.LINE_EVENT))
+        monitor = FleetMonitor(dispatcher, commands=('status short on',))
+        remotes = list()
+        for index in range(3):
+            local, remote = socket.socketpair()
+            device = Hdmi2UsbDevice('test', index)
+            device.sock = local
+            self.assertTrue(monitor.add_device(device))
+            self.assertFalse(monitor.add_device(device))
+            remotes.append(remote)
+        for index, remote in enumerate(remotes):
+            self.assertEqual(remote.recv(100), b'status short on\r\n')
+            remote.sendall(b'line a\r\nline b %d\r\n' % index)
+            remote.close()
+        self.assertEqual(monitor.run(timeout=1.0), 6)
+        self.assertEqual(monitor.devices, [])
+        for index in range(3):
+            lines = [event.data['line'] for event in events if event.data['device'] == 'test:{}'.format(index)]
+            self.assertEqual(lines, [b'line a', b'line b %d' % index])
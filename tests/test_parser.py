@@ -0,0 +1,97 @@
+import os
+from unittest import TestCase
+
+from hdmi2usbmon.device import Hdmi2UsbDevice
+from hdmi2usbmon import parser
+from hdmi2usbmon.parser import (DVISAMPLER_EVENT, DviSamplerEvent, DviSamplerRecord, StatusEvent, classify_line,
+                                parse_dvisampler, parse_line, strip_prefix)
+
+TEST_LOG = os.path.join(os.path.dirname(__file__), '..', 'test-data', 'hdmi2usb.2017-01-15_17')
+
+
+class TestDviSamplerParser(TestCase):
+
+    def test_parse(self):
+        record = parse_dvisampler(b'HDMI2USB>dvisampler1: ph:   4    2   6 // charsync:110 [9 8 9] // '
+                                  b'WER:31212 545 2921 // chansync:0 // res:1280x720 // pixclk:74249958 Hz', 'opsis')
+        self.assertEqual(record, DviSamplerRecord('opsis', 1, (4, 2, 6), (1, 1, 0), (9, 8, 9), (31212, 545, 2921),
+                                                  0, 1280, 720, 74249958))
+
+    def test_not_dvisampler(self):
+        for line in (b'dvisampler1: lost PLL lock', b'input1:  1280x720 (@ 74250 kHz)', b'',
+                     b'dvisampler1: ph: 4 4 // charsync:111 [9 9 9] // WER: 0 0 0 // chansync:1 // res:0x0 // pixclk:0 Hz'):
+            self.assertIsNone(parse_dvisampler(line))
+
+    def test_parse_line(self):
+        event = parse_line(b'dvisampler0: ph:  1 2 3 // charsync:111 [9 9 9] // WER:0 0 0 // chansync:1 // '
+                           b'res:0x0 // pixclk:25 Hz', 'opsis', timestamp=1.0)
+        self.assertEqual(list(event.event_type), [DVISAMPLER_EVENT])
+        self.assertEqual((event.data.input, event.data.ph, event.data.pixclk, event.timestamp), (0, (1, 2, 3), 25, 1.0))
+        self.assertIsInstance(event, DviSamplerEvent)
+        self.assertIs(event.event_type, DviSamplerEvent.EVENT_TYPE)
+        event = parse_line(b'output0: off', 'opsis')
+        self.assertIsInstance(event, StatusEvent)
+        self.assertEqual(event.event_type, (parser.OUTPUT_STATUS,))
+        self.assertEqual(event.data['device'], 'opsis')
+        event = parse_line(b'HDMI2USB>debug input0 on', 'opsis')
+        self.assertEqual(list(event.event_type), [Hdmi2UsbDevice.LINE_EVENT])
+        self.assertEqual(event.data, {'device': 'opsis', 'line': b'debug input0 on'})
+
+    def test_test_log(self):
+        with open(TEST_LOG, 'rb') as logfile:
+            lines = [line.rstrip(b'\n') for line in logfile]
+        records = [parse_dvisampler(line) for line in lines]
+        self.assertEqual(sum(1 for line in lines if b' ph:' in line), sum(1 for record in records if record))
+
+
+class TestClassifyLine(TestCase):
+
+    LINES = (
+        (b'HDMI2USB>dvisampler1: lost PLL lock', parser.PLL_LOCK_LOST, {'input': 1, 'message': 'lost PLL lock'}),
+        (b'dvisampler0: FIFO overflow', parser.FIFO_OVERFLOW, {'input': 0, 'message': 'FIFO overflow'}),
+        (b'dvisampler1: IDELAY busy timeout', parser.IDELAY_BUSY_TIMEOUT,
+         {'input': 1, 'message': 'IDELAY busy timeout'}),
+        (b'input1:  1280x720 (@ 74250 kHz)', parser.INPUT_STATUS,
+         {'name': 'input1', 'input': 1, 'width': 1280, 'height': 720, 'freq_khz': 74250}),
+        (b'output0: off', parser.OUTPUT_STATUS, {'name': 'output0', 'output': 0, 'enabled': False}),
+        (b'output1: 1280x720@50Hz from input1', parser.OUTPUT_STATUS,
+         {'name': 'output1', 'output': 1, 'enabled': True, 'width': 1280, 'height': 720, 'refresh': 50,
+          'source': 'input1'}),
+        (b'encoder: 1280x720 @ 0fps (0Mbps) from input1 (q: 85)', parser.ENCODER_STATUS,
+         {'name': 'encoder', 'enabled': True, 'width': 1280, 'height': 720, 'fps': 0, 'mbps': 0,
+          'source': 'input1', 'quality': 85}),
+        (b'ddr: read:  734Mbps  write:  736Mbps  all: 1470Mbps', parser.DDR_STATUS,
+         {'name': 'ddr', 'read': 734, 'write': 736, 'all': 1470}),
+        (b'status2: EDID: a/b, enc: off, ddr: 0Mbps', parser.STATUS2,
+         {'edid_primary': b'a', 'edid_secondary': b'b', 'encoder': b'off', 'ddr': b'0Mbps'}),
+        (b'HDMI2USB>', parser.UNKNOWN_LINE, {'line': b''}),
+        (b'input1: garbage', parser.UNKNOWN_LINE, {'line': b'input1: garbage'}),
+    )
+
+    def test_classify(self):
+        for line, kind, fields in self.LINES:
+            self.assertEqual(classify_line(line), (kind, fields))
+
+    def test_telemetry(self):
+        kind, record = classify_line(b'dvisampler1: ph:  1 2 3 // charsync:111 [9 9 9] // WER:0 0 0 // '
+                                     b'chansync:1 // res:0x0 // pixclk:25 Hz')
+        self.assertEqual((kind, record.ph), (DVISAMPLER_EVENT, (1, 2, 3)))
+
+    def test_prefixes(self):
+        # prompts and command echoes are stripped the same way by classify_line and parse_dvisampler
+        telemetry = (b'dvisampler1: ph:   4    2    4 // charsync:111 [9 9 9] // WER:  0   0   0 // chansync:1 // '
+                     b'res:1280x720 // pixclk:74250034 Hz')
+        for prefix in (b'', b'HDMI2USB>', b'HDMI2USB>HDMI2USB>', b'x c ', b'HDMI2USB>x c '):
+            record = parse_dvisampler(prefix + telemetry, 'opsis')
+            self.assertEqual(classify_line(prefix + telemetry, 'opsis'), (DVISAMPLER_EVENT, record))
+            self.assertEqual(record.pixclk, 74250034)
+        self.assertEqual(classify_line(b'x c dvisampler1: lost PLL lock')[0], parser.PLL_LOCK_LOST)
+        self.assertEqual(strip_prefix(b'HDMI2USB>debug input0 on'), b'debug input0 on')
+
+    def test_test_log(self):
+        with open(TEST_LOG, 'rb') as logfile:
+            lines = [line.rstrip(b'\n').split(b']: ', 1)[-1] for line in logfile]
+        for line in lines:
+            record = parse_dvisampler(line)
+            if record is not None:
+                self.assertEqual(classify_line(line), (DVISAMPLER_EVENT, record))
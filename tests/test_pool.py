@@ -0,0 +1,163 @@
+import threading
+import time
+from unittest import TestCase
+
+from hdmi2usbmon.events import Event, EventHandler, EventTypeHandler, PooledEventDispatcher
+
+
+class BatchHandler(EventHandler):
+
+    def __init__(self):
+        self.batches = list()
+
+    def accept_event(self, event):
+        return True
+
+    def handle_events(self, events):
+        self.batches.append([event.data for event in events])
+
+
+class TestPooledEventDispatcher(TestCase):
+
+    def setUp(self):
+        self.dispatcher = PooledEventDispatcher(max_workers=4)
+
+    def tearDown(self):
+        self.dispatcher.shutdown(1)
+
+    def send(self, *items):
+        for item in items:
+            self.dispatcher.send_event(Event('x', item))
+
+    def test_order_per_handler(self):
+        fast, slow = list(), list()
+        self.dispatcher.add_handler(EventTypeHandler(fast.append))
+        self.dispatcher.add_handler(EventTypeHandler(lambda e: (time.sleep(0.001), slow.append(e))))
+        for index in range(10):
+            self.send(*range(index * 10, index * 10 + 10))
+            self.dispatcher.dispatch_batch()
+        self.assertTrue(self.dispatcher.join(5))
+        self.assertEqual([event.data for event in fast], list(range(100)))
+        self.assertEqual([event.data for event in slow], list(range(100)))
+
+    def test_slow_handler_runs_in_parallel(self):
+        release = threading.Event()
+        fast = list()
+        self.dispatcher.add_handler(EventTypeHandler(lambda e: release.wait(5)))
+        self.dispatcher.add_handler(EventTypeHandler(fast.append))
+        self.send(1, 2, 3)
+        stats = self.dispatcher.dispatch_batch()
+        self.assertEqual((stats.events, stats.handled), (3, 6))
+        # the fast handler isn't held up by the blocked one
+        self.assertFalse(self.dispatcher.join(0.5))
+        self.assertEqual([event.data for event in fast], [1, 2, 3])
+        release.set()
+        self.assertTrue(self.dispatcher.join(5))
+
+    def test_batch_handler(self):
+        handler = BatchHandler()
+        self.dispatcher.add_handler(handler)
+        self.send(1, 2, 3)
+        self.dispatcher.dispatch_batch()
+        self.dispatcher.dispatch_events(Event('x', 4))
+        self.assertTrue(self.dispatcher.join(5))
+        self.assertEqual(handler.batches, [[1, 2, 3], [4]])
+
+    def test_errors_isolated(self):
+        errors, calls = list(), list()
+        dispatcher = PooledEventDispatcher(on_error=lambda handler, exc: errors.append(str(exc)))
+        dispatcher.add_handler(EventTypeHandler(lambda e: 1 / e.data))
+        dispatcher.add_handler(EventTypeHandler(calls.append))
+        dispatcher.dispatch_events(Event('x', 0), Event('x', 1))
+        self.assertTrue(dispatcher.shutdown(5))
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(errors, ['division by zero'])
+        lanes = dispatcher.snapshot()['lanes']
+        self.assertEqual([(lane['calls'], lane['errors']) for lane in lanes], [(2, 1), (2, 0)])
+
+    def test_error_mid_batch(self):
+        handled = list()
+
+        def handle(event):
+            if event.data == 2:
+                raise ValueError(event.data)
+            handled.append(event.data)
+        self.dispatcher.add_handler(EventTypeHandler(handle))
+        self.send(*range(5))
+        self.dispatcher.dispatch_batch()
+        self.assertTrue(self.dispatcher.join(5))
+        # the events after the one that raised are still handled
+        self.assertEqual(handled, [0, 1, 3, 4])
+        lane = self.dispatcher.snapshot()['lanes'][0]
+        self.assertEqual((lane['calls'], lane['errors'], lane['dropped']), (5, 1, 0))
+
+    def test_on_error_raises(self):
+        def on_error(handler, exc):
+            raise RuntimeError('on_error failed')
+        calls = list()
+        dispatcher = PooledEventDispatcher(max_workers=1, on_error=on_error)
+        dispatcher.add_handler(EventTypeHandler(lambda e: calls.append(1 / e.data)))
+        dispatcher.dispatch_events(Event('x', 0))
+        self.assertTrue(dispatcher.join(5))
+        # the lane isn't left running, later events are still handled
+        dispatcher.dispatch_events(Event('x', 1), Event('x', 2))
+        self.assertTrue(dispatcher.shutdown(5))
+        self.assertEqual(calls, [1.0, 0.5])
+        lane = dispatcher.snapshot()['lanes'][0]
+        self.assertEqual((lane['calls'], lane['errors']), (3, 2))
+
+    def test_timeout_drops_events(self):
+        release = threading.Event()
+        started = threading.Event()
+        handled = list()
+
+        def stall(event):
+            started.set()
+            release.wait(5)
+            handled.append(event.data)
+
+        handler = EventTypeHandler(stall)
+        self.dispatcher.add_handler(handler, timeout=0.05)
+        self.dispatcher.dispatch_events(Event('x', 1))
+        started.wait(5)
+        time.sleep(0.1)
+        # stalled: new events are dropped instead of queued behind the blocked call
+        self.dispatcher.dispatch_events(Event('x', 2), Event('x', 3))
+        release.set()
+        self.assertTrue(self.dispatcher.join(5))
+        self.assertEqual(handled, [1])
+        lane = self.dispatcher.lanes[handler]
+        self.assertEqual((lane.dropped, lane.timeouts), (2, 1))
+        self.dispatcher.dispatch_events(Event('x', 4))
+        self.assertTrue(self.dispatcher.join(5))
+        self.assertEqual(handled, [1, 4])
+
+    def test_max_pending(self):
+        release = threading.Event()
+        handled = list()
+        dispatcher = PooledEventDispatcher(max_pending=2)
+        handler = EventTypeHandler(lambda e: (release.wait(5), handled.append(e.data)))
+        dispatcher.add_handler(handler)
+        dispatcher.dispatch_events(*[Event('x', item) for item in range(5)])
+        release.set()
+        self.assertTrue(dispatcher.shutdown(5))
+        # the oldest of the waiting events were dropped
+        self.assertEqual(handled[-2:], [3, 4])
+        self.assertEqual(len(handled) + dispatcher.lanes[handler].dropped, 5)
+
+    def test_remove_handler(self):
+        handler = EventTypeHandler(lambda e: None)
+        self.dispatcher.add_handler(handler)
+        self.assertIn(handler, self.dispatcher.lanes)
+        self.dispatcher.remove_handler(handler)
+        self.assertEqual(self.dispatcher.lanes, {})
+        self.assertEqual(self.dispatcher.dispatch_events(Event('x', 1)), (1, 0))
+
+    def test_indexed(self):
+        calls = list()
+        dispatcher = PooledEventDispatcher(indexed=True)
+        dispatcher.add_handler(EventTypeHandler(calls.append, 'a'))
+        dispatcher.add_handler(EventTypeHandler(calls.append, 'status.*'))
+        self.assertEqual(dispatcher.dispatch_events(Event('a', 1), Event('b', 2), Event('status.x', 3)), (3, 2))
+        self.assertTrue(dispatcher.shutdown(5))
+        self.assertEqual(sorted(event.data for event in calls), [1, 3])
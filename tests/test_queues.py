@@ -0,0 +1,145 @@
+import queue
+import threading
+from unittest import TestCase
+
+from hdmi2usbmon.backpressure import ROUTINE, URGENT, NORMAL, bounded_queue, event_priority, status_key
+from hdmi2usbmon.connection import CONNECTION_EVENT
+from hdmi2usbmon.device import Hdmi2UsbDevice
+from hdmi2usbmon.events import BoundedEventQueue, Event, EventDispatcher, EventTypeHandler
+from hdmi2usbmon.events.queues import BLOCK, COALESCE, DROP_NEWEST, DROP_OLDEST
+from hdmi2usbmon.parser import parse_line
+
+TELEMETRY = (b'dvisampler1: ph:   4    4    4 // charsync:111 [9 9 9] // WER:  0   0   0 // chansync:1 // '
+             b'res:1280x720 // pixclk:%d Hz')
+
+
+def lane(event):
+    return event.data[0]
+
+
+class TestBoundedEventQueue(TestCase):
+
+    def fill(self, eventq, *items):
+        for item in items:
+            eventq.put(Event('x', item), False)
+
+    def drain(self, eventq):
+        items = list()
+        while not eventq.empty():
+            items.append(eventq.get(False).data)
+        return items
+
+    def test_drop_oldest(self):
+        eventq = BoundedEventQueue(3, DROP_OLDEST)
+        self.fill(eventq, 1, 2, 3, 4, 5)
+        self.assertEqual(self.drain(eventq), [3, 4, 5])
+        self.assertEqual(eventq.stats()['dropped'], 2)
+
+    def test_drop_newest(self):
+        eventq = BoundedEventQueue(3, DROP_NEWEST)
+        self.fill(eventq, 1, 2, 3)
+        self.assertRaises(queue.Full, self.fill, eventq, 4)
+        self.assertEqual(self.drain(eventq), [1, 2, 3])
+        self.assertEqual(eventq.stats()['rejected'], 1)
+
+    def test_block(self):
+        eventq = BoundedEventQueue(1, BLOCK)
+        self.fill(eventq, 1)
+        self.assertRaises(queue.Full, eventq.put, Event('x', 2), True, 0.01)
+        thread = threading.Thread(target=eventq.put, args=(Event('x', 2),))
+        thread.start()
+        self.assertEqual(eventq.get(True, 1).data, 1)
+        thread.join(1)
+        self.assertEqual(self.drain(eventq), [2])
+
+    def test_dropped_events_are_done(self):
+        for policy in (DROP_OLDEST, DROP_NEWEST):
+            eventq = BoundedEventQueue(2, policy, priority=lane, lanes=3)
+            self.fill(eventq, (2, 'a'), (2, 'b'), (0, 'c'), (0, 'd'))
+            while not eventq.empty():
+                eventq.get(False)
+                eventq.task_done()
+            self.assertEqual(eventq.unfinished_tasks, 0)
+            eventq.join()
+
+    def test_priority_lanes(self):
+        eventq = BoundedEventQueue(4, DROP_OLDEST, priority=lane, lanes=3)
+        self.fill(eventq, (2, 'a'), (1, 'b'), (2, 'c'), (0, 'd'))
+        # full: the oldest routine event makes room for the urgent one
+        self.fill(eventq, (0, 'e'))
+        self.assertEqual(self.drain(eventq), [(0, 'd'), (0, 'e'), (1, 'b'), (2, 'c')])
+
+    def test_drop_oldest_keeps_urgent(self):
+        eventq = BoundedEventQueue(2, DROP_OLDEST, priority=lane, lanes=3)
+        self.fill(eventq, (0, 'a'), (0, 'b'))
+        # a routine event doesn't push out urgent ones, it is dropped itself
+        self.assertRaises(queue.Full, self.fill, eventq, (2, 'c'))
+        self.fill(eventq, (0, 'd'))
+        self.assertEqual(self.drain(eventq), [(0, 'b'), (0, 'd')])
+        self.assertEqual((eventq.dropped, eventq.rejected), (1, 1))
+
+    def test_drop_newest_evicts_lower_priority(self):
+        eventq = BoundedEventQueue(2, DROP_NEWEST, priority=lane, lanes=3)
+        self.fill(eventq, (2, 'a'), (2, 'b'))
+        self.fill(eventq, (0, 'c'))
+        self.assertRaises(queue.Full, self.fill, eventq, (2, 'd'))
+        self.assertEqual(self.drain(eventq), [(0, 'c'), (2, 'a')])
+        self.assertEqual((eventq.dropped, eventq.rejected), (1, 1))
+
+    def test_coalesce(self):
+        eventq = BoundedEventQueue(3, COALESCE, key=lambda event: event.data[0] or None)
+        self.fill(eventq, ('a', 1), ('b', 1), ('a', 2), (None, 1), ('a', 3))
+        self.assertEqual(eventq.qsize(), 3)
+        # the latest 'a' took the place of the first
+        self.assertEqual(self.drain(eventq), [('a', 3), ('b', 1), (None, 1)])
+        self.assertEqual(eventq.stats()['coalesced'], 2)
+        self.fill(eventq, ('a', 4))
+        self.assertEqual(self.drain(eventq), [('a', 4)])
+
+    def test_invalid_policy(self):
+        self.assertRaises(ValueError, BoundedEventQueue, 10, 'drop-random')
+        self.assertRaises(ValueError, BoundedEventQueue, 10, COALESCE)
+
+
+class TestBackpressure(TestCase):
+
+    def test_event_priority(self):
+        device = Hdmi2UsbDevice('dev', 1)
+        self.assertEqual(event_priority(parse_line(TELEMETRY % 74250000, 'dev')), ROUTINE)
+        self.assertEqual(event_priority(device.line_event(TELEMETRY % 74250000)), ROUTINE)
+        self.assertEqual(event_priority(parse_line(b'dvisampler1: lost PLL lock', 'dev')), URGENT)
+        self.assertEqual(event_priority(device.line_event(b'HDMI2USB>dvisampler1: FIFO overflow')), URGENT)
+        self.assertEqual(event_priority(Event(CONNECTION_EVENT, {})), URGENT)
+        self.assertEqual(event_priority(parse_line(b'output0: off', 'dev')), NORMAL)
+
+    def test_lock_state_order(self):
+        """ a lock lost right after it was regained must not overtake the lock """
+        device = Hdmi2UsbDevice('dev', 1)
+        eventq = bounded_queue(10)()
+        for line in (b'dvisampler1: PLL locked', b'dvisampler1: lost PLL lock'):
+            eventq.put(parse_line(line, 'dev'))
+            eventq.put(device.line_event(line))
+        self.assertEqual([eventq.get(False).event_type[0] for _ in range(4)],
+                         ['pll_locked', 'line', 'pll_lock_lost', 'line'])
+
+    def test_status_key(self):
+        device = Hdmi2UsbDevice('dev', 1)
+        self.assertEqual(status_key(parse_line(TELEMETRY % 1, 'dev')), status_key(parse_line(TELEMETRY % 2, 'dev')))
+        self.assertEqual(status_key(device.line_event(b'HDMI2USB>' + TELEMETRY % 1)),
+                         status_key(device.line_event(TELEMETRY % 2)))
+        self.assertNotEqual(status_key(parse_line(b'output0: off', 'dev')),
+                            status_key(parse_line(b'output1: off', 'dev')))
+        self.assertIsNone(status_key(parse_line(b'dvisampler1: lost PLL lock', 'dev')))
+
+    def test_dispatcher(self):
+        dispatcher = EventDispatcher(qclass=bounded_queue(4, COALESCE), indexed=True)
+        dispatcher.enable_stats()
+        events = list()
+        dispatcher.add_handler(EventTypeHandler(events.append))
+        for pixclk in range(10):
+            dispatcher.send_event(parse_line(TELEMETRY % pixclk, 'dev'))
+        dispatcher.send_event(parse_line(b'dvisampler1: lost PLL lock', 'dev'))
+        dispatcher.dispatch_batch()
+        self.assertEqual([event.event_type[0] for event in events], ['pll_lock_lost', 'dvisampler'])
+        self.assertEqual(events[1].data.pixclk, 9)
+        self.assertEqual(dispatcher.snapshot()['queue']['coalesced'], 9)
@@ -0,0 +1,77 @@
+import os
+import socket
+import time
+from unittest import TestCase
+
+from hdmi2usbmon.events import EventDispatcher, EventTypeHandler
+from hdmi2usbmon.device import Hdmi2UsbDevice
+from hdmi2usbmon.monitor import FleetMonitor
+from hdmi2usbmon.simulator import Hdmi2UsbSimulator, SimulatorThread, load_capture
+
+TEST_LOG = os.path.join(os.path.dirname(__file__), '..', 'test-data', 'hdmi2usb.2017-01-15_17')
+
+
+class TestSimulator(TestCase):
+
+    def test_respond(self):
+        simulator = Hdmi2UsbSimulator([])
+        self.assertEqual(simulator.respond('video_matrix connect input1 output0'), ['Connecting input1 to output0'])
+        self.assertEqual(simulator.matrix['output0'], 'input1')
+        self.assertEqual(simulator.respond('x c input1 tv'), ["Unknown video sink: 'tv'"])
+        self.assertEqual(simulator.respond('debug input0 on'), ['HDMI Input 0 debug on'])
+        self.assertEqual(simulator.respond('output0 off'), ['Disabling output0'])
+        self.assertIsNone(simulator.matrix['output0'])
+        self.assertEqual(simulator.respond('status short on'), [])
+        self.assertTrue(simulator.status_short)
+
+    def test_commands(self):
+        thread = SimulatorThread(Hdmi2UsbSimulator([], linger=True)).start()
+        try:
+            device = thread.devices[0]
+            sock = socket.create_connection(device.remoteaddr(), timeout=5)
+            sock.sendall(b'debug input1 on\r\n')
+            data = b''
+            while not data.endswith(b'HDMI2USB>'):
+                data += sock.recv(1024)
+            self.assertEqual(data, b'debug input1 on\r\nHDMI Input 1 debug on\r\nHDMI2USB>')
+            sock.close()
+        finally:
+            thread.stop(5)
+
+    def test_replay_many(self):
+        capture = load_capture(TEST_LOG, 2017)
+        simulators = [Hdmi2UsbSimulator(capture[:500]) for _ in range(5)]
+        thread = SimulatorThread(*simulators).start()
+        try:
+            counts = dict()
+            dispatcher = EventDispatcher()
+            dispatcher.add_handler(EventTypeHandler(
+                lambda event: counts.__setitem__(event.data['device'], counts.get(event.data['device'], 0) + 1),
+                Hdmi2UsbDevice.LINE_EVENT))
+            monitor = FleetMonitor(dispatcher, commands=None)
+            for device in thread.devices:
+                device.connect()
+                monitor.add_device(device)
+            monitor.run(timeout=5)
+            expected = len([message for _, message in capture[:500] if message])
+            self.assertEqual(sorted(counts.values()), [expected] * 5)
+        finally:
+            thread.stop(5)
+
+    def test_speed(self):
+        capture = [(100.0, b'a'), (100.5, b'b'), (101.0, b'c')]
+        thread = SimulatorThread(Hdmi2UsbSimulator(capture, speed=10.0)).start()
+        try:
+            sock = socket.create_connection(thread.devices[0].remoteaddr(), timeout=5)
+            start = time.monotonic()
+            data = b''
+            while True:
+                chunk = sock.recv(1024)
+                if not chunk:
+                    break
+                data += chunk
+            self.assertEqual(data, b'a\r\nb\r\nc\r\n')
+            self.assertGreaterEqual(time.monotonic() - start, 0.09)
+            sock.close()
+        finally:
+            thread.stop(5)
@@ -0,0 +1,159 @@
+import time
+from unittest import TestCase
+
+from hdmi2usbmon.events import EventDispatcher, EventHandler, EventTypeHandler, Event, Histogram, STATS_EVENT
+from hdmi2usbmon.monitor import FleetMonitor
+from hdmi2usbmon.parser import DVISAMPLER_EVENT, UNKNOWN_LINE
+from hdmi2usbmon.stats import Instrumentation, ParseStats, StatsReporter
+from hdmi2usbmon.simulator import Hdmi2UsbSimulator, SimulatorThread
+
+DVISAMPLER_LINE = (b'dvisampler1: ph:   4    4    4 // charsync:111 [9 9 9] // WER:  0   0   0 // '
+                   b'chansync:1 // res:1280x720 // pixclk:74249958 Hz')
+
+
+class BatchCollector(EventHandler):
+
+    def __init__(self):
+        self.events = list()
+
+    def accept_event(self, event):
+        return True
+
+    def handle_event(self, event):
+        self.events.append(event)
+
+    def handle_events(self, events):
+        self.events.extend(events)
+
+
+class TestHistogram(TestCase):
+
+    def test_buckets(self):
+        histogram = Histogram((1, 2, 4))
+        for value in (0, 1, 2, 3, 4, 5, 100):
+            histogram.add(value)
+        self.assertEqual(histogram.counts, [2, 1, 2, 2])
+        self.assertEqual(histogram.count, 7)
+        self.assertEqual(histogram.sum, 115)
+        self.assertEqual(histogram.percentile(0.5), 4)
+        self.assertIsNone(histogram.percentile(1.0))
+
+
+class TestDispatcherStats(TestCase):
+
+    def setUp(self):
+        self.seen = list()
+
+    def slow(self, event):
+        time.sleep(0.01)
+
+    def test_disabled(self):
+        dispatcher = EventDispatcher()
+        dispatcher.add_handler(EventTypeHandler(self.seen.append, 'basic'))
+        dispatcher.dispatch_events(Event('basic'))
+        self.assertIsNone(dispatcher.stats)
+        self.assertIsNone(dispatcher.snapshot())
+        self.assertEqual(len(self.seen), 1)
+
+    def check(self, dispatcher):
+        snapshot = dispatcher.snapshot()
+        self.assertEqual(snapshot['events'], 3)
+        handlers = snapshot['handlers']
+        self.assertEqual([entry['handler'] for entry in handlers],
+                         ['list.append', 'TestDispatcherStats.slow', 'BatchCollector'])
+        self.assertEqual([entry['calls'] for entry in handlers], [3, 1, 3])
+        self.assertGreaterEqual(handlers[1]['seconds'], 0.01)
+        self.assertEqual(snapshot['wait_time']['count'], 3)
+        self.assertGreater(snapshot['queue_depth']['count'], 0)
+
+    def create_dispatcher(self, indexed):
+        dispatcher = EventDispatcher(indexed=indexed)
+        dispatcher.add_handler(EventTypeHandler(self.seen.append, 'basic', 'other'))
+        dispatcher.add_handler(EventTypeHandler(self.slow, 'other'))
+        dispatcher.add_handler(BatchCollector())
+        dispatcher.enable_stats()
+        return dispatcher
+
+    def test_dispatch_events(self):
+        for indexed in (False, True):
+            dispatcher = self.create_dispatcher(indexed)
+            dispatcher.dispatch_events(Event('basic'), Event('other'), Event('basic'))
+            self.check(dispatcher)
+
+    def test_dispatch_batch(self):
+        for indexed in (False, True):
+            dispatcher = self.create_dispatcher(indexed)
+            for event_type in ('basic', 'other', 'basic'):
+                dispatcher.send_event(Event(event_type))
+            dispatcher.dispatch_batch()
+            self.check(dispatcher)
+            self.assertEqual(dispatcher.snapshot()['queue_depth']['counts'][3], 1)
+
+    def test_wait_from_enqueue(self):
+        dispatcher = EventDispatcher()
+        dispatcher.enable_stats()
+        # read long ago (or on another clock): the wait only counts the time spent in the queue
+        dispatcher.send_event(Event('basic', timestamp=1000.0))
+        dispatcher.eventq.put(Event('basic'))  # not sent through send_event: no wait recorded
+        dispatcher.dispatch_batch()
+        snapshot = dispatcher.snapshot()
+        self.assertEqual(snapshot['events'], 2)
+        self.assertEqual(snapshot['wait_time']['count'], 1)
+        self.assertLess(snapshot['wait_time']['sum'], 1.0)
+
+
+class TestInstrumentation(TestCase):
+
+    def test_parse_stats(self):
+        parse_stats = ParseStats()
+        self.assertEqual(parse_stats.classify_line(DVISAMPLER_LINE)[0], DVISAMPLER_EVENT)
+        self.assertEqual(parse_stats.parse_line(b'garbage', 'dev').event_type, (UNKNOWN_LINE,))
+        snapshot = parse_stats.snapshot()
+        self.assertEqual(snapshot[DVISAMPLER_EVENT]['lines'], 1)
+        self.assertEqual(snapshot[UNKNOWN_LINE]['lines'], 1)
+
+    def test_monotonic_clock(self):
+        thread = SimulatorThread(Hdmi2UsbSimulator([(0.0, DVISAMPLER_LINE)] * 10)).start()
+        try:
+            dispatcher = EventDispatcher()
+            dispatcher.enable_stats()
+            monitor = FleetMonitor(dispatcher, commands=None, clock=time.monotonic)
+            monitor.add_device(thread.devices[0])
+            monitor.run(timeout=5)
+            wait_time = dispatcher.snapshot()['wait_time']
+            self.assertEqual(wait_time['count'], 10)
+            self.assertLess(wait_time['sum'], 5.0)
+        finally:
+            thread.stop(5)
+
+    def test_snapshot_and_report(self):
+        capture = [(0.0, DVISAMPLER_LINE)] * 10
+        thread = SimulatorThread(Hdmi2UsbSimulator(capture), Hdmi2UsbSimulator(capture)).start()
+        try:
+            dispatcher = EventDispatcher(indexed=True)
+            received = list()
+            dispatcher.add_handler(EventTypeHandler(received.append, STATS_EVENT))
+            parse_stats = ParseStats()
+            monitor = FleetMonitor(dispatcher, commands=None, parser=parse_stats)
+            for device in thread.devices:
+                monitor.add_device(device)
+            instrumentation = Instrumentation(dispatcher, [monitor], parse_stats)
+            monitor.run(timeout=5)
+            snapshot = instrumentation.snapshot()
+            self.assertEqual(snapshot['dispatcher']['events'], 20)
+            self.assertEqual(sorted(snapshot['devices']), sorted(device.name for device in thread.devices))
+            for counts in snapshot['devices'].values():
+                self.assertEqual(counts, dict(bytes=10 * (len(DVISAMPLER_LINE) + 2), lines=10))
+            self.assertEqual(list(snapshot['parser']), [DVISAMPLER_EVENT])
+            self.assertEqual(snapshot['parser'][DVISAMPLER_EVENT]['lines'], 20)
+
+            reporter = StatsReporter(instrumentation, 0.01)
+            reporter.start()
+            deadline = time.time() + 5
+            while not received and time.time() < deadline:
+                dispatcher.dispatch_batch(max_latency=0.05)
+            reporter.stop(5)
+            self.assertTrue(received)
+            self.assertEqual(received[0].data['devices'], snapshot['devices'])
+        finally:
+            thread.stop(5)
@@ -0,0 +1,101 @@
+import os
+import queue
+from unittest import TestCase
+
+from hdmi2usbmon.device import Hdmi2UsbDevice
+from hdmi2usbmon.events import EventDispatcher, EventTypeHandler
+from hdmi2usbmon.parser import classify_line, parse_log_line
+from hdmi2usbmon.status import Hdmi2UsbStatus, StatusHandler, STATE_EVENT
+
+TEST_LOG = os.path.join(os.path.dirname(__file__), '..', 'test-data', 'hdmi2usb.2017-01-15_17')
+
+
+def dvisampler(pixclk, ph=(4, 4, 4), wer=(0, 0, 0), res=b'1280x720'):
+    return (b'dvisampler1: ph:   %d    %d    %d // charsync:111 [9 9 9] // WER:  %d   %d   %d // '
+            b'chansync:1 // res:%s // pixclk:%d Hz' % (ph + wer + (res, pixclk)))
+
+
+class TestHdmi2UsbStatus(TestCase):
+
+    def setUp(self):
+        self.status = Hdmi2UsbStatus('dev:1')
+
+    def update(self, line):
+        return self.status.update(*classify_line(line, 'dev:1'))
+
+    def test_first_sample_reports_all_fields(self):
+        item, changes = self.update(dvisampler(74249958))
+        self.assertEqual(item, 'input1')
+        self.assertEqual(changes, {'width': 1280, 'height': 720, 'pixclk': 74249958, 'ph': (4, 4, 4),
+                                   'charsync': (1, 1, 1), 'wer': (0, 0, 0), 'chansync': 1})
+
+    def test_thresholds(self):
+        self.update(dvisampler(74249958))
+        self.assertIsNone(self.update(dvisampler(74250076)))
+        self.assertIsNone(self.update(dvisampler(74249958, ph=(5, 6, 3))))
+        # jitter does not accumulate: compared with the value last reported
+        self.assertIsNone(self.update(dvisampler(74255000)))
+        self.assertEqual(self.update(dvisampler(74262000)), ('input1', {'pixclk': 74262000}))
+        self.assertEqual(self.update(dvisampler(74262000, wer=(0, 3, 0))), ('input1', {'wer': (0, 3, 0)}))
+        self.assertEqual(self.status.devices[1].pixclk, 74262000)
+        self.assertEqual(self.status.devices[1].samples, 6)
+
+    def test_custom_thresholds(self):
+        self.status = Hdmi2UsbStatus('dev:1', thresholds={})
+        self.update(dvisampler(74249958))
+        self.assertEqual(self.update(dvisampler(74249959)), ('input1', {'pixclk': 74249959}))
+
+    def test_items(self):
+        self.assertEqual(self.update(b'dvisampler1: lost PLL lock'), ('input1', {'locked': False}))
+        self.assertIsNone(self.update(b'dvisampler1: lost PLL lock'))
+        self.assertEqual(self.status.devices[1].pll_lock_lost, 2)
+        self.assertEqual(self.update(b'output1: 1280x720@50Hz from input1'),
+                         ('output1', {'enabled': True, 'width': 1280, 'height': 720, 'refresh': 50,
+                                      'source': 'input1'}))
+        self.assertEqual(self.update(b'output1: off'),
+                         ('output1', {'enabled': False, 'width': None, 'height': None, 'refresh': None,
+                                      'source': None}))
+        self.assertEqual(self.update(b'ddr: read:  734Mbps  write:  736Mbps  all: 1470Mbps'),
+                         ('ddr', {'read': 734, 'write': 736, 'all': 1470}))
+        self.assertEqual(self.update(b'ddr: read:    0Mbps  write:  736Mbps  all:  736Mbps'),
+                         ('ddr', {'read': 0, 'all': 736}))
+        self.assertEqual(self.update(b'input0:  0x0 (@ 0 kHz)'),
+                         ('input0', {'width': 0, 'height': 0, 'freq_khz': 0}))
+        self.assertIsNone(self.update(b'something else'))
+
+
+class TestStatusHandler(TestCase):
+
+    def test_replay(self):
+        dispatcher = EventDispatcher(indexed=True)
+        states = list()
+        dispatcher.add_handler(StatusHandler(dispatcher))
+        dispatcher.add_handler(EventTypeHandler(states.append, STATE_EVENT))
+        device = Hdmi2UsbDevice('dev', 1)
+        lines = 0
+        with open(TEST_LOG, 'rb') as logfile:
+            for line in logfile:
+                parsed = parse_log_line(line, 2017)
+                if parsed is not None and parsed[1]:
+                    dispatcher.send_event(device.line_event(parsed[1], parsed[0]))
+                    lines += 1
+        while dispatcher.dispatch_batch().events:
+            pass
+        self.assertTrue(states)
+        self.assertLess(len(states), lines / 4)
+        for event in states:
+            self.assertEqual(event.data['device'], 'dev:1')
+            self.assertTrue(event.data['changes'])
+
+    def test_dropped(self):
+        dispatcher = EventDispatcher(qclass=lambda: queue.Queue(1))
+        handler = StatusHandler(dispatcher)
+        dispatcher.add_handler(handler)
+        device = Hdmi2UsbDevice('dev', 1)
+        dispatcher.send_event(device.line_event(b'ddr: read:  734Mbps  write:  736Mbps  all: 1470Mbps'))
+        dispatcher.dispatch_batch()
+        # the state event of the first line fills the queue
+        handler.handle_event(device.line_event(b'input0:  0x0 (@ 0 kHz)'))
+        self.assertEqual(handler.dropped, 1)
+        self.assertEqual(dispatcher.eventq.qsize(), 1)
+        self.assertEqual(handler.device_status('dev:1').port, 'dev:1')
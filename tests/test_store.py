@@ -0,0 +1,58 @@
+from unittest import TestCase
+
+from hdmi2usbmon.events import Event, EventDispatcher
+from hdmi2usbmon.parser import DVISAMPLER_EVENT, DviSamplerRecord
+from hdmi2usbmon.store import TelemetryStore
+
+
+def record(device, input, value):
+    return DviSamplerRecord(device, input, (value, value + 1, value + 2), (1, 1, 1), (9, 9, 9),
+                            (0, value, 0), 1, 1280, 720, 74250000 + value)
+
+
+class TestTelemetryStore(TestCase):
+
+    def create_store(self):
+        store = TelemetryStore(chunk_size=4)
+        dispatcher = EventDispatcher(indexed=True)
+        dispatcher.add_handler(store)
+        for index in range(10):
+            dispatcher.send_event(Event(DVISAMPLER_EVENT, record('opsis-%d' % (index % 2), index % 3, index),
+                                        timestamp=100.0 + index))
+        dispatcher.send_event(Event('line', {'line': b'output0: off'}))
+        dispatcher.dispatch_batch()
+        return store
+
+    def test_chunks(self):
+        store = self.create_store()
+        self.assertEqual(len(store), 10)
+        self.assertEqual(len(store.chunks), 3)
+        self.assertEqual(store.devices, ['opsis-0', 'opsis-1'])
+
+    def test_query(self):
+        store = self.create_store()
+        result = store.query(102.0, 107.0)
+        self.assertEqual(list(result['timestamp']), [102.0, 103.0, 104.0, 105.0, 106.0])
+        self.assertEqual(list(result['pixclk']), [74250002, 74250003, 74250004, 74250005, 74250006])
+        result = store.query(101.0, device='opsis-1', input=0, columns=['timestamp', 'ph1'])
+        self.assertEqual(list(result['timestamp']), [103.0, 109.0])
+        self.assertEqual(list(result['ph1']), [4, 10])
+        self.assertEqual(len(store.query(device='unknown')['timestamp']), 0)
+
+    def test_records(self):
+        store = self.create_store()
+        timestamp, result = list(store.records(105.0, 106.0))[0]
+        self.assertEqual(timestamp, 105.0)
+        self.assertEqual((result.device, result.input, result.ph, result.wer), ('opsis-1', 2, (5, 6, 7), (0, 5, 0)))
+
+    def test_out_of_order(self):
+        store = TelemetryStore(chunk_size=4)
+        for timestamp in (3.0, 1.0, 2.0):
+            store.append(timestamp, record('opsis', 0, 0))
+        self.assertEqual(list(store.query(1.5, 3.5)['timestamp']), [3.0, 2.0])
+
+    def test_out_of_order_chunk_range(self):
+        store = TelemetryStore(chunk_size=4)
+        for timestamp in (100.0, 50.0):
+            store.append(timestamp, record('opsis', 0, 0))
+        self.assertEqual(list(store.query(0.0, 60.0)['timestamp']), [50.0])
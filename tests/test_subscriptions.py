@@ -0,0 +1,87 @@
+from unittest import TestCase
+
+from hdmi2usbmon.events import Event, EventDispatcher, EventTypeHandler, SubscriptionTrie, split_event_type
+from hdmi2usbmon.events import events
+
+
+class TestSubscriptionTrie(TestCase):
+
+    PATTERNS = ('dvisampler', 'dvisampler.*', 'device:opsis-07/*', 'status.output*', 'device:*/wer')
+
+    def setUp(self):
+        self.trie = SubscriptionTrie()
+        for pattern in self.PATTERNS:
+            self.trie.add(pattern, pattern)
+
+    def match(self, *names):
+        return sorted(self.trie.match(names))
+
+    def test_split(self):
+        self.assertEqual(split_event_type('device:opsis-07/input1.wer'), ('device', 'opsis-07', 'input1', 'wer'))
+        self.assertIs(split_event_type('a.b'), split_event_type('a.b'))
+
+    def test_invalid_wildcard(self):
+        for pattern in ('a*b', '*b', 'dvisampler.a*b', 'a**'):
+            self.assertRaises(ValueError, self.trie.add, pattern, 0)
+            self.assertRaises(ValueError, EventTypeHandler, print, 'basic', pattern)
+
+    def test_match(self):
+        self.assertEqual(self.match('dvisampler'), ['dvisampler'])
+        self.assertEqual(self.match('dvisampler.fifo_overflow'), ['dvisampler.*'])
+        self.assertEqual(self.match('dvisampler.input1.wer'), ['dvisampler.*'])
+        self.assertEqual(self.match('device:opsis-07/input1/wer'), ['device:opsis-07/*'])
+        self.assertEqual(self.match('device:opsis-08/wer'), ['device:*/wer'])
+        self.assertEqual(self.match('device:opsis-07/wer'), ['device:*/wer', 'device:opsis-07/*'])
+        self.assertEqual(self.match('status.output0'), ['status.output*'])
+        self.assertEqual(self.match('status.output0.enabled', 'status.input1'), [])
+        self.assertEqual(self.match('output0', 'dvisampler.x'), ['dvisampler.*'])
+
+    def test_match_all(self):
+        self.trie.add('*', 'all')
+        self.assertEqual(self.match('output0'), ['all'])
+        self.assertEqual(self.match('status.output0'), ['all', 'status.output*'])
+
+
+class TestPatternDispatch(TestCase):
+
+    def create_dispatcher(self, calls, indexed=True):
+        dispatcher = EventDispatcher(indexed=indexed)
+        dispatcher.add_handler(EventTypeHandler(lambda e: calls.append(('dvisampler', e.data)), 'dvisampler.*'))
+        dispatcher.add_handler(EventTypeHandler(lambda e: calls.append(('output', e.data)), 'status.output*', 'x'))
+        dispatcher.add_handler(EventTypeHandler(lambda e: calls.append(('opsis', e.data)), 'device:opsis-07/*'))
+        return dispatcher
+
+    def dispatch(self, dispatcher):
+        return dispatcher.dispatch_events(
+            Event('dvisampler.fifo_overflow,device:opsis-07/fifo_overflow', 1), Event('status.output1', 2),
+            Event('x', 3), Event('status.input1', 4), Event('dvisampler', 5))
+
+    def test_matches_linear_dispatch(self):
+        linear, indexed = list(), list()
+        self.assertEqual(self.dispatch(self.create_dispatcher(linear, False)),
+                         self.dispatch(self.create_dispatcher(indexed, True)))
+        self.assertEqual(linear, indexed)
+        self.assertEqual(indexed, [('dvisampler', 1), ('opsis', 1), ('output', 2), ('output', 3)])
+
+    def test_routes_invalidated(self):
+        calls = list()
+        dispatcher = self.create_dispatcher(calls)
+        self.dispatch(dispatcher)
+        handler = EventTypeHandler(lambda e: calls.append(('input', e.data)), 'status.input*')
+        dispatcher.add_handler(handler, True)
+        del calls[:]
+        dispatcher.dispatch_events(Event('status.input1', 6))
+        self.assertEqual(calls, [('input', 6)])
+        dispatcher.remove_handler(handler)
+        del calls[:]
+        dispatcher.dispatch_events(Event('status.input1', 6))
+        self.assertEqual(calls, [])
+
+    def test_route_cache_bounded(self):
+        calls = list()
+        dispatcher = self.create_dispatcher(calls)
+        for index in range(events.ROUTE_CACHE_SIZE + 10):
+            dispatcher.dispatch_events(Event('status.output%d' % index, index))
+        self.assertEqual(len(calls), events.ROUTE_CACHE_SIZE + 10)
+        self.assertEqual(len(dispatcher._routes), events.ROUTE_CACHE_SIZE)
+        self.assertNotIn(('status.output0',), dispatcher._routes)